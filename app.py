@@ -5,12 +5,11 @@ Compatibility shim that:
 """
 
 import os
-from flask_backend import app, db, User, Task  # noqa: F401
+from flask_backend import app, db, User, Task, migrate_database  # noqa: F401
 
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
+    migrate_database()
     port = int(os.getenv("PORT", 5000))
     host = os.getenv("HOST", "0.0.0.0")
     app.run(debug=True, host=host, port=port)
@@ -0,0 +1,513 @@
+"""
+ASGI entry point.
+
+The task endpoints (list, changes, stream, search, stats, create/update/move/
+delete and batch) run as async handlers on SQLAlchemy's asyncio engine
+(aiosqlite for SQLite, asyncpg for PostgreSQL), so a request waiting on the
+database, or an open event stream waiting for changes, does not hold a thread. They reuse the
+models, queries and serializer of flask_backend.py and return the same JSON.
+Every other route (auth, export/import, health, metrics) is served by the Flask
+app in a thread pool.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+(after `flask --app app db-upgrade`; startup fails if the schema is outdated)
+"""
+
+import asyncio
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from flask_backend import (
+    SSE_KEEPALIVE, AuthError, ChangesExpired, SchemaOutdated, app as flask_app, apply_task_batch,
+    change_bus, check_schema_version, collection_etag, compress_body, configure_sqlite_engine,
+    create_one_task, current_task_revision, decode_token, delete_one_task, list_task_changes,
+    list_tasks_page, load_principal, metrics, move_one_task, negotiate_encoding, parse_last_event_id,
+    read_change_events, response_cache, revocations, search_tasks_page, serializer, sse_event,
+    sse_retry, start_background_jobs, stream_deadline, task_stats, update_one_task,
+)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+def create_engine_for(uri):
+    # Mismo DATABASE_URL que la app Flask, con el driver asyncio equivalente
+    url = make_url(uri)
+    backend = url.drivername.split('+')[0]
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No asyncio driver configured for {backend}')
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    config = flask_app.config
+    options = {}
+    if backend == 'sqlite':
+        if url.database and url.database != ':memory:':
+            options['pool_size'] = config['DB_POOL_SIZE']
+            options['max_overflow'] = config['DB_MAX_OVERFLOW']
+            options['pool_timeout'] = config['DB_POOL_TIMEOUT']
+    else:
+        options.update(pool_size=config['DB_POOL_SIZE'], max_overflow=config['DB_MAX_OVERFLOW'],
+                       pool_timeout=config['DB_POOL_TIMEOUT'], pool_recycle=config['DB_POOL_RECYCLE'],
+                       pool_pre_ping=config['DB_POOL_PRE_PING'])
+        if config['DB_STATEMENT_TIMEOUT'] > 0:
+            options['connect_args'] = {
+                'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+    async_engine = create_async_engine(url, **options)
+    if backend == 'sqlite':
+        configure_sqlite_engine(async_engine.sync_engine)
+    return async_engine
+
+async_engine = create_engine_for(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+read_session = async_sessionmaker(async_engine, expire_on_commit=False)
+# En SQLite las escrituras abren la transacción con BEGIN IMMEDIATE (ver sqlite_begin)
+write_session = async_sessionmaker(async_engine.execution_options(sqlite_immediate=True),
+                                   expire_on_commit=False)
+wsgi_executor = ThreadPoolExecutor(max_workers=flask_app.config['ASGI_WSGI_THREADS'],
+                                   thread_name_prefix='wsgi')
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {}
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            self.headers[name] = f'{self.headers[name]},{value}' if name in self.headers else value
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.body = body
+        self.claims = {}
+
+    def json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise ValueError('Request body must be valid JSON') from None
+
+class Response:
+    def __init__(self, status, body=b'', etag=None, content_type='application/json'):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.headers = [(b'content-type', content_type.encode())] if body else []
+
+    def compress(self, accept_encoding):
+        # Misma negociación que compress_response en las rutas de Flask
+        if not self.body or self.status in (204, 304):
+            return
+        self.headers.append((b'vary', b'Accept-Encoding'))
+        encoding = negotiate_encoding(parse_accept_header(accept_encoding))
+        if encoding is None or len(self.body) < flask_app.config['COMPRESSION_MIN_SIZE']:
+            return
+        self.body = compress_body(self.body, encoding)
+        self.headers.append((b'content-encoding', encoding.encode()))
+
+    def header_list(self):
+        headers = list(self.headers)
+        if self.etag is not None:
+            # Comprimido deja de ser idéntico byte a byte: ETag débil
+            weak = any(name == b'content-encoding' for name, _ in headers)
+            headers.append((b'etag', quote_etag(self.etag, weak).encode()))
+        headers.append((b'content-length', str(len(self.body)).encode()))
+        return headers
+
+class EventStream(Response):
+    # Respuesta SSE: los trozos salen de un generador async hasta que termina o el
+    # cliente se desconecta; sin compresión ni Content-Length
+    def __init__(self, events):
+        super().__init__(200, content_type='text/event-stream')
+        self.events = events
+        self.headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')]
+
+    def compress(self, accept_encoding):
+        pass
+
+    def header_list(self):
+        return list(self.headers)
+
+    async def stream(self, receive, send):
+        async def pump():
+            async for chunk in self.events:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        pumping = asyncio.ensure_future(pump())
+        watching = asyncio.ensure_future(disconnected())
+        try:
+            done, _ = await asyncio.wait({pumping, watching}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (pumping, watching):
+                task.cancel()
+            await asyncio.gather(pumping, watching, return_exceptions=True)
+            await self.events.aclose()
+        if pumping in done:
+            if not pumping.cancelled() and pumping.exception() is not None:
+                flask_app.logger.error('Event stream failed', exc_info=pumping.exception())
+            await send({'type': 'http.response.body', 'body': b''})
+
+def json_reply(payload, status=200, etag=None):
+    return Response(status, serializer.dumps(payload), etag=etag)
+
+def message_reply(text, status):
+    return json_reply({'message': text}, status)
+
+async def authenticate(request):
+    # La primera petición del proceso carga el filtro de revocaciones con el motor
+    # síncrono; se hace en un hilo para no bloquear el event loop
+    if revocations.needs_sync():
+        try:
+            await asyncio.to_thread(revocations.sync)
+        except Exception:
+            flask_app.logger.exception('Token revocation sync failed')
+    token, data, principal = decode_token(request.headers.get('authorization'))
+    request.claims = data
+    if principal is None:
+        async with read_session() as session:
+            principal = await session.run_sync(load_principal, token, data)
+    return principal
+
+# Handlers async de tareas: la lógica síncrona compartida se ejecuta con
+# run_sync, que la adapta al driver asyncio sin bloquear el event loop.
+def _collection_view(session, request, user_id, fetch):
+    revision = current_task_revision(session, user_id)
+    etag = collection_etag(user_id, revision, request.args)
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        return Response(304, etag=etag)
+    return json_reply(fetch(session, user_id, request.args, revision), etag=etag)
+
+async def get_tasks(request, user):
+    # Como _collection_view, pero pasando por la caché compartida de respuestas; el
+    # almacén es síncrono (SQLite/Redis) y se consulta fuera del event loop
+    async with read_session() as session:
+        revision = await session.run_sync(current_task_revision, user.id)
+        etag = collection_etag(user.id, revision, request.args)
+        if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+            return Response(304, etag=etag)
+        body = await asyncio.to_thread(response_cache.get, etag) if response_cache.enabled else None
+        if body is None:
+            body = serializer.dumps(await session.run_sync(list_tasks_page, user.id, request.args, revision))
+            if response_cache.enabled:
+                await asyncio.to_thread(response_cache.put, user.id, etag, body)
+    return Response(200, body, etag=etag)
+
+async def task_event_stream(user_id, since, jti, deadline):
+    # Versión async de stream_task_events: espera avisos sin ocupar un hilo
+    loop = asyncio.get_running_loop()
+    notified = asyncio.Event()
+    subscription = change_bus.subscribe(user_id, wakeup=lambda: loop.call_soon_threadsafe(notified.set))
+    try:
+        yield sse_retry()
+        while True:
+            notified.clear()
+            try:
+                async with read_session() as session:
+                    events, since, more = await session.run_sync(read_change_events, user_id, since, jti)
+            except ChangesExpired as e:
+                yield sse_event('expired', {'message': str(e)})
+                return
+            except AuthError:
+                return
+            for event in events:
+                yield event
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not more:
+                try:
+                    await asyncio.wait_for(notified.wait(), min(flask_app.config['STREAM_HEARTBEAT'], remaining))
+                except asyncio.TimeoutError:
+                    yield SSE_KEEPALIVE
+    finally:
+        change_bus.unsubscribe(subscription)
+
+async def stream_tasks(request, user):
+    since = parse_last_event_id(request.headers.get('last-event-id', request.args.get('since')))
+    if change_bus.connections() >= flask_app.config['ASGI_STREAM_MAX_CONNECTIONS']:
+        return message_reply('Too many open streams, retry later', 503)
+    return EventStream(task_event_stream(user.id, since, request.claims.get('jti'),
+                                         stream_deadline(request.claims)))
+
+async def get_task_changes(request, user):
+    async with read_session() as session:
+        return await session.run_sync(_collection_view, request, user.id, list_task_changes)
+
+async def search_tasks(request, user):
+    async with read_session() as session:
+        return await session.run_sync(_collection_view, request, user.id, search_tasks_page)
+
+async def get_task_stats(request, user):
+    async with read_session() as session:
+        return json_reply(await session.run_sync(task_stats, user.id, request.args))
+
+async def create_task(request, user):
+    data = request.json()
+    if not isinstance(data, dict) or not data.get('title'):
+        return message_reply('Title is required', 400)
+    async with write_session() as session:
+        task = await session.run_sync(create_one_task, user.id, data)
+        await session.commit()
+    return json_reply({'message': 'Task created successfully', 'task': task}, 201)
+
+async def update_task(request, user, task_id):
+    data = request.json()
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    async with write_session() as session:
+        task = await session.run_sync(update_one_task, user.id, task_id, data)
+        if not task:
+            await session.rollback()
+            return message_reply('Task not found', 404)
+        await session.commit()
+    return json_reply({'message': 'Task updated successfully', 'task': task})
+
+async def move_task(request, user, task_id):
+    async with write_session() as session:
+        task = await session.run_sync(move_one_task, user.id, task_id, request.json())
+        if not task:
+            await session.rollback()
+            return message_reply('Task not found', 404)
+        await session.commit()
+    return json_reply({'message': 'Task moved successfully', 'task': task})
+
+async def delete_task(request, user, task_id):
+    async with write_session() as session:
+        if not await session.run_sync(delete_one_task, user.id, task_id):
+            await session.rollback()
+            return message_reply('Task not found', 404)
+        await session.commit()
+    return message_reply('Task deleted successfully', 200)
+
+async def batch_tasks(request, user):
+    data = request.json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    async with write_session() as session:
+        results = await session.run_sync(apply_task_batch, user.id, operations)
+        await session.commit()
+    return json_reply({'results': results})
+
+# (método, patrón, ruta para métricas, handler, prefijo del mensaje de error 500)
+ASYNC_ROUTES = [
+    ('GET', re.compile(r'/api/tasks'), '/api/tasks', get_tasks, 'Error fetching tasks'),
+    ('GET', re.compile(r'/api/tasks/changes'), '/api/tasks/changes', get_task_changes,
+     'Error fetching task changes'),
+    ('GET', re.compile(r'/api/tasks/stream'), '/api/tasks/stream', stream_tasks, 'Error opening task stream'),
+    ('GET', re.compile(r'/api/tasks/search'), '/api/tasks/search', search_tasks, 'Error searching tasks'),
+    ('GET', re.compile(r'/api/tasks/stats'), '/api/tasks/stats', get_task_stats, 'Error fetching task stats'),
+    ('POST', re.compile(r'/api/tasks'), '/api/tasks', create_task, 'Error creating task'),
+    ('PUT', re.compile(r'/api/tasks/(?P<task_id>\d+)'), '/api/tasks/<int:task_id>', update_task,
+     'Error updating task'),
+    ('POST', re.compile(r'/api/tasks/(?P<task_id>\d+)/move'), '/api/tasks/<int:task_id>/move', move_task,
+     'Error moving task'),
+    ('DELETE', re.compile(r'/api/tasks/(?P<task_id>\d+)'), '/api/tasks/<int:task_id>', delete_task,
+     'Error deleting task'),
+    ('POST', re.compile(r'/api/tasks/batch'), '/api/tasks/batch', batch_tasks, 'Error processing batch'),
+]
+
+def match_route(method, path):
+    for route_method, pattern, route, handler, error_prefix in ASYNC_ROUTES:
+        if route_method == method:
+            found = pattern.fullmatch(path)
+            if found:
+                kwargs = {name: int(value) for name, value in found.groupdict().items()}
+                return route, handler, error_prefix, kwargs
+    return None
+
+async def read_body(receive, spool=None):
+    # Sin spool devuelve bytes; con spool (archivo) escribe en él el cuerpo completo
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        if spool is not None:
+            spool.write(chunk)
+        else:
+            chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+async def handle_async(scope, receive, send, matched):
+    route, handler, error_prefix, kwargs = matched
+    start = time.perf_counter()
+    metrics.inc('taskflow_http_requests_in_flight')
+    status = 500
+    try:
+        request = Request(scope, await read_body(receive))
+        try:
+            user = await authenticate(request)
+            response = await handler(request, user, **kwargs)
+        except AuthError as e:
+            response = message_reply(str(e), 401)
+        except ValueError as e:
+            response = message_reply(str(e), 400)
+        except ChangesExpired as e:
+            response = message_reply(str(e), 410)
+        except Exception as e:
+            response = message_reply(f'{error_prefix}: {str(e)}', 500)
+        status = response.status
+        response.compress(request.headers.get('accept-encoding'))
+
+        headers = response.header_list()
+        # Mismas cabeceras CORS que añade Flask-CORS a las rutas de Flask
+        origin = request.headers.get('origin')
+        if origin:
+            headers += [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+        else:
+            headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if isinstance(response, EventStream):
+            await response.stream(receive, send)
+        else:
+            await send({'type': 'http.response.body', 'body': response.body})
+    finally:
+        metrics.inc('taskflow_http_requests_in_flight', -1)
+        metrics.inc('taskflow_http_requests_total', method=scope['method'], route=route, status=str(status))
+        metrics.observe('taskflow_http_request_duration_seconds', time.perf_counter() - start,
+                        method=scope['method'], route=route)
+        metrics.maybe_flush()
+
+# Puente WSGI: el resto de rutas las sirve Flask en un hilo del pool. El cuerpo
+# se guarda en un SpooledTemporaryFile y la respuesta se reenvía por trozos
+# (export en streaming) con una cola acotada como control de flujo.
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+def run_wsgi(environ, put):
+    status_headers = []
+
+    def start_response(status, headers, exc_info=None):
+        status_headers[:] = [int(status.split(' ', 1)[0]), headers]
+
+    try:
+        iterable = flask_app(environ, start_response)
+        try:
+            put(('start', *status_headers))
+            for chunk in iterable:
+                if chunk and not put(('body', chunk)):
+                    break
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    except Exception:
+        flask_app.logger.exception('Unhandled error in WSGI bridge')
+        put(('error',))
+    finally:
+        put(None)
+
+async def handle_wsgi(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=8)
+    closed = threading.Event()
+
+    def put(item):
+        # False si el cliente ya no está: el hilo deja de generar la respuesta
+        if closed.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        return True
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as body:
+        await read_body(receive, spool=body)
+        body.seek(0)
+        future = loop.run_in_executor(wsgi_executor, run_wsgi, build_environ(scope, body), put)
+        try:
+            started = False
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if item[0] == 'start':
+                    status, headers = item[1:]
+                    await send({'type': 'http.response.start', 'status': status,
+                                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                            for k, v in headers]})
+                    started = True
+                elif item[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': item[1], 'more_body': True})
+                elif not started:
+                    await send({'type': 'http.response.start', 'status': 500,
+                                'headers': [(b'content-type', b'application/json')]})
+                    await send({'type': 'http.response.body', 'more_body': True,
+                                'body': serializer.dumps({'message': 'Internal server error'})})
+                    started = True
+            await future
+        finally:
+            closed.set()
+            while not queue.empty():
+                queue.get_nowait()
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            # Solo se comprueba la versión del esquema; las migraciones van aparte
+            try:
+                check_schema_version()
+            except SchemaOutdated as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            start_background_jobs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await async_engine.dispose()
+            if metrics.directory:
+                metrics.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    matched = match_route(scope['method'], scope['path'])
+    if matched is not None:
+        await handle_async(scope, receive, send, matched)
+    else:
+        await handle_wsgi(scope, receive, send)
@@ -0,0 +1,482 @@
+"""
+Load-testing and benchmark harness.
+
+    python benchmark.py seed --users 100 --tasks 1000
+    python benchmark.py run --target inprocess --concurrency 8 --duration 30 --output before.json
+    python benchmark.py run --target gunicorn --workers 4 --concurrency 64
+    python benchmark.py run --target uvicorn --workers 4 --concurrency 256 --mix list=8,search=1,stats=1
+    python benchmark.py run --target url --url http://localhost:5000 --replay traffic.jsonl
+    python benchmark.py compare before.json after.json
+
+`seed` creates N users (bench0..benchN-1, password "benchmark-password") with M
+tasks each. `run` drives a request mix from `--concurrency` threads, each with a
+keep-alive connection and one seeded user, and prints a JSON report with
+p50/p95/p99 latency and requests per second, overall and per operation.
+
+The database is BENCHMARK_DATABASE_URL (default instance/benchmark.db), never
+DATABASE_URL, so an exported development or production URL is not touched.
+`seed` drops and recreates it; it refuses any other database unless --force is
+given. gunicorn/uvicorn targets are started locally on that database with the
+login rate limiter disabled.
+
+Mixes are weighted operations: login, list, changes, search, stats, create,
+update, delete. Replay files are JSONL with one {"method", "path", "body"?}
+object per line; "{task_id}" in a path is replaced by one of the user's tasks.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(BASE_DIR, 'instance', 'benchmark.db')
+DATABASE_URL = os.getenv('BENCHMARK_DATABASE_URL', DEFAULT_DATABASE_URL)
+PASSWORD = 'benchmark-password'
+DEFAULT_MIX = 'login=1,list=10,create=3,update=3,delete=1'
+PRIORITIES = ('low', 'medium', 'high')
+
+
+def load_app():
+    """Importa la app con la BD del benchmark (hay que fijarla antes de importar)."""
+    os.environ['DATABASE_URL'] = DATABASE_URL
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    import flask_backend
+    return flask_backend
+
+
+# Generador de datos
+def seed(users, tasks_per_user, chunk_size=10000, force=False):
+    backend = load_app()
+    from sqlalchemy import insert, select
+    app, db = backend.app, backend.db
+    # Si la app ya estaba importada puede apuntar a otra BD: no se borra sin --force
+    target = app.config['SQLALCHEMY_DATABASE_URI']
+    if target != DATABASE_URL and not force:
+        raise SystemExit(f'Refusing to drop {target}: it is not BENCHMARK_DATABASE_URL ({DATABASE_URL}); '
+                         'pass --force to seed it anyway')
+    with app.app_context():
+        db.drop_all()
+        backend.migrate_database()
+        password_hash = backend.password_hasher.hash(PASSWORD)
+        now = datetime.utcnow()
+        db.session.execute(insert(backend.User), [{
+            'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': password_hash,
+            'created_at': now, 'task_revision': 1,
+        } for i in range(users)])
+        user_ids = db.session.scalars(select(backend.User.id).order_by(backend.User.id)).all()
+
+        rows = []
+        positions = backend.position_keys_after(None, tasks_per_user)
+        for user_id in user_ids:
+            for j, position in enumerate(positions):
+                created = now - timedelta(minutes=tasks_per_user - j)
+                completed = j % 3 == 0
+                rows.append({
+                    'title': f'Task {j} for user {user_id}',
+                    'description': f'Benchmark task {j} {PRIORITIES[j % 3]} priority',
+                    'completed': completed, 'priority': PRIORITIES[j % 3], 'position': position,
+                    'created_at': created, 'updated_at': created, 'completed_at': created if completed else None,
+                    'user_id': user_id, 'revision': 1,
+                })
+                if len(rows) >= chunk_size:
+                    db.session.execute(insert(backend.Task), rows)
+                    rows = []
+        if rows:
+            db.session.execute(insert(backend.Task), rows)
+        backend.rebuild_task_stats(db.session)
+        db.session.commit()
+    return {'users': users, 'tasks_per_user': tasks_per_user}
+
+
+# Destinos: cliente de pruebas en proceso o HTTP con conexiones keep-alive
+class InProcessTarget:
+    name = 'inprocess'
+
+    def __init__(self):
+        self.app = load_app().app
+
+    def connect(self):
+        return TestClientConnection(self.app.test_client())
+
+    def close(self):
+        pass
+
+
+class TestClientConnection:
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HttpTarget:
+    name = 'url'
+
+    def __init__(self, url, process=None):
+        parts = urlsplit(url)
+        self.url = url
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.process = process
+
+    def connect(self):
+        return HttpConnection(self.host, self.port)
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+
+class HttpConnection:
+    def __init__(self, host, port):
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, body=None, headers=None):
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()  # Se reconecta en la siguiente petición
+            raise
+
+
+def start_server(kind, workers, port, extra_args):
+    """Arranca gunicorn o uvicorn sobre la BD del benchmark y espera a /api/health."""
+    env = dict(os.environ, RATELIMIT_ENABLED='false', DATABASE_URL=DATABASE_URL)
+    if kind == 'gunicorn':
+        # Mismo perfil que producción (gunicorn.conf.py), sin access log
+        env.setdefault('GUNICORN_ACCESS_LOG', '')
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers),
+                   '-b', f'127.0.0.1:{port}', *extra_args, 'app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', *extra_args]
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL)
+    target = HttpTarget(f'http://127.0.0.1:{port}', process)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} exited with status {process.returncode}')
+        try:
+            if target.connect().request('GET', '/api/health')[0] == 200:
+                target.name = kind
+                return target
+        except OSError:
+            time.sleep(0.2)
+    target.close()
+    raise RuntimeError(f'{kind} did not become healthy in 30 s')
+
+
+# Operaciones de la mezcla
+class UserSession:
+    """Conexión de un hilo con el token y los ids de tareas de su usuario."""
+
+    def __init__(self, connection, username):
+        self.connection = connection
+        self.username = username
+        self.token = None
+        self.task_ids = []
+
+    def call(self, method, path, data=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        body = json.dumps(data).encode() if data is not None else None
+        return self.connection.request(method, path, body, headers)
+
+    def login(self):
+        status, body = self.call('POST', '/api/login', {'username': self.username, 'password': PASSWORD})
+        if status == 200:
+            self.token = json.loads(body)['token']
+        return status
+
+    def load_task_ids(self):
+        status, body = self.call('GET', '/api/tasks?fields=id&limit=1000')
+        if status == 200:
+            self.task_ids = [task['id'] for task in json.loads(body)['tasks']]
+
+
+def op_login(session, rng):
+    return session.login()
+
+def op_list(session, rng):
+    return session.call('GET', '/api/tasks?limit=50')[0]
+
+def op_changes(session, rng):
+    return session.call('GET', '/api/tasks/changes?since=0&limit=50')[0]
+
+def op_search(session, rng):
+    return session.call('GET', f'/api/tasks/search?q=task+{rng.choice(PRIORITIES)}&limit=20')[0]
+
+def op_stats(session, rng):
+    return session.call('GET', '/api/tasks/stats')[0]
+
+def op_create(session, rng):
+    status, body = session.call('POST', '/api/tasks', {
+        'title': f'Benchmark {rng.random():.6f}', 'priority': rng.choice(PRIORITIES)})
+    if status == 201:
+        session.task_ids.append(json.loads(body)['task']['id'])
+    return status
+
+def op_update(session, rng):
+    if not session.task_ids:
+        return op_create(session, rng)
+    task_id = rng.choice(session.task_ids)
+    return session.call('PUT', f'/api/tasks/{task_id}', {'completed': rng.random() < 0.5})[0]
+
+def op_delete(session, rng):
+    if not session.task_ids:
+        return op_create(session, rng)
+    task_id = session.task_ids.pop(rng.randrange(len(session.task_ids)))
+    return session.call('DELETE', f'/api/tasks/{task_id}')[0]
+
+OPERATIONS = {
+    'login': op_login, 'list': op_list, 'changes': op_changes, 'search': op_search,
+    'stats': op_stats, 'create': op_create, 'update': op_update, 'delete': op_delete,
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation {name!r}; expected one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def load_replay(path):
+    """Lee peticiones grabadas: {"method", "path", "body"?} por línea."""
+    entries = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if not isinstance(entry, dict) or 'method' not in entry or 'path' not in entry:
+                raise ValueError(f'{path}:{line_number}: expected an object with method and path')
+            entries.append(entry)
+    if not entries:
+        raise ValueError(f'{path} has no requests')
+    return entries
+
+
+def replay_operation(entry):
+    label = f"{entry['method'].upper()} {entry['path'].split('?')[0]}"
+
+    def run(session, rng):
+        path = entry['path']
+        if '{task_id}' in path:
+            if not session.task_ids:
+                op_create(session, rng)
+            path = path.replace('{task_id}', str(rng.choice(session.task_ids or [0])))
+        return session.call(entry['method'].upper(), path, entry.get('body'))[0]
+    return label, run
+
+
+# Driver
+def run_worker(target, username, plan, seed_value, stop_at, budget, warmup_until, samples):
+    rng = random.Random(seed_value)
+    session = UserSession(target.connect(), username)
+    session.login()
+    session.load_task_ids()
+    for label, operation in plan(rng):
+        if time.monotonic() >= stop_at or not budget():
+            return
+        start = time.perf_counter()
+        try:
+            status = operation(session, rng)
+        except Exception:
+            status = 0  # Error de conexión
+        elapsed = time.perf_counter() - start
+        if time.monotonic() >= warmup_until:
+            samples.append((label, status, elapsed))
+
+
+def percentile(sorted_values, fraction):
+    # Percentil por rango más cercano
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s[2] * 1000 for s in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _ in samples if status == 0 or status >= 500),
+        'client_errors': sum(1 for _, status, _ in samples if 400 <= status < 500),
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 0.95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 3) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'status': statuses,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(target, users, concurrency, duration=10.0, requests=None, warmup=1.0, mix=DEFAULT_MIX,
+        replay=None, seed_value=0):
+    if replay:
+        entries = [replay_operation(entry) for entry in load_replay(replay)]
+
+        def plan(rng):
+            # Cada hilo recorre la grabación en orden desde un punto distinto
+            offset = rng.randrange(len(entries))
+            while True:
+                for i in range(len(entries)):
+                    yield entries[(offset + i) % len(entries)]
+    else:
+        weights = parse_mix(mix)
+        names, values = list(weights), list(weights.values())
+
+        def plan(rng):
+            while True:
+                name = rng.choices(names, values)[0]
+                yield name, OPERATIONS[name]
+
+    lock = threading.Lock()
+    issued = [0]
+
+    def budget():
+        if requests is None:
+            return True
+        with lock:
+            issued[0] += 1
+            return issued[0] <= requests
+
+    samples = []
+    start = time.monotonic()
+    warmup_until = start + (warmup if requests is None else 0)
+    stop_at = start + (duration + warmup if requests is None else float('inf'))
+    threads = [threading.Thread(target=run_worker, args=(
+        target, f'bench{i % users}', plan, seed_value + i, stop_at, budget, warmup_until, samples))
+        for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - max(warmup_until, start)
+
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample[0], []).append(sample)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'target': target.name,
+            'database': DATABASE_URL.split('://')[0],
+            'users': users,
+            'concurrency': concurrency,
+            'duration_s': round(elapsed, 3),
+            'mix': None if replay else mix,
+            'replay': os.path.basename(replay) if replay else None,
+        },
+        'overall': summarize(samples, elapsed),
+        'operations': {name: summarize(items, elapsed) for name, items in sorted(by_operation.items())},
+    }
+
+
+def compare(before, after):
+    """Tabla de diferencias entre dos informes (rps y percentiles)."""
+    lines = [f"{'operation':<24}{'metric':<8}{'before':>12}{'after':>12}{'change':>10}"]
+    sections = [('overall', before['overall'], after['overall'])] + [
+        (name, before['operations'][name], after['operations'][name])
+        for name in sorted(set(before['operations']) & set(after['operations']))]
+    for name, old, new in sections:
+        for metric, old_value, new_value in [('rps', old['rps'], new['rps'])] + [
+                (p, old['latency_ms'][p], new['latency_ms'][p]) for p in ('p50', 'p95', 'p99')]:
+            if old_value is None or new_value is None:
+                continue
+            change = f'{(new_value - old_value) / old_value * 100:+.1f}%' if old_value else 'n/a'
+            lines.append(f'{name:<24}{metric:<8}{old_value:>12}{new_value:>12}{change:>10}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TaskFlow benchmark harness')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='create benchmark users and tasks')
+    seed_parser.add_argument('--users', type=int, default=100)
+    seed_parser.add_argument('--tasks', type=int, default=1000, help='tasks per user')
+    seed_parser.add_argument('--force', action='store_true',
+                             help='drop and seed even if the database is not BENCHMARK_DATABASE_URL')
+
+    run_parser = commands.add_parser('run', help='run a request mix and print a JSON report')
+    run_parser.add_argument('--target', choices=['inprocess', 'gunicorn', 'uvicorn', 'url'], default='inprocess')
+    run_parser.add_argument('--url', default='http://localhost:5000', help='base URL for --target url')
+    run_parser.add_argument('--workers', type=int, default=4, help='server processes for gunicorn/uvicorn')
+    run_parser.add_argument('--port', type=int, default=5099)
+    run_parser.add_argument('--server-arg', action='append', default=[], help='extra gunicorn/uvicorn argument')
+    run_parser.add_argument('--users', type=int, default=100, help='seeded users to spread threads over')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    run_parser.add_argument('--requests', type=int, default=None, help='stop after N requests instead')
+    run_parser.add_argument('--warmup', type=float, default=1.0, help='seconds excluded from the report')
+    run_parser.add_argument('--mix', default=DEFAULT_MIX)
+    run_parser.add_argument('--replay', help='JSONL file of recorded requests')
+    run_parser.add_argument('--seed', type=int, default=0, help='random seed')
+    run_parser.add_argument('--output', help='write the JSON report here as well')
+
+    compare_parser = commands.add_parser('compare', help='compare two JSON reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args(argv)
+    if args.command == 'seed':
+        print(json.dumps(seed(args.users, args.tasks, force=args.force)))
+    elif args.command == 'compare':
+        with open(args.before) as f, open(args.after) as g:
+            print(compare(json.load(f), json.load(g)))
+    else:
+        if args.target == 'inprocess':
+            target = InProcessTarget()
+        elif args.target == 'url':
+            target = HttpTarget(args.url)
+        else:
+            target = start_server(args.target, args.workers, args.port, args.server_arg)
+        try:
+            report = run(target, args.users, args.concurrency, args.duration, args.requests, args.warmup,
+                         args.mix, args.replay, args.seed)
+        finally:
+            target.close()
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
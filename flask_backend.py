@@ -1,11 +1,59 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from sqlalchemy import (DDL, bindparam, case, cast, column, delete, event, func, insert, inspect, literal,
+                        literal_column, select, table, tuple_, update)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, with_loader_criteria
+from sqlalchemy.pool import QueuePool
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+import atexit
+import base64
+import click
+import cProfile
+import fcntl
+import glob
+import gzip
+import hashlib
+import html
+import json
 import jwt
+import logging
+import logging.handlers
+import math
+import operator
 import os
+import random
+import re
+import secrets
+import select as select_module
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import orjson
+except ImportError:  # Backend JSON opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Compresión br opcional; sin ella solo gzip
+    brotli = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
@@ -15,6 +63,212 @@ default_db_path = os.path.join(app.instance_path, 'taskflow.db')
 db_uri = os.getenv('DATABASE_URL', f'sqlite:///{default_db_path}')
 app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Paginación de GET /api/tasks
+app.config['TASKS_PAGE_SIZE'] = int(os.getenv('TASKS_PAGE_SIZE', 100))
+app.config['TASKS_MAX_PAGE_SIZE'] = int(os.getenv('TASKS_MAX_PAGE_SIZE', 1000))
+# Caché de tokens verificados (0 desactiva la caché)
+app.config['TOKEN_CACHE_SIZE'] = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.getenv('TOKEN_CACHE_TTL', 300))
+# Access tokens de vida corta y refresh tokens rotatorios (segundos)
+app.config['ACCESS_TOKEN_TTL'] = int(os.getenv('ACCESS_TOKEN_TTL', 900))
+app.config['REFRESH_TOKEN_TTL'] = int(os.getenv('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+# Filtro Bloom de jti revocados: tamaño en bits, funciones hash y sincronización con la BD
+app.config['REVOCATION_FILTER_BITS'] = int(os.getenv('REVOCATION_FILTER_BITS', 1 << 20))
+app.config['REVOCATION_FILTER_HASHES'] = int(os.getenv('REVOCATION_FILTER_HASHES', 7))
+app.config['REVOCATION_SYNC_INTERVAL'] = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))  # s, 0 = off
+app.config['TOKEN_PURGE_INTERVAL'] = int(os.getenv('TOKEN_PURGE_INTERVAL', 3600))  # s, 0 = off
+# Máximo de operaciones por petición a POST /api/tasks/batch
+app.config['TASKS_BATCH_MAX'] = int(os.getenv('TASKS_BATCH_MAX', 1000))
+# PUT /api/tasks/<id> en modo write-behind: segundos que se agrupan los cambios (0 = off)
+app.config['TASK_WRITE_BEHIND_WINDOW'] = float(os.getenv('TASK_WRITE_BEHIND_WINDOW', 0))
+# Volcados fallidos de una misma tarea antes de descartar sus cambios
+app.config['TASK_WRITE_BEHIND_MAX_ATTEMPTS'] = int(os.getenv('TASK_WRITE_BEHIND_MAX_ATTEMPTS', 3))
+# Días de la serie diaria de GET /api/tasks/stats (por defecto y máximo)
+app.config['STATS_DAYS'] = int(os.getenv('STATS_DAYS', 30))
+app.config['STATS_MAX_DAYS'] = int(os.getenv('STATS_MAX_DAYS', 366))
+# Exportación/importación NDJSON: filas por lote leído del cursor y por transacción
+app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+# Límites de la importación (ya descomprimida): bytes por línea y bytes en total
+app.config['IMPORT_MAX_LINE_BYTES'] = int(os.getenv('IMPORT_MAX_LINE_BYTES', 65536))
+app.config['IMPORT_MAX_BYTES'] = int(os.getenv('IMPORT_MAX_BYTES', 1 << 30))
+# Backend de serialización: auto (orjson si está instalado), orjson o stdlib
+app.config['JSON_BACKEND'] = os.getenv('JSON_BACKEND', 'auto')
+# Hash de contraseñas en un pool de procesos (0 workers = en el hilo de la petición)
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+# Hashes pendientes por worker antes de responder 503 (0 = sin límite). Por defecto
+# la mitad de los hilos de gunicorn: con más que hilos la cola nunca se llenaría
+# y el exceso esperaría en el backlog de accept en lugar de recibir 503
+app.config['PASSWORD_HASH_QUEUE_SIZE'] = int(os.getenv(
+    'PASSWORD_HASH_QUEUE_SIZE', max(int(os.getenv('GUNICORN_THREADS', 8)) // 2, 1)))
+app.config['PASSWORD_HASH_RETRY_AFTER'] = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))
+# Perfil de SQLite aplicado a cada conexión nueva
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -64000))  # negativo = KiB
+app.config['SQLITE_TEMP_STORE'] = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+app.config['SQLITE_WAL_AUTOCHECKPOINT'] = int(os.getenv('SQLITE_WAL_AUTOCHECKPOINT', 1000))  # páginas
+app.config['SQLITE_JOURNAL_SIZE_LIMIT'] = int(os.getenv('SQLITE_JOURNAL_SIZE_LIMIT', 64 * 1024 * 1024))
+app.config['SQLITE_CHECKPOINT_INTERVAL'] = int(os.getenv('SQLITE_CHECKPOINT_INTERVAL', 0))  # s, 0 = off
+# Solo tiene efecto al crear la BD; una BD existente se convierte con `flask --app app db-compact --full`
+app.config['SQLITE_AUTO_VACUUM'] = os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL')
+app.config['SQLITE_VACUUM_PAGES'] = int(os.getenv('SQLITE_VACUUM_PAGES', 2000))  # páginas liberadas por pasada
+app.config['SQLITE_ANALYSIS_LIMIT'] = int(os.getenv('SQLITE_ANALYSIS_LIMIT', 400))  # filas por índice en optimize
+# Bajas lógicas: días que se conservan las tareas eliminadas para /changes y purga en lotes
+app.config['TASK_TOMBSTONE_RETENTION_DAYS'] = int(os.getenv('TASK_TOMBSTONE_RETENTION_DAYS', 30))
+app.config['TASK_PURGE_INTERVAL'] = int(os.getenv('TASK_PURGE_INTERVAL', 3600))  # s, 0 = off
+app.config['TASK_PURGE_BATCH_SIZE'] = int(os.getenv('TASK_PURGE_BATCH_SIZE', 1000))
+
+# Compresión de respuestas negociada con Accept-Encoding
+app.config['COMPRESSION_ENABLED'] = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # bytes
+app.config['COMPRESSION_GZIP_LEVEL'] = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+
+# Métricas: directorio compartido entre workers (vacío = solo este proceso)
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))  # s
+# Diagnóstico de rendimiento (opcional). Perfiles por ruta en PROFILE_DIR (vacío =
+# instance/profiles): cProfile en una fracción de peticiones y muestreo de pila en las
+# que superan PROFILE_SLOW_THRESHOLD. Log de consultas lentas (SLOW_QUERY_LOG vacío =
+# stderr) y aviso de consultas repetidas (N+1) en una misma petición.
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # 0-1, 0 = off
+app.config['PROFILE_SLOW_THRESHOLD'] = float(os.getenv('PROFILE_SLOW_THRESHOLD', 0))  # s, 0 = off
+app.config['PROFILE_SAMPLE_INTERVAL'] = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))  # s
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', '')
+app.config['PROFILE_MAX_FILES'] = int(os.getenv('PROFILE_MAX_FILES', 100))  # por ruta
+app.config['SLOW_QUERY_THRESHOLD'] = float(os.getenv('SLOW_QUERY_THRESHOLD', 0))  # s, 0 = off
+app.config['SLOW_QUERY_LOG'] = os.getenv('SLOW_QUERY_LOG', '')
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', 0))  # repeticiones, 0 = off
+# Pool de conexiones (PostgreSQL u otros motores con servidor)
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', 30))  # s esperando conexión
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))  # s
+app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+app.config['DB_STATEMENT_TIMEOUT'] = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))  # ms, 0 = sin límite
+# Límite de intentos en login/registro: "capacidad/segundos" por IP y por username.
+# RATELIMIT_STORAGE_URL vacío = SQLite en instance/ratelimit.db; redis://... = Redis.
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATELIMIT_STORAGE_URL'] = os.getenv('RATELIMIT_STORAGE_URL', '')
+app.config['RATELIMIT_IP_RATE'] = os.getenv('RATELIMIT_IP_RATE', '20/60')
+app.config['RATELIMIT_USERNAME_RATE'] = os.getenv('RATELIMIT_USERNAME_RATE', '5/60')
+app.config['RATELIMIT_CLEANUP_INTERVAL'] = int(os.getenv('RATELIMIT_CLEANUP_INTERVAL', 600))  # s, 0 = off
+# Caché compartida de respuestas de GET /api/tasks. RESPONSE_CACHE_URL vacío = SQLite en
+# instance/response_cache.db; sqlite:///ruta (p. ej. en /dev/shm) o redis://... = Redis
+app.config['RESPONSE_CACHE_ENABLED'] = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['RESPONSE_CACHE_URL'] = os.getenv('RESPONSE_CACHE_URL', '')
+app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 300))  # s
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+app.config['RESPONSE_CACHE_MAX_BODY'] = int(os.getenv('RESPONSE_CACHE_MAX_BODY', 1024 * 1024))  # bytes
+app.config['RESPONSE_CACHE_EVICT_INTERVAL'] = int(os.getenv('RESPONSE_CACHE_EVICT_INTERVAL', 60))  # s, 0 = off
+# GET /api/tasks/stream (SSE). Conexiones abiertas por proceso: con Flask cada una ocupa
+# un hilo (mantener por debajo de GUNICORN_THREADS); en asgi.py solo una tarea async.
+app.config['STREAM_MAX_CONNECTIONS'] = int(os.getenv('STREAM_MAX_CONNECTIONS', 4))
+app.config['ASGI_STREAM_MAX_CONNECTIONS'] = int(os.getenv('ASGI_STREAM_MAX_CONNECTIONS', 1000))
+app.config['STREAM_HEARTBEAT'] = float(os.getenv('STREAM_HEARTBEAT', 15))  # s entre comentarios keep-alive
+app.config['STREAM_MAX_DURATION'] = int(os.getenv('STREAM_MAX_DURATION', 300))  # s; el cliente reconecta
+app.config['STREAM_RETRY'] = int(os.getenv('STREAM_RETRY', 3000))  # ms, campo retry: del EventSource
+app.config['STREAM_MAX_PAGES'] = int(os.getenv('STREAM_MAX_PAGES', 10))  # páginas de /changes por aviso
+# Reparto de avisos entre workers: auto (postgres si la BD lo es, si no socket), socket o
+# postgres. CHANGE_BUS_DIR vacío = directorio por BD en el directorio temporal del sistema.
+app.config['CHANGE_BUS_BACKEND'] = os.getenv('CHANGE_BUS_BACKEND', 'auto')
+app.config['CHANGE_BUS_DIR'] = os.getenv('CHANGE_BUS_DIR', '')
+# Orden manual (GET /api/tasks?order=position): claves más largas que POSITION_MAX_LENGTH
+# se reparten de nuevo en segundo plano cada POSITION_REBALANCE_INTERVAL segundos
+app.config['POSITION_MAX_LENGTH'] = int(os.getenv('POSITION_MAX_LENGTH', 24))
+app.config['POSITION_REBALANCE_INTERVAL'] = int(os.getenv('POSITION_REBALANCE_INTERVAL', 60))  # s, 0 = off
+# Proxies delante de la app que añaden X-Forwarded-For (0 = usar la IP de la conexión)
+app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', 0))
+# Búsqueda de texto completo: configuración de PostgreSQL y tokens por fragmento
+app.config['SEARCH_TS_CONFIG'] = os.getenv('SEARCH_TS_CONFIG', 'simple')
+app.config['SEARCH_SNIPPET_TOKENS'] = int(os.getenv('SEARCH_SNIPPET_TOKENS', 16))
+app.config['SEARCH_RANK_WINDOW'] = int(os.getenv('SEARCH_RANK_WINDOW', 5000))  # 0 = sin límite
+if not re.fullmatch(r'\w+', app.config['SEARCH_TS_CONFIG']):
+    raise ValueError('SEARCH_TS_CONFIG must be a text search configuration name')
+# Tiempo máximo esperado para arrancar un worker (import + comprobación de esquema)
+app.config['WORKER_BOOT_BUDGET'] = float(os.getenv('WORKER_BOOT_BUDGET', 2.0))  # s
+# asgi.py: hilos para las rutas que se siguen sirviendo con Flask (WSGI)
+app.config['ASGI_WSGI_THREADS'] = int(os.getenv('ASGI_WSGI_THREADS', 32))
+
+class PoolStats:
+    """Contadores de esperas, desbordes y timeouts al pedir conexiones al pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.overflow_events = 0
+            self.timeouts = 0
+
+    def record(self, wait, overflowed, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            if overflowed:
+                self.overflow_events += 1
+
+    def snapshot(self, pool):
+        with self._lock:
+            data = {
+                'checkouts': self.checkouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+            }
+        data.update({
+            'pool_class': type(pool).__name__,
+            'size': pool.size() if hasattr(pool, 'size') else None,
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+            'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+            'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+        })
+        return data
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool que mide cuánto espera cada checkout y si abrió una conexión extra
+    def _do_get(self):
+        start = time.perf_counter()
+        overflow_before = self.overflow()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record(time.perf_counter() - start, False, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - start, self.overflow() > max(overflow_before, 0))
+        return connection
+
+if db_uri.startswith('sqlite'):
+    # SQLite en archivo ya usa QueuePool; en memoria se deja el pool por defecto
+    if ':memory:' not in db_uri and db_uri not in ('sqlite://', 'sqlite:///'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': InstrumentedQueuePool}
+else:
+    engine_options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app.config['DB_POOL_PRE_PING'],
+    }
+    if db_uri.startswith('postgres') and app.config['DB_STATEMENT_TIMEOUT'] > 0:
+        engine_options['connect_args'] = {
+            'options': f"-c statement_timeout={app.config['DB_STATEMENT_TIMEOUT']}"}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
 
 if db_uri.startswith('sqlite:///'):
     sqlite_path = db_uri.replace('sqlite:///', '', 1)
@@ -25,6 +279,548 @@ if db_uri.startswith('sqlite:///'):
 
 db = SQLAlchemy(app)
 CORS(app)
+if app.config['PROXY_FIX_X_FOR'] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+# Motor de base de datos
+with app.app_context():
+    engine = db.engine
+
+# Tras un fork (workers de gunicorn, pool de hashing) el hijo no debe reutilizar
+# las conexiones heredadas del padre; se descartan sin cerrarlas.
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+# Endpoints que escriben pero calculan un hash con la transacción abierta, o que
+# leen el cuerpo por partes (la importación pide BEGIN IMMEDIATE en cada bloque);
+# no se les reserva el bloqueo de escritura desde el inicio.
+SQLITE_DEFERRED_ENDPOINTS = {'login', 'register', 'import_tasks'}
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    # auto_vacuum solo se fija en un archivo nuevo: en uno existente no tiene efecto
+    # sin VACUUM y asignarlo espera al bloqueo de escritura
+    cursor.execute('PRAGMA page_count')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"PRAGMA auto_vacuum={app.config['SQLITE_AUTO_VACUUM']}")
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA mmap_size={app.config['SQLITE_MMAP_SIZE']}")
+    cursor.execute(f"PRAGMA cache_size={app.config['SQLITE_CACHE_SIZE']}")
+    cursor.execute(f"PRAGMA temp_store={app.config['SQLITE_TEMP_STORE']}")
+    cursor.execute(f"PRAGMA wal_autocheckpoint={app.config['SQLITE_WAL_AUTOCHECKPOINT']}")
+    cursor.execute(f"PRAGMA journal_size_limit={app.config['SQLITE_JOURNAL_SIZE_LIMIT']}")
+    cursor.close()
+    # SQLAlchemy emite BEGIN (ver sqlite_begin) en lugar de pysqlite
+    dbapi_connection.isolation_level = None
+
+def sqlite_begin(conn):
+    # Las peticiones de escritura toman el bloqueo al empezar (BEGIN IMMEDIATE):
+    # así esperan con busy_timeout en lugar de fallar con "database is locked"
+    # al pasar de lectura a escritura dentro de la misma transacción. Fuera de
+    # Flask (asgi.py) se pide con execution_options(sqlite_immediate=True).
+    if conn.get_execution_options().get('sqlite_immediate') or (
+            has_request_context() and request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and request.endpoint not in SQLITE_DEFERRED_ENDPOINTS):
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+    else:
+        conn.exec_driver_sql('BEGIN')
+
+def configure_sqlite_engine(target):
+    # Perfil de conexión y control de BEGIN; también para el motor síncrono de asgi.py
+    event.listen(target, 'connect', set_sqlite_pragmas)
+    event.listen(target, 'begin', sqlite_begin)
+
+if engine.dialect.name == 'sqlite':
+    configure_sqlite_engine(engine)
+
+def sqlite_checkpoint(mode='PASSIVE'):
+    # PASSIVE copia lo posible del WAL a la BD sin bloquear a lectores ni escritores
+    with engine.connect() as conn:
+        busy, log_frames, checkpointed = conn.exec_driver_sql(f'PRAGMA wal_checkpoint({mode})').one()
+    return {'busy': busy, 'log_frames': log_frames, 'checkpointed_frames': checkpointed}
+
+@app.cli.command('sqlite-checkpoint')
+@click.option('--mode', default='PASSIVE',
+              type=click.Choice(['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'], case_sensitive=False))
+def sqlite_checkpoint_command(mode):
+    """Ejecuta un checkpoint del WAL de SQLite."""
+    click.echo(json.dumps(sqlite_checkpoint(mode.upper())))
+
+# Tareas en segundo plano: un hilo daemon por proceso, arrancado en la primera
+# petición para que cada worker de gunicorn tenga el suyo tras el fork.
+background_jobs = []
+_background_jobs_pid = None
+_background_jobs_lock = threading.Lock()
+
+def background_job(interval_key):
+    # Registra func para ejecutarse cada app.config[interval_key] segundos (0 = nunca)
+    def register(func):
+        background_jobs.append((interval_key, func))
+        return func
+    return register
+
+def _run_background_job(interval, func):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                func()
+        except Exception:
+            app.logger.exception('Background job %s failed', func.__name__)
+
+@app.before_request
+def start_background_jobs():
+    global _background_jobs_pid
+    if _background_jobs_pid == os.getpid():
+        return
+    with _background_jobs_lock:
+        if _background_jobs_pid == os.getpid():
+            return
+        _background_jobs_pid = os.getpid()
+        for interval_key, func in background_jobs:
+            interval = app.config[interval_key]
+            if interval > 0:
+                threading.Thread(target=_run_background_job, args=(interval, func),
+                                 name=func.__name__, daemon=True).start()
+
+if engine.dialect.name == 'sqlite':
+    @background_job('SQLITE_CHECKPOINT_INTERVAL')
+    def periodic_sqlite_checkpoint():
+        sqlite_checkpoint('PASSIVE')
+
+# Métricas en formato Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRIC_DEFINITIONS = {
+    'taskflow_http_requests_total': ('counter', 'HTTP requests by route, method and status.', None),
+    'taskflow_http_request_duration_seconds': ('histogram', 'HTTP request latency.', LATENCY_BUCKETS),
+    'taskflow_http_requests_in_flight': ('gauge', 'HTTP requests being processed.', None),
+    'taskflow_db_queries_total': ('counter', 'SQL statements executed while serving requests.', None),
+    'taskflow_db_query_seconds_total': ('counter', 'Time spent executing SQL statements.', None),
+    'taskflow_db_queries_per_request': ('histogram', 'SQL statements per request.', COUNT_BUCKETS),
+    'taskflow_jwt_decode_seconds': ('histogram', 'Time spent verifying JWTs.', LATENCY_BUCKETS),
+    'taskflow_rate_limited_total': ('counter', 'Requests rejected by the login/register rate limiter.', None),
+    'taskflow_password_hash_seconds': ('histogram', 'Time spent hashing or verifying passwords, '
+                                       'including queueing.', LATENCY_BUCKETS),
+    'taskflow_response_cache_events_total': ('counter', 'Response cache hits, misses, evictions and '
+                                             'invalidated entries.', None),
+    'taskflow_stream_connections': ('gauge', 'Open GET /api/tasks/stream connections.', None),
+    'taskflow_db_repeated_queries_total': ('counter', 'Requests flagged for repeating a similar SQL '
+                                           'statement N_PLUS_ONE_THRESHOLD times or more (N+1).', None),
+    'taskflow_worker_boot_seconds': ('histogram', 'Time from worker fork until it is ready to serve, '
+                                     'including the schema version check.', LATENCY_BUCKETS),
+}
+
+class Metrics:
+    """Contadores, gauges e histogramas agregables entre procesos.
+
+    Con `directory` cada proceso vuelca sus valores a metrics-<pid>-<inicio>.json
+    como mucho cada `flush_interval` segundos y el scrape suma todos los archivos.
+    Los archivos de procesos terminados se suman (sin sus gauges) a
+    metrics-archive.json y se borran, así que el directorio no crece con cada
+    worker reciclado y los totales nunca bajan aunque se reutilice un pid.
+    """
+
+    ARCHIVE = 'metrics-archive.json'
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._values = {}
+        self._filename = None
+
+    def reset(self):
+        # También tras un fork: el hijo empieza de cero con un archivo propio
+        with self._lock:
+            self._values = {}
+            self._filename = None
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        # Histograma guardado como [cuenta por bucket..., +Inf, suma]
+        buckets = METRIC_DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            else:
+                data[len(buckets)] += 1
+            data[-1] += value
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            entries = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            self._last_flush = time.monotonic()
+            filename, first = self._filename, self._filename is None
+            if first:
+                filename = self._filename = f'metrics-{os.getpid()}-{time.time_ns()}.json'
+        os.makedirs(self.directory, exist_ok=True)
+        if first:
+            # Archivos de procesos anteriores con este mismo pid: ya terminaron
+            stale = [path for path in self._process_files() if path[1] == os.getpid()]
+            if stale:
+                with self._directory_lock():
+                    self._archive([path for path, _ in stale])
+        self._write(os.path.join(self.directory, filename), entries)
+
+    def close(self):
+        # Al terminar el proceso (atexit, worker_exit de gunicorn): lo contado se
+        # suma al archivo de procesos terminados y se borra el archivo propio
+        if not self.directory:
+            return
+        with self._lock:
+            entries = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            filename, self._filename = self._filename, None
+            self._values = {}
+        os.makedirs(self.directory, exist_ok=True)
+        with self._directory_lock():
+            self._archive([], entries)
+            if filename:
+                try:
+                    os.unlink(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        if not self.directory:
+            with self._lock:
+                return {key: list(v) if isinstance(v, list) else v for key, v in self._values.items()}
+        self.flush()
+        with self._directory_lock():
+            files = self._process_files()
+            dead = [path for path, pid in files if not _pid_alive(pid)]
+            if dead:
+                self._archive(dead)
+            merged = {}
+            _merge_metric_entries(merged, self._read(os.path.join(self.directory, self.ARCHIVE)))
+            for path, pid in files:
+                if path not in dead:
+                    _merge_metric_entries(merged, self._read(path))
+        return merged
+
+    def _process_files(self):
+        # [(ruta, pid)] de los archivos de cada proceso
+        files = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*-*.json')):
+            pid = os.path.basename(path).split('-')[1]
+            if pid.isdigit():
+                files.append((path, int(pid)))
+        return files
+
+    def _archive(self, paths, entries=()):
+        # Suma a metrics-archive.json los archivos de procesos terminados (y entries)
+        # sin sus gauges y los borra. Requiere el lock del directorio.
+        archive_path = os.path.join(self.directory, self.ARCHIVE)
+        merged = {}
+        _merge_metric_entries(merged, self._read(archive_path))
+        _merge_metric_entries(merged, entries, gauges=False)
+        for path in paths:
+            _merge_metric_entries(merged, self._read(path), gauges=False)
+        self._write(archive_path, [[name, list(labels), value] for (name, labels), value in merged.items()])
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _directory_lock(self):
+        # Serializa entre procesos el archivado y la lectura del scrape
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write(self, path, entries):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def render(self):
+        by_name = {}
+        for (name, labels), value in self.collect().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name.get(name, ())):
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], value):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _merge_metric_entries(merged, entries, gauges=True):
+    for name, labels, value in entries:
+        if not gauges and METRIC_DEFINITIONS[name][0] == 'gauge':
+            continue
+        key = (name, tuple(tuple(pair) for pair in labels))
+        if isinstance(value, list):
+            current = merged.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+metrics = Metrics(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+os.register_at_fork(after_in_child=metrics.reset)
+# Lo contado desde el último volcado no se pierde al salir (gunicorn sale con sys.exit)
+atexit.register(metrics.close)
+
+def request_route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    g.db_statements = Counter() if app.config['N_PLUS_ONE_THRESHOLD'] > 0 else None
+    metrics.inc('taskflow_http_requests_in_flight')
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    if response.mimetype == 'text/event-stream':
+        discard_request_profile()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'request_start' not in g:
+        return
+    route = request_route()
+    metrics.inc('taskflow_http_requests_in_flight', -1)
+    metrics.inc('taskflow_http_requests_total', method=request.method, route=route,
+                status=str(g.get('response_status', 500)))
+    metrics.observe('taskflow_http_request_duration_seconds', time.perf_counter() - g.request_start,
+                    method=request.method, route=route)
+    metrics.inc('taskflow_db_queries_total', g.db_queries, route=route)
+    metrics.inc('taskflow_db_query_seconds_total', g.db_seconds, route=route)
+    metrics.observe('taskflow_db_queries_per_request', g.db_queries, route=route)
+    metrics.maybe_flush()
+
+@event.listens_for(engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    in_request = has_request_context() and 'db_queries' in g
+    if in_request:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+        if g.db_statements is not None and not executemany:
+            g.db_statements[statement] += 1
+    threshold = app.config['SLOW_QUERY_THRESHOLD']
+    if threshold > 0 and elapsed >= threshold:
+        log_slow_query(statement, parameters, executemany, elapsed, in_request)
+
+# Log de consultas lentas: una línea JSON por consulta, con la forma de los
+# parámetros (tipos) pero nunca sus valores
+slow_query_log = logging.getLogger('taskflow.slow_queries')
+slow_query_log.setLevel(logging.INFO)
+slow_query_log.propagate = False
+if app.config['SLOW_QUERY_THRESHOLD'] > 0:
+    _handler = (logging.handlers.WatchedFileHandler(app.config['SLOW_QUERY_LOG'])
+                if app.config['SLOW_QUERY_LOG'] else logging.StreamHandler())
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_query_log.addHandler(_handler)
+
+def parameters_shape(parameters, executemany=False):
+    if executemany:
+        return f'{len(parameters)} x {parameters_shape(parameters[0])}' if parameters else '0 x []'
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+def log_slow_query(statement, parameters, executemany, elapsed, in_request):
+    # Ruta de origen: la petición Flask o, fuera de ella, el hilo (jobs en segundo plano)
+    origin = (f'{request.method} {request_route()}' if in_request
+              else f'thread:{threading.current_thread().name}')
+    slow_query_log.info(json.dumps({
+        'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'duration_ms': round(elapsed * 1000, 3),
+        'route': origin,
+        'statement': ' '.join(statement.split())[:2000],
+        'parameters': parameters_shape(parameters, executemany),
+    }))
+
+# Detector de N+1: sentencias con la misma forma repetidas en una petición (p. ej.
+# cargar User.tasks dentro de un bucle). Las listas IN de distinta longitud cuentan
+# como la misma consulta.
+IN_LIST = re.compile(r'\((?:\?|%\(\w+\)s|%s)(?:,\s*(?:\?|%\(\w+\)s|%s))*\)')
+
+@lru_cache(maxsize=1024)
+def statement_fingerprint(statement):
+    return IN_LIST.sub('(...)', ' '.join(statement.split()))
+
+def repeated_queries(statements, threshold):
+    counts = Counter()
+    for statement, count in statements.items():
+        counts[statement_fingerprint(statement)] += count
+    return [(fingerprint, count) for fingerprint, count in counts.most_common() if count >= threshold]
+
+@app.teardown_request
+def report_repeated_queries(exc):
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    if threshold <= 0 or g.get('db_statements') is None:
+        return
+    route = request_route()
+    for fingerprint, count in repeated_queries(g.db_statements, threshold):
+        app.logger.warning('Possible N+1 in %s %s: %d similar statements: %s',
+                           request.method, route, count, fingerprint[:500])
+        metrics.inc('taskflow_db_repeated_queries_total', route=route)
+
+# Perfiles por petición
+class StackSampler:
+    """Toma cada `interval` s la pila de los hilos con una petición registrada.
+
+    El hilo de la petición solo se registra al empezar y se retira al terminar; las
+    muestras las toma un hilo aparte con sys._current_frames(), así que el coste
+    para la petición es casi nulo. Acumula pilas en formato "folded" (una línea
+    "raíz;...;hoja N" por pila, para flamegraph.pl o speedscope).
+    """
+
+    def __init__(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self, interval):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._active = {}
+                    threading.Thread(target=self._run, args=(interval,),
+                                     name='stack_sampler', daemon=True).start()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def stop(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, stacks in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[fold_stack(frame)] += 1
+
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+stack_sampler = StackSampler()
+
+def profile_path(suffix, duration):
+    # <PROFILE_DIR>/<MÉTODO>_<ruta>/<epoch ms>-<pid>-<hilo>-<duración>ms.<suffix>
+    directory = os.path.join(app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles'),
+                             re.sub(r'\W+', '_', f'{request.method} {request_route()}').strip('_'))
+    os.makedirs(directory, exist_ok=True)
+    # Solo se conservan los PROFILE_MAX_FILES más recientes de cada ruta
+    existing = sorted(os.listdir(directory))
+    for name in existing[:max(0, len(existing) - app.config['PROFILE_MAX_FILES'] + 1)]:
+        os.unlink(os.path.join(directory, name))
+    return os.path.join(directory, f'{int(time.time() * 1000)}-{os.getpid()}-{threading.get_native_id()}-'
+                                   f'{round(duration * 1000)}ms.{suffix}')
+
+@app.before_request
+def start_request_profile():
+    if app.config['PROFILE_SAMPLE_RATE'] > 0 and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    elif app.config['PROFILE_SLOW_THRESHOLD'] > 0:
+        stack_sampler.start(app.config['PROFILE_SAMPLE_INTERVAL'])
+        g.stack_sampled = True
+
+def discard_request_profile():
+    # Los streams SSE duran minutos por diseño: no se perfilan ni cuentan como N+1
+    if 'profiler' in g:
+        g.pop('profiler').disable()
+    if g.pop('stack_sampled', False):
+        stack_sampler.stop()
+    g.db_statements = None
+
+@app.teardown_request
+def finish_request_profile(exc):
+    duration = time.perf_counter() - g.request_start if 'request_start' in g else 0.0
+    try:
+        if 'profiler' in g:
+            profiler = g.pop('profiler')
+            profiler.disable()
+            profiler.dump_stats(profile_path('prof', duration))
+        elif g.pop('stack_sampled', False):
+            stacks = stack_sampler.stop()
+            if stacks and duration >= app.config['PROFILE_SLOW_THRESHOLD']:
+                with open(profile_path('folded', duration), 'w') as f:
+                    f.writelines(f'{stack} {count}\n' for stack, count in stacks.items())
+    except OSError:
+        app.logger.exception('Could not write request profile')
 
 # Modelos
 class User(db.Model):
@@ -33,7 +829,18 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Revisión de la colección de tareas; se incrementa en cada cambio
+    task_revision = db.Column(db.Integer, default=0, nullable=False)
+    # Revisión más alta de las bajas ya purgadas; /changes desde antes responde 410
+    purged_revision = db.Column(db.Integer, default=0, nullable=False)
+    # Todas las filas, también las bajas lógicas: borrar el usuario las arrastra
+    all_tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Solo las tareas vivas; de solo lectura (las altas y bajas van por all_tasks)
+    tasks = db.relationship('Task', lazy=True, viewonly=True,
+                            primaryjoin='and_(User.id == Task.user_id, Task.deleted_at.is_(None))')
+    task_stats = db.relationship('TaskStat', lazy=True, cascade='all, delete-orphan')
+    task_daily_stats = db.relationship('TaskDailyStat', lazy=True, cascade='all, delete-orphan')
+    refresh_tokens = db.relationship('RefreshToken', lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -43,6 +850,9 @@ class User(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# Tamaño de la columna Task.position; una clave que no cabe obliga a repartir ya
+POSITION_KEY_SIZE = 255
+
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -52,6 +862,31 @@ class Task(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    revision = db.Column(db.Integer, default=0, nullable=False)
+    # Momento en que se marcó como completada (serie diaria de GET /api/tasks/stats)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # Baja lógica: la fila se conserva para /changes hasta que la purga la elimina
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Orden manual: clave fraccionaria en base 62 (ver position_key_between). En
+    # PostgreSQL con colación "C" para que compare byte a byte, como SQLite y Python.
+    position = db.Column(db.String(POSITION_KEY_SIZE).with_variant(
+        postgresql.VARCHAR(POSITION_KEY_SIZE, collation='C'), 'postgresql'), nullable=False)
+
+    # Índices para el listado paginado, los filtros y la sincronización delta. Los
+    # del listado son parciales (solo tareas vivas); el de revisión incluye las bajas.
+    # AUTOINCREMENT evita que SQLite reutilice ids de tareas eliminadas.
+    __table_args__ = (
+        db.Index('ix_task_user_updated', 'user_id', 'updated_at', 'id',
+                 sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None)),
+        db.Index('ix_task_user_completed_priority', 'user_id', 'completed', 'priority',
+                 sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None)),
+        db.Index('ix_task_user_position', 'user_id', 'position', 'id',
+                 sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None)),
+        db.Index('ix_task_user_revision', 'user_id', 'revision'),
+        db.Index('ix_task_deleted_at', 'deleted_at',
+                 sqlite_where=deleted_at.isnot(None), postgresql_where=deleted_at.isnot(None)),
+        {'sqlite_autoincrement': True},
+    )
 
     def to_dict(self):
         return {
@@ -60,37 +895,2330 @@ class Task(db.Model):
             'description': self.description,
             'completed': self.completed,
             'priority': self.priority,
+            'position': self.position,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'user_id': self.user_id
         }
 
+# Las consultas ORM sobre Task excluyen por defecto las bajas lógicas, también
+# desde asgi.py (AsyncSession usa una Session síncrona por debajo). Se incluyen con
+# execution_options(include_deleted=True). Las cargas de relaciones no se filtran
+# para que borrar un User arrastre también sus bajas (User.all_tasks); User.tasks
+# las excluye en su primaryjoin.
+@event.listens_for(Session, 'do_orm_execute')
+def exclude_deleted_tasks(state):
+    if ((state.is_select or state.is_update or state.is_delete) and not state.is_column_load
+            and not state.is_relationship_load and not state.execution_options.get('include_deleted')):
+        state.statement = state.statement.options(
+            with_loader_criteria(Task, Task.deleted_at.is_(None), include_aliases=True,
+                                 propagate_to_loaders=False))
+
+class TaskStat(db.Model):
+    # Resumen materializado: tareas por usuario, completed y priority
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    completed = db.Column(db.Boolean, primary_key=True)
+    priority = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+class TaskDailyStat(db.Model):
+    # Tareas creadas y completadas por día (UTC); son eventos, borrar no los resta
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    created = db.Column(db.Integer, default=0, nullable=False)
+    completed = db.Column(db.Integer, default=0, nullable=False)
+
+class RefreshToken(db.Model):
+    # Un refresh token por login o rotación; la familia agrupa las rotaciones de un login
+    jti = db.Column(db.String(32), primary_key=True)
+    family = db.Column(db.String(32), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Access token emitido junto a este refresh token (se revoca con la familia)
+    access_jti = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+
+class SchemaVersion(db.Model):
+    # Migraciones aplicadas (ver migrate_database); la versión actual es la mayor
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+class RevokedToken(db.Model):
+    # jti de access tokens revocados antes de caducar; origen del filtro Bloom
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Índice de texto completo sobre title y description. En SQLite es una tabla
+# FTS5 de contenido externo (sin duplicar el texto) mantenida por triggers, con
+# el dueño como token "u<id>" para filtrar por usuario dentro del propio índice.
+# Solo indexa tareas vivas: una baja lógica sale del índice al marcarse y la purga
+# ya no la toca. En PostgreSQL es una columna tsvector generada con un índice GIN.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIEW IF NOT EXISTS task_fts_source AS "
+    "SELECT id, title, description, 'u' || user_id AS owner FROM task WHERE deleted_at IS NULL",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "title, description, owner, content='task_fts_source', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts (rowid, title, description, owner) "
+    "SELECT new.id, new.title, new.description, 'u' || new.user_id WHERE new.deleted_at IS NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts (task_fts, rowid, title, description, owner) "
+    "SELECT 'delete', old.id, old.title, old.description, 'u' || old.user_id "
+    "WHERE old.deleted_at IS NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_update "
+    "AFTER UPDATE OF title, description, user_id, deleted_at ON task BEGIN "
+    "INSERT INTO task_fts (task_fts, rowid, title, description, owner) "
+    "SELECT 'delete', old.id, old.title, old.description, 'u' || old.user_id "
+    "WHERE old.deleted_at IS NULL; "
+    "INSERT INTO task_fts (rowid, title, description, owner) "
+    "SELECT new.id, new.title, new.description, 'u' || new.user_id WHERE new.deleted_at IS NULL; END",
+]
+SQLITE_SEARCH_TRIGGERS = ('task_fts_insert', 'task_fts_delete', 'task_fts_update')
+POSTGRES_SEARCH_DDL = [
+    "ALTER TABLE task ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('{cfg}', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('{cfg}', coalesce(description, '')), 'B')) STORED"
+    .format(cfg=app.config['SEARCH_TS_CONFIG']),
+    "CREATE INDEX IF NOT EXISTS ix_task_search_vector ON task USING GIN (search_vector)",
+]
+
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Task.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Task.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in ('DROP TABLE IF EXISTS task_fts', 'DROP VIEW IF EXISTS task_fts_source'):
+    event.listen(Task.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+def install_search_index(conn):
+    # Crea el índice de búsqueda en una BD existente y lo reconstruye
+    if conn.dialect.name == 'sqlite':
+        # Se recrean vista y triggers por si vienen de una versión anterior
+        for name in SQLITE_SEARCH_TRIGGERS:
+            conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+        conn.exec_driver_sql('DROP VIEW IF EXISTS task_fts_source')
+        for statement in SQLITE_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO task_fts (task_fts) VALUES ('rebuild')")
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Crea el índice de búsqueda en una BD existente y lo reconstruye."""
+    with engine.begin() as conn:
+        install_search_index(conn)
+    click.echo('Search index ready')
+
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'position',
+               'created_at', 'updated_at', 'user_id')
+TASK_DATETIME_FIELDS = ('created_at', 'updated_at')
+
+# Serialización
+@lru_cache(maxsize=8192)
+def format_datetime(value):
+    # Las filas de un mismo lote comparten created_at/updated_at
+    return value.isoformat()
+
+def task_row_to_dict(row, fields):
+    # Serializa una fila de un select() Core (mismo formato que Task.to_dict)
+    result = dict(zip(fields, row))
+    for name in TASK_DATETIME_FIELDS:
+        value = result.get(name)
+        if value is not None:
+            result[name] = format_datetime(value)
+    return result
+
+_NON_ASCII = re.compile(r'[^\x00-\x7e]')
+
+def _escape_non_ascii(match):
+    # Igual que json.dumps(ensure_ascii=True): \uXXXX y pares sustitutos
+    code = ord(match.group())
+    if code > 0xFFFF:
+        code -= 0x10000
+        return '\\u{0:04x}\\u{1:04x}'.format(0xD800 | (code >> 10), 0xDC00 | (code & 0x3FF))
+    return '\\u{0:04x}'.format(code)
+
+class JsonSerializer:
+    """Genera los mismos bytes que jsonify (claves ordenadas, compacto, ASCII).
+
+    Con orjson el resultado se escapa a ASCII solo si contiene caracteres fuera
+    de ese rango, así que la salida es idéntica con ambos backends.
+    """
+
+    def __init__(self, backend):
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'stdlib'
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_BACKEND=orjson requires the orjson package')
+        self.backend = backend
+
+    def dumps(self, obj):
+        if self.backend == 'orjson':
+            output = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+            if output.isascii() and b'\x7f' not in output:
+                return output
+            return _NON_ASCII.sub(_escape_non_ascii, output.decode()).encode()
+        return (json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+serializer = JsonSerializer(app.config['JSON_BACKEND'])
+
+def json_response(payload, status=200):
+    return app.response_class(serializer.dumps(payload), status=status, mimetype='application/json')
+
+# Compresión de respuestas. br (calidad baja, pensada para contenido dinámico)
+# comprime más que gzip con un coste similar; gana si el cliente acepta ambas.
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html'}
+COMPRESSION_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate_encoding(accept_encodings):
+    # accept_encodings: werkzeug Accept (request.accept_encodings o parse_accept_header)
+    if not app.config['COMPRESSION_ENABLED']:
+        return None
+    return accept_encodings.best_match(COMPRESSION_ENCODINGS)
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['COMPRESSION_BROTLI_QUALITY'])
+    compressor = zlib.compressobj(app.config['COMPRESSION_GZIP_LEVEL'], wbits=31)
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    # Cada fragmento sale comprimido en cuanto se genera (flush de sincronización)
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=app.config['COMPRESSION_BROTLI_QUALITY'])
+        process, sync, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(app.config['COMPRESSION_GZIP_LEVEL'], wbits=31)
+        process, finish = compressor.compress, compressor.flush
+        sync = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            data = process(chunk.encode() if isinstance(chunk, str) else chunk) + sync()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+@app.after_request
+def compress_response(response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESSION_MIN_SIZE']:
+            return response
+        response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Otra codificación es otra representación: el ETag pasa a débil. If-None-Match
+    # se compara en modo débil (contains_weak), así que sigue dando 304.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Utilidades de paginación y filtros
+# Orden del listado: columna de la clave del cursor (siempre desempatada por id)
+TASK_ORDERS = {'updated': Task.updated_at, 'position': Task.position}
+
+def parse_order_arg(value):
+    if not value:
+        return 'updated'
+    if value not in TASK_ORDERS:
+        raise ValueError(f'Invalid value for order: expected {" or ".join(TASK_ORDERS)}')
+    return value
+
+def encode_cursor(key, task_id):
+    raw = json.dumps([key.isoformat() if isinstance(key, datetime) else key, task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, order='updated'):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, task_id = json.loads(raw)
+        if order == 'position':
+            validate_position_key(key)
+            return key, int(task_id)
+        return datetime.fromisoformat(key), int(task_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_bool_arg(name, value):
+    lowered = value.lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'Invalid value for {name}: expected true or false')
+
+def parse_datetime_arg(name, value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}: expected an ISO 8601 datetime')
+    # Las fechas se guardan como UTC sin zona horaria
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_fields_arg(value):
+    if not value:
+        return TASK_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in TASK_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f'Unknown fields: {", ".join(unknown) or value}')
+    return fields
+
+def parse_limit_arg(value):
+    if value is None:
+        return app.config['TASKS_PAGE_SIZE']
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Invalid value for limit: expected an integer')
+    if limit < 1:
+        raise ValueError('Invalid value for limit: must be positive')
+    return min(limit, app.config['TASKS_MAX_PAGE_SIZE'])
+
+def task_filters(user_id, args):
+    # Construye las condiciones WHERE a partir de los parámetros de la petición
+    conditions = [Task.user_id == user_id]
+    if args.get('completed') is not None:
+        conditions.append(Task.completed == parse_bool_arg('completed', args['completed']))
+    if args.get('priority'):
+        priorities = [p.strip() for p in args['priority'].split(',') if p.strip()]
+        conditions.append(Task.priority.in_(priorities))
+    ranges = (
+        ('created_after', Task.created_at, operator.ge),
+        ('created_before', Task.created_at, operator.lt),
+        ('updated_after', Task.updated_at, operator.ge),
+        ('updated_before', Task.updated_at, operator.lt),
+    )
+    for name, column, op in ranges:
+        if args.get(name):
+            conditions.append(op(column, parse_datetime_arg(name, args[name])))
+    return conditions
+
+# Claves de orden fraccionarias (mismo esquema que la librería fractional-indexing,
+# así un cliente puede generarlas igual). Una clave es una parte entera de longitud
+# variable (la primera letra indica cuántos dígitos la siguen: a-z positivas, A-Z
+# negativas) más una fracción opcional sin ceros finales, todo en base 62 ASCII. Se
+# comparan como texto. Añadir al final solo incrementa la parte entera ('a0', 'a1',
+# ..., 'az', 'b00'...), así que las claves crecen con el logaritmo del número de
+# tareas; insertar entre dos claves alarga la fracción.
+POSITION_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+POSITION_SMALLEST_INTEGER = 'A' + '0' * 26
+
+def _integer_length(head):
+    if 'a' <= head <= 'z':
+        return ord(head) - ord('a') + 2
+    if 'A' <= head <= 'Z':
+        return ord('Z') - ord(head) + 2
+    raise ValueError(f'Invalid position key head: {head!r}')
+
+def _integer_part(key):
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f'Invalid position key: {key!r}')
+    return key[:length]
+
+def validate_position_key(key):
+    if not isinstance(key, str) or not key or key == POSITION_SMALLEST_INTEGER:
+        raise ValueError(f'Invalid position key: {key!r}')
+    if any(c not in POSITION_DIGITS for c in key) or key[len(_integer_part(key)):].endswith('0'):
+        raise ValueError(f'Invalid position key: {key!r}')
+
+def _midpoint(a, b):
+    # Fracción estrictamente entre a y b ('' = 0, None = 1); ninguna termina en '0'
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = POSITION_DIGITS.index(a[0]) if a else 0
+    digit_b = POSITION_DIGITS.index(b[0]) if b is not None else len(POSITION_DIGITS)
+    if digit_b - digit_a > 1:
+        return POSITION_DIGITS[round((digit_a + digit_b) / 2)]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return POSITION_DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def _increment_integer(value):
+    head, digits = value[0], list(value[1:])
+    for i in reversed(range(len(digits))):
+        digit = POSITION_DIGITS.index(digits[i]) + 1
+        if digit < len(POSITION_DIGITS):
+            digits[i] = POSITION_DIGITS[digit]
+            return head + ''.join(digits)
+        digits[i] = '0'
+    if head == 'Z':
+        return 'a0'
+    if head == 'z':
+        return None
+    head = chr(ord(head) + 1)
+    if head > 'a':
+        digits.append('0')
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+def _decrement_integer(value):
+    head, digits = value[0], list(value[1:])
+    for i in reversed(range(len(digits))):
+        digit = POSITION_DIGITS.index(digits[i]) - 1
+        if digit >= 0:
+            digits[i] = POSITION_DIGITS[digit]
+            return head + ''.join(digits)
+        digits[i] = POSITION_DIGITS[-1]
+    if head == 'a':
+        return 'Z' + POSITION_DIGITS[-1]
+    if head == 'A':
+        return None
+    head = chr(ord(head) - 1)
+    if head < 'Z':
+        digits.append(POSITION_DIGITS[-1])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+def position_key_between(a, b):
+    # Clave estrictamente entre a y b; None = sin límite por ese lado
+    for key in (a, b):
+        if key is not None:
+            validate_position_key(key)
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f'Position keys out of order: {a!r} >= {b!r}')
+    if a is None:
+        if b is None:
+            return 'a0'
+        integer = _integer_part(b)
+        if integer == POSITION_SMALLEST_INTEGER:
+            return integer + _midpoint('', b[len(integer):])
+        if integer < b:
+            return integer
+        smaller = _decrement_integer(integer)
+        if smaller is None:
+            raise ValueError('Cannot decrement position key any further')
+        return smaller
+    integer = _integer_part(a)
+    if b is None:
+        larger = _increment_integer(integer)
+        return larger if larger is not None else integer + _midpoint(a[len(integer):], None)
+    if integer == _integer_part(b):
+        return integer + _midpoint(a[len(integer):], b[len(integer):])
+    larger = _increment_integer(integer)
+    if larger is None:
+        raise ValueError('Cannot increment position key any further')
+    return larger if larger < b else integer + _midpoint(a[len(integer):], None)
+
+def position_keys_after(last, count):
+    keys = []
+    for _ in range(count):
+        last = position_key_between(last, None)
+        keys.append(last)
+    return keys
+
+# Operaciones en lote (no hacen commit; lo decide quien las llama). Reciben la
+# sesión para poder usarse también desde AsyncSession.run_sync (ver asgi.py).
+TASK_UPDATABLE_FIELDS = ('title', 'description', 'completed', 'priority')
+TASK_PRIORITIES = ('low', 'medium', 'high')
+TASK_TITLE_MAX = 200
+
+def task_values(data, fields=TASK_UPDATABLE_FIELDS):
+    # Copia los campos de tarea presentes en data comprobando tipo y valor antes de
+    # que lleguen a la BD; ValueError con el primero que no vale
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    values = {f: data[f] for f in fields if f in data}
+    title = values.get('title', 'x')
+    if not isinstance(title, str) or not title:
+        raise ValueError('Title must be a non-empty string')
+    if len(title) > TASK_TITLE_MAX:
+        raise ValueError(f'Title must be at most {TASK_TITLE_MAX} characters')
+    if values.get('description') is None and 'description' in values:
+        values['description'] = ''
+    elif not isinstance(values.get('description', ''), str):
+        raise ValueError('Description must be a string')
+    if not isinstance(values.get('completed', False), bool):
+        raise ValueError('Completed must be true or false')
+    if values.get('priority', 'medium') not in TASK_PRIORITIES:
+        raise ValueError(f"Priority must be one of {', '.join(TASK_PRIORITIES)}")
+    return values
+
+class TaskStatsDelta:
+    """Variación de TaskStat/TaskDailyStat acumulada por una operación en lote.
+
+    Se aplica con un UPSERT de suma en la misma transacción que la mutación.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.daily = Counter()
+
+    def add(self, completed, priority, created_at, completed_at, sign=1):
+        self.counts[(bool(completed), priority)] += sign
+        self.daily[(created_at.date(), 'created')] += sign
+        if completed and completed_at is not None:
+            self.daily[(completed_at.date(), 'completed')] += sign
+
+    def discard(self, completed, priority):
+        # Baja de una tarea: cambia el estado actual, no la serie diaria
+        self.counts[(bool(completed), priority)] -= 1
+
+    def apply(self, session, user_id):
+        counts = [{'user_id': user_id, 'completed': completed, 'priority': priority, 'count': n}
+                  for (completed, priority), n in self.counts.items() if n]
+        days = {}
+        for (day, kind), n in self.daily.items():
+            if n:
+                days.setdefault(day, {'user_id': user_id, 'day': day, 'created': 0, 'completed': 0})[kind] = n
+        if counts:
+            session.execute(upsert_counters(session, TaskStat, ['count']), counts)
+        if days:
+            session.execute(upsert_counters(session, TaskDailyStat, ['created', 'completed']),
+                            list(days.values()))
+
+def upsert_counters(session, model, counters):
+    # INSERT ... ON CONFLICT (clave primaria) DO UPDATE SET contador = contador + nuevo
+    dialect_insert = sqlite.insert if session.get_bind().dialect.name == 'sqlite' else postgresql.insert
+    statement = dialect_insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=[c.name for c in model.__table__.primary_key],
+        set_={name: getattr(model, name) + statement.excluded[name] for name in counters})
+
+def bulk_create_tasks(session, user_id, items, revision):
+    # INSERT en lote devolviendo las tareas creadas en el mismo orden que items.
+    # Las tareas nuevas van al final del orden manual.
+    now = datetime.utcnow()
+    positions = position_keys_after(last_task_position(session, user_id), len(items))
+    rows = [{
+        'title': item['title'],
+        'description': item.get('description', ''),
+        'completed': item.get('completed', False) is True,
+        'priority': item.get('priority', 'medium'),
+        'position': position,
+        'created_at': now,
+        'updated_at': now,
+        'user_id': user_id,
+        'revision': revision,
+        'completed_at': now if item.get('completed', False) is True else None,
+    } for item, position in zip(items, positions)]
+    # RETURNING en el orden de rows: en PostgreSQL va en lotes (insertmanyvalues); en
+    # SQLite, que no garantiza ese orden en un INSERT múltiple, SQLAlchemy ejecuta
+    # fila a fila sobre el mismo cursor (estilo executemany)
+    ids = session.scalars(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True), rows).all()
+    stats = TaskStatsDelta()
+    for row in rows:
+        stats.add(row['completed'], row['priority'], now, row['completed_at'])
+    stats.apply(session, user_id)
+    return [task_row_to_dict([task_id] + [row[f] for f in TASK_FIELDS[1:]], TASK_FIELDS)
+            for task_id, row in zip(ids, rows)]
+
+def bulk_update_tasks(session, user_id, changes, revision):
+    # changes: {task_id: {campo: valor}}; devuelve {task_id: tarea} de las existentes
+    previous = {row.id: row for row in session.execute(
+        select(Task.id, Task.completed, Task.priority, Task.created_at, Task.completed_at)
+        .where(Task.user_id == user_id, Task.id.in_(changes)))}
+    if not previous:
+        return {}
+    now = datetime.utcnow()
+    rows = []
+    stats = TaskStatsDelta()
+    for task_id, values in changes.items():
+        old = previous.get(task_id)
+        if old is None:
+            continue
+        # values puede traer updated_at (momento del PUT agrupado por WriteBehindBuffer)
+        row = dict(values, id=task_id, revision=revision)
+        row.setdefault('updated_at', now)
+        completed = bool(values.get('completed', old.completed))
+        if completed != old.completed:
+            row['completed_at'] = row['updated_at'] if completed else None
+        stats.add(old.completed, old.priority, old.created_at, old.completed_at, -1)
+        stats.add(completed, values.get('priority', old.priority), old.created_at,
+                  row.get('completed_at', old.completed_at))
+        rows.append(row)
+    session.execute(update(Task), rows)
+    stats.apply(session, user_id)
+    result = session.execute(
+        select(*[getattr(Task, f) for f in TASK_FIELDS]).where(Task.id.in_(previous)))
+    return {row.id: task_row_to_dict(row, TASK_FIELDS) for row in result}
+
+def bulk_delete_tasks(session, user_id, task_ids, revision):
+    # Baja lógica (UPDATE ... SET deleted_at); devuelve los ids que seguían vivos
+    deleted = session.execute(
+        update(Task).where(Task.user_id == user_id, Task.id.in_(task_ids))
+        .values(deleted_at=datetime.utcnow(), revision=revision)
+        .returning(Task.id, Task.completed, Task.priority)).all()
+    if deleted:
+        stats = TaskStatsDelta()
+        for row in deleted:
+            stats.discard(row.completed, row.priority)
+        stats.apply(session, user_id)
+    return {row.id for row in deleted}
+
+def rebuild_task_stats(session, user_id=None):
+    # Recalcula los resúmenes desde task con GROUP BY (reparación, no camino normal).
+    # Los SELECT dentro de INSERT ... FROM SELECT no pasan por exclude_deleted_tasks:
+    # task_stat cuenta solo las tareas vivas y task_daily_stat también las bajas que
+    # no se han purgado (las purgadas ya no se pueden recontar).
+    def scoped(query, model, live=True):
+        if model is Task and live:
+            query = query.where(Task.deleted_at.is_(None))
+        return query.where(model.user_id == user_id) if user_id is not None else query
+
+    # Tareas completadas antes de existir completed_at: se toma updated_at
+    session.execute(scoped(update(Task), Task, live=False)
+                    .where(Task.completed.is_(True), Task.completed_at.is_(None))
+                    .values(completed_at=Task.updated_at)
+                    .execution_options(include_deleted=True))
+    session.execute(scoped(delete(TaskStat), TaskStat))
+    session.execute(scoped(delete(TaskDailyStat), TaskDailyStat))
+    session.execute(insert(TaskStat).from_select(
+        ['user_id', 'completed', 'priority', 'count'],
+        scoped(select(Task.user_id, Task.completed, Task.priority, func.count()), Task)
+        .group_by(Task.user_id, Task.completed, Task.priority)))
+    events = scoped(select(Task.user_id, func.date(Task.created_at).label('day'),
+                           literal(1).label('created'), literal(0).label('completed')),
+                    Task, live=False).union_all(
+        scoped(select(Task.user_id, func.date(Task.completed_at), literal(0), literal(1)),
+               Task, live=False)
+        .where(Task.completed.is_(True), Task.completed_at.isnot(None))).subquery()
+    session.execute(insert(TaskDailyStat).from_select(
+        ['user_id', 'day', 'created', 'completed'],
+        select(events.c.user_id, events.c.day, func.sum(events.c.created), func.sum(events.c.completed))
+        .group_by(events.c.user_id, events.c.day)))
+
+@app.cli.command('stats-rebuild')
+@click.option('--user-id', type=int, default=None, help='Solo este usuario')
+def stats_rebuild_command(user_id):
+    """Recalcula TaskStat y TaskDailyStat desde la tabla task."""
+    rebuild_task_stats(db.session, user_id)
+    db.session.commit()
+    click.echo('Task stats rebuilt')
+
+# Purga de bajas lógicas y compactación. Cada lote es una transacción corta, de
+# modo que el bloqueo de escritura se libera entre lotes.
+def purge_deleted_tasks(older_than, batch_size):
+    purged = 0
+    users = User.__table__
+    while True:
+        with engine.connect().execution_options(sqlite_immediate=True) as conn, conn.begin():
+            rows = conn.execute(
+                select(Task.id, Task.user_id, Task.revision)
+                .where(Task.deleted_at < older_than)
+                .order_by(Task.deleted_at).limit(batch_size)).all()
+            if not rows:
+                break
+            horizons = {}
+            for row in rows:
+                horizons[row.user_id] = max(horizons.get(row.user_id, 0), row.revision)
+            # /changes desde una revisión anterior ya no puede listar estas bajas
+            conn.execute(
+                update(users).where(users.c.id == bindparam('uid'))
+                .values(purged_revision=case(
+                    (users.c.purged_revision < bindparam('horizon'), bindparam('horizon')),
+                    else_=users.c.purged_revision)),
+                [{'uid': uid, 'horizon': horizon} for uid, horizon in horizons.items()])
+            conn.execute(delete(Task).where(Task.id.in_([row.id for row in rows])))
+        purged += len(rows)
+        if len(rows) < batch_size:
+            break
+    return purged
+
+def compact_database(full=False):
+    # SQLite: devuelve como mucho SQLITE_VACUUM_PAGES páginas libres al sistema
+    # (incremental_vacuum, sin reescribir el archivo) y refresca las estadísticas
+    # del planificador con PRAGMA optimize acotado por analysis_limit. full=True
+    # hace un VACUUM completo, que bloquea la BD pero convierte una BD existente a
+    # auto_vacuum incremental. PostgreSQL: ANALYZE (autovacuum recupera el espacio).
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # Fuera de transacción (VACUUM no se permite dentro) y con executescript,
+            # que ejecuta incremental_vacuum hasta el final: execute() libera una página
+            raw = conn.connection.dbapi_connection
+            if full:
+                raw.execute('VACUUM')
+            free_pages = raw.execute('PRAGMA freelist_count').fetchone()[0]
+            if free_pages:
+                raw.executescript(f"PRAGMA incremental_vacuum({app.config['SQLITE_VACUUM_PAGES']})")
+            raw.execute(f"PRAGMA analysis_limit={app.config['SQLITE_ANALYSIS_LIMIT']}")
+            raw.execute('PRAGMA optimize')
+            return {'free_pages': free_pages,
+                    'free_pages_after': raw.execute('PRAGMA freelist_count').fetchone()[0]}
+        conn.exec_driver_sql('ANALYZE task')
+        conn.commit()
+        return {}
+
+@background_job('TASK_PURGE_INTERVAL')
+def purge_task_tombstones():
+    older_than = datetime.utcnow() - timedelta(days=app.config['TASK_TOMBSTONE_RETENTION_DAYS'])
+    if purge_deleted_tasks(older_than, app.config['TASK_PURGE_BATCH_SIZE']):
+        compact_database()
+
+@app.cli.command('tasks-purge')
+@click.option('--retention-days', type=int, default=None, help='Por defecto TASK_TOMBSTONE_RETENTION_DAYS')
+def tasks_purge_command(retention_days):
+    """Elimina físicamente las tareas dadas de baja hace más de N días."""
+    days = app.config['TASK_TOMBSTONE_RETENTION_DAYS'] if retention_days is None else retention_days
+    purged = purge_deleted_tasks(datetime.utcnow() - timedelta(days=days), app.config['TASK_PURGE_BATCH_SIZE'])
+    click.echo(json.dumps({'purged': purged, **compact_database()}))
+
+@app.cli.command('db-compact')
+@click.option('--full', is_flag=True, help='VACUUM completo (bloquea la BD mientras dura)')
+def db_compact_command(full):
+    """Libera páginas libres y actualiza las estadísticas del planificador."""
+    click.echo(json.dumps(compact_database(full)))
+
+# Migraciones de esquema versionadas. Se aplican una vez por despliegue (flask
+# db-upgrade, o el master de gunicorn al arrancar) dentro de una transacción con
+# bloqueo; los workers solo comprueban la versión y las peticiones nunca hacen DDL.
+# Una BD nueva se crea desde los modelos y se marca con la última versión; una BD
+# creada con create_all por versiones anteriores recorre todas las migraciones,
+# que por eso comprueban lo que ya existe antes de cambiarlo.
+MIGRATION_LOCK_ID = 0x7461736b  # pg_advisory_xact_lock
+migrations = []
+
+def migration(version, description):
+    def register(func):
+        migrations.append((version, description, func))
+        return func
+    return register
+
+def add_missing_column(conn, table_name, column, ddl_suffix=''):
+    inspector = inspect(conn)
+    if column.name in {c['name'] for c in inspector.get_columns(table_name)}:
+        return False
+    preparer = conn.dialect.identifier_preparer
+    conn.exec_driver_sql(f'ALTER TABLE {preparer.quote(table_name)} ADD COLUMN '
+                         f'{preparer.quote(column.name)} {column.type.compile(conn.dialect)} {ddl_suffix}')
+    return True
+
+@migration(1, 'Revision, completion and soft-delete columns')
+def migrate_task_columns(conn):
+    add_missing_column(conn, 'user', User.task_revision, 'DEFAULT 0 NOT NULL')
+    add_missing_column(conn, 'user', User.purged_revision, 'DEFAULT 0 NOT NULL')
+    add_missing_column(conn, 'task', Task.revision, 'DEFAULT 0 NOT NULL')
+    add_missing_column(conn, 'task', Task.completed_at)
+    add_missing_column(conn, 'task', Task.deleted_at)
+
+# Índices de Task que crea una migración posterior a la 2 (con sus columnas)
+LATER_TASK_INDEXES = {'ix_task_user_position': 5}
+
+@migration(2, 'Partial task indexes')
+def migrate_task_indexes(conn):
+    # Los índices de versiones anteriores no eran parciales: se recrean todos
+    for index in Task.__table__.indexes:
+        if index.name not in LATER_TASK_INDEXES:
+            index.drop(conn, checkfirst=True)
+            index.create(conn)
+
+@migration(3, 'Summary and token tables')
+def migrate_new_tables(conn):
+    # Solo las tablas de esta versión: create_all sin `tables` crearía las de la
+    # versión actual y el resultado dependería de cuándo se migra
+    created = not inspect(conn).has_table(TaskStat.__tablename__)
+    db.metadata.create_all(conn, checkfirst=True, tables=[
+        TaskStat.__table__, TaskDailyStat.__table__, RefreshToken.__table__, RevokedToken.__table__])
+    if created:
+        with Session(bind=conn) as session:
+            rebuild_task_stats(session)
+
+@migration(4, 'Full-text search index')
+def migrate_search_index(conn):
+    install_search_index(conn)
+
+@migration(5, 'Task position keys')
+def migrate_task_positions(conn, batch_size=10000):
+    # Las tareas existentes conservan el orden de alta (id) de cada usuario. La
+    # columna queda admitiendo NULL en SQLite (ALTER TABLE no puede cambiarlo), pero
+    # toda fila tiene clave y la app siempre la escribe.
+    add_missing_column(conn, 'task', Task.position)
+    last_keys = {}
+    last_id = 0
+    while True:
+        rows = conn.execute(select(Task.id, Task.user_id).where(Task.id > last_id, Task.position.is_(None))
+                            .order_by(Task.id).limit(batch_size)).all()
+        if not rows:
+            break
+        params = []
+        for task_id, user_id in rows:
+            last_keys[user_id] = position_key_between(last_keys.get(user_id), None)
+            params.append({'task_id': task_id, 'key': last_keys[user_id]})
+        conn.execute(update(Task.__table__).where(Task.id == bindparam('task_id'))
+                     .values(position=bindparam('key'), updated_at=Task.updated_at), params)
+        last_id = rows[-1].id
+    for index in Task.__table__.indexes:
+        if LATER_TASK_INDEXES.get(index.name) == 5:
+            index.create(conn, checkfirst=True)
+
+SCHEMA_VERSION = max(version for version, _, _ in migrations)
+
+def current_schema_version(conn):
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+def migrate_database(bind=None):
+    # Aplica las migraciones pendientes; devuelve las versiones aplicadas
+    bind = bind if bind is not None else engine
+    with bind.connect().execution_options(sqlite_immediate=True) as conn, conn.begin():
+        # Un solo proceso migra: BEGIN IMMEDIATE en SQLite, bloqueo consultivo en PostgreSQL
+        if conn.dialect.name == 'postgresql':
+            conn.execute(select(func.pg_advisory_xact_lock(MIGRATION_LOCK_ID)))
+        current = current_schema_version(conn)
+        now = datetime.utcnow()
+        if current == 0 and not inspect(conn).has_table(User.__tablename__):
+            db.metadata.create_all(conn)
+            conn.execute(insert(SchemaVersion).values(
+                version=SCHEMA_VERSION, description='Initial schema', applied_at=now))
+            # Una BD recreada vuelve a empezar en las mismas revisiones
+            response_cache.clear()
+            return [SCHEMA_VERSION]
+        SchemaVersion.__table__.create(conn, checkfirst=True)
+        applied = []
+        for version, description, upgrade in sorted(migrations, key=operator.itemgetter(0)):
+            if version > current:
+                upgrade(conn)
+                conn.execute(insert(SchemaVersion).values(
+                    version=version, description=description, applied_at=now))
+                applied.append(version)
+        return applied
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+def check_schema_version(bind=None):
+    # Comprobación de arranque de cada worker: una lectura, nunca DDL
+    with (bind if bind is not None else engine).connect() as conn:
+        current = current_schema_version(conn)
+    if current < SCHEMA_VERSION:
+        raise SchemaOutdated(f'Database schema is at version {current}, expected {SCHEMA_VERSION}: '
+                             'run "flask --app app db-upgrade"')
+    return current
+
+def finish_worker_boot(boot_seconds):
+    # Llamado por gunicorn.conf.py cuando el worker ha cargado la app
+    check_schema_version()
+    metrics.observe('taskflow_worker_boot_seconds', boot_seconds)
+    if boot_seconds > app.config['WORKER_BOOT_BUDGET']:
+        app.logger.warning('Worker boot took %.2f s (budget %.2f s)',
+                           boot_seconds, app.config['WORKER_BOOT_BUDGET'])
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Aplica las migraciones de esquema pendientes."""
+    applied = migrate_database()
+    click.echo(json.dumps({'applied': applied, 'version': SCHEMA_VERSION}))
+
+@app.cli.command('db-version')
+def db_version_command():
+    """Muestra la versión de esquema de la BD y la que espera el código."""
+    with engine.connect() as conn:
+        click.echo(json.dumps({'current': current_schema_version(conn), 'expected': SCHEMA_VERSION}))
+
+# Revisión de la colección y ETags
+def bump_task_revision(session, user_id):
+    # Incremento atómico; todos los cambios de la transacción comparten la revisión.
+    # Al confirmar se invalidan las respuestas en caché del usuario (ver ResponseCache)
+    # y se avisa a sus conexiones de GET /api/tasks/stream (ver ChangeBus).
+    revision = session.execute(
+        update(User).where(User.id == user_id)
+        .values(task_revision=User.task_revision + 1)
+        .returning(User.task_revision)).scalar_one()
+    session.info.setdefault('changed_task_users', {})[user_id] = revision
+    return revision
+
+def current_task_revision(session, user_id):
+    return session.scalar(select(User.task_revision).where(User.id == user_id))
+
+def collection_etag(user_id, revision, args):
+    # ETag fuerte: depende del usuario, la revisión y los parámetros de la petición
+    query = sorted(args.items(multi=True))
+    digest = hashlib.sha1(json.dumps(query).encode()).hexdigest()[:16]
+    return f'{user_id}-{revision}-{digest}'
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+class ChangesExpired(Exception):
+    # `since` es anterior a bajas ya purgadas: el cliente debe resincronizar (410)
+    pass
+
+def changes_cutoff(session, user_id, since, limit, revision):
+    # Última revisión a incluir para devolver como mucho `limit` cambios, sin
+    # partir nunca una revisión (un lote completo se entrega junto)
+    pending = session.scalars(
+        select(Task.revision).where(Task.user_id == user_id, Task.revision > since)
+        .order_by(Task.revision).limit(limit + 1)
+        .execution_options(include_deleted=True)).all()
+    upto = pending[limit - 1] if len(pending) > limit else revision
+    return upto, upto < revision
+
+# Lógica de los endpoints de tareas, común a las rutas Flask y a asgi.py.
+# Lanzan ValueError ante parámetros inválidos (400) y no hacen commit.
+def list_tasks_page(session, user_id, args, revision):
+    fields = parse_fields_arg(args.get('fields'))
+    limit = parse_limit_arg(args.get('limit'))
+    order = parse_order_arg(args.get('order'))
+    key = TASK_ORDERS[order]
+    conditions = task_filters(user_id, args)
+    if args.get('cursor'):
+        conditions.append(tuple_(key, Task.id) > decode_cursor(args['cursor'], order))
+
+    # Se seleccionan solo las columnas pedidas más la clave del cursor
+    columns = [getattr(Task, f) for f in fields] + [key, Task.id]
+    query = (select(*columns)
+             .where(*conditions)
+             .order_by(key, Task.id)
+             .limit(limit + 1))
+    rows = session.execute(query).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-2], rows[-1][-1])
+
+    return {
+        'tasks': [task_row_to_dict(row, fields) for row in rows],
+        'next_cursor': next_cursor,
+        'revision': revision
+    }
+
+def list_task_changes(session, user_id, args, revision):
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise ValueError('Invalid value for since: expected an integer') from None
+    limit = parse_limit_arg(args.get('limit'))
+    if since > 0 and since < session.scalar(select(User.purged_revision).where(User.id == user_id)):
+        raise ChangesExpired(f'Changes since revision {since} are no longer available; '
+                             'fetch the full list with since=0')
+
+    # Altas, cambios y bajas salen de la misma consulta por (user_id, revision)
+    upto, has_more = changes_cutoff(session, user_id, since, limit, revision)
+    rows = session.execute(
+        select(*[getattr(Task, f) for f in TASK_FIELDS], Task.deleted_at)
+        .where(Task.user_id == user_id, Task.revision > since, Task.revision <= upto)
+        .order_by(Task.revision, Task.id)
+        .execution_options(include_deleted=True)).all()
+
+    return {
+        'revision': upto,
+        'has_more': has_more,
+        'deleted': [row.id for row in rows if row.deleted_at is not None],
+        'tasks': [task_row_to_dict(row[:-1], TASK_FIELDS) for row in rows if row.deleted_at is None]
+    }
+
+# Marcas de coincidencia internas; se sustituyen por <mark> tras escapar el texto
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+def parse_search_query(value):
+    # Palabras (con * final opcional para buscar por prefijo), todas obligatorias
+    terms = [(term.rstrip('*'), term.endswith('*')) for term in re.findall(r'\w+\*?', value or '')]
+    if not terms:
+        raise ValueError('Search query q is required')
+    if len(terms) > 16:
+        raise ValueError('Search query is too long: at most 16 words')
+    return terms
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+def search_page_ids(session, id_column, conditions, rank_order, limit, offset):
+    # Hasta limit + 1 ids de coincidencias a partir de offset. Con términos muy
+    # frecuentes solo se ordenan por relevancia las SEARCH_RANK_WINDOW más recientes
+    # (puntuar todas costaría cientos de ms); las anteriores siguen en los
+    # resultados detrás de ellas, de la más reciente a la más antigua.
+    window = app.config['SEARCH_RANK_WINDOW']
+    floor, ranked = None, 0
+    if window:
+        newest = (select(id_column.label('id')).where(*conditions)
+                  .order_by(id_column.desc()).limit(window).subquery())
+        floor, ranked = session.execute(select(func.min(newest.c.id), func.count()).select_from(newest)).one()
+        if ranked < window:
+            floor = None  # Caben todas en la ventana
+    ids = []
+    if floor is None or offset < ranked:
+        bounded = [id_column >= floor] if floor is not None else []
+        ids = session.scalars(select(id_column).where(*conditions, *bounded)
+                              .order_by(rank_order, id_column).limit(limit + 1).offset(offset)).all()
+    if floor is not None and len(ids) <= limit:
+        ids += session.scalars(select(id_column).where(*conditions, id_column < floor)
+                               .order_by(id_column.desc())
+                               .limit(limit + 1 - len(ids)).offset(max(offset - ranked, 0))).all()
+    return ids
+
+def search_tasks_page(session, user_id, args, revision):
+    terms = parse_search_query(args.get('q'))
+    limit = parse_limit_arg(args.get('limit'))
+    try:
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('Invalid value for offset: expected an integer') from None
+    if offset < 0:
+        raise ValueError('Invalid value for offset: must not be negative')
+
+    columns = [getattr(Task, f) for f in TASK_FIELDS]
+    tokens = app.config['SEARCH_SNIPPET_TOKENS']
+    if session.get_bind().dialect.name == 'postgresql':
+        config = cast(literal(app.config['SEARCH_TS_CONFIG']), REGCONFIG)
+        tsquery = func.to_tsquery(config, ' & '.join(
+            f'{term}:*' if prefix else term for term, prefix in terms))
+        vector = literal_column('task.search_vector')
+        ids = search_page_ids(session, Task.id, [Task.user_id == user_id, vector.op('@@')(tsquery)],
+                              func.ts_rank_cd(vector, tsquery).desc(), limit, offset)
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        # ts_headline solo se calcula para las filas de la página
+        options = (f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, '
+                   f'MaxWords={tokens}, MinWords={max(tokens // 3, 1)}')
+        found = {row.id: row for row in session.execute(
+            select(*columns,
+                   func.ts_headline(config, Task.title, tsquery, options),
+                   func.ts_headline(config, func.coalesce(Task.description, ''), tsquery, options))
+            .where(Task.user_id == user_id, Task.id.in_(ids)))} if ids else {}
+    else:
+        # Columnas: title, description, owner; bm25 pondera más el título
+        phrase = ' AND '.join('"{}"{}'.format(term, '*' if prefix else '') for term, prefix in terms)
+        fts = table('task_fts', column('rowid'))
+        fts_ref = literal_column('task_fts')
+        match = fts_ref.op('MATCH')(f'owner : u{int(user_id)} AND {{title description}} : ({phrase})')
+        ids = search_page_ids(session, fts.c.rowid, [match], func.bm25(fts_ref, 10.0, 1.0, 0.0),
+                              limit, offset)
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        # Los fragmentos se generan solo para las filas de la página. FTS5 repite la
+        # consulta por cada valor de un `rowid IN`, así que recorre el rango y el IN
+        # se evalúa fuera del índice (rowid + 0)
+        found = {row.id: row for row in session.execute(
+            select(*columns,
+                   func.snippet(fts_ref, 0, SNIPPET_START, SNIPPET_END, '…', tokens),
+                   func.snippet(fts_ref, 1, SNIPPET_START, SNIPPET_END, '…', tokens))
+            .join_from(Task, fts, fts.c.rowid == Task.id)
+            .where(match, Task.user_id == user_id, fts.c.rowid.between(min(ids), max(ids)),
+                   (fts.c.rowid + 0).in_(ids)))} if ids else {}
+    rows = [found[task_id] for task_id in ids if task_id in found]
+
+    tasks = []
+    for row in rows[:limit]:
+        task = task_row_to_dict(row[:len(TASK_FIELDS)], TASK_FIELDS)
+        task['highlight'] = {'title': highlight(row[-2]), 'description': highlight(row[-1])}
+        tasks.append(task)
+    return {
+        'tasks': tasks,
+        'next_offset': offset + limit if has_more else None,
+        'revision': revision
+    }
+
+def task_stats(session, user_id, args):
+    # Lee solo los resúmenes materializados: coste independiente del número de tareas
+    try:
+        days = int(args.get('days', app.config['STATS_DAYS']))
+    except ValueError:
+        raise ValueError('Invalid value for days: expected an integer') from None
+    if not 1 <= days <= app.config['STATS_MAX_DAYS']:
+        raise ValueError(f"Invalid value for days: must be between 1 and {app.config['STATS_MAX_DAYS']}")
+
+    by_priority = {}
+    for completed, priority, count in session.execute(
+            select(TaskStat.completed, TaskStat.priority, TaskStat.count)
+            .where(TaskStat.user_id == user_id, TaskStat.count != 0)):
+        counts = by_priority.setdefault(priority, {'completed': 0, 'pending': 0, 'total': 0})
+        counts['completed' if completed else 'pending'] += count
+        counts['total'] += count
+    total = sum(c['total'] for c in by_priority.values())
+    completed = sum(c['completed'] for c in by_priority.values())
+
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
+    daily = {day: (created, done) for day, created, done in session.execute(
+        select(TaskDailyStat.day, TaskDailyStat.created, TaskDailyStat.completed)
+        .where(TaskDailyStat.user_id == user_id, TaskDailyStat.day >= first_day))}
+    series = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        created, done = daily.get(day, (0, 0))
+        series.append({'date': day.isoformat(), 'created': created, 'completed': done})
+
+    return {
+        'total': total,
+        'completed': completed,
+        'pending': total - completed,
+        'completion_rate': round(completed / total, 4) if total else 0.0,
+        'by_priority': by_priority,
+        'daily': series
+    }
+
+def create_one_task(session, user_id, data):
+    # POST /api/tasks no acepta `completed`: toda tarea nueva empieza pendiente
+    item = task_values(data, ('title', 'description', 'priority'))
+    return bulk_create_tasks(session, user_id, [item], bump_task_revision(session, user_id))[0]
+
+def update_one_task(session, user_id, task_id, data):
+    # None si la tarea no existe o es de otro usuario (quien llama hace rollback)
+    values = task_values(data)
+    revision = bump_task_revision(session, user_id)
+    return bulk_update_tasks(session, user_id, {task_id: values}, revision).get(task_id)
+
+def delete_one_task(session, user_id, task_id):
+    revision = bump_task_revision(session, user_id)
+    return task_id in bulk_delete_tasks(session, user_id, [task_id], revision)
+
+def apply_task_batch(session, user_id, operations):
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('A non-empty operations list is required')
+    if len(operations) > app.config['TASKS_BATCH_MAX']:
+        raise ValueError(f"At most {app.config['TASKS_BATCH_MAX']} operations per batch")
+
+    # Se validan todas las operaciones (forma, tipos y valores); las inválidas
+    # fallan con 400 sin afectar al resto.
+    # Orden de ejecución: creaciones, actualizaciones y eliminaciones.
+    results = [None] * len(operations)
+    creates, updates, deletes = [], {}, set()
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op == 'create':
+            if not operation.get('title'):
+                results[index] = {'op': op, 'status': 400, 'message': 'Title is required'}
+                continue
+            try:
+                creates.append((index, task_values(operation)))
+            except ValueError as e:
+                results[index] = {'op': op, 'status': 400, 'message': str(e)}
+        elif op in ('update', 'delete'):
+            task_id = operation.get('id')
+            if not isinstance(task_id, int) or isinstance(task_id, bool):
+                results[index] = {'op': op, 'status': 400, 'message': 'Task id is required'}
+            elif op == 'update':
+                try:
+                    values = task_values(operation)
+                except ValueError as e:
+                    results[index] = {'op': op, 'id': task_id, 'status': 400, 'message': str(e)}
+                    continue
+                updates.setdefault(task_id, {}).update(values)
+                results[index] = {'op': op, 'id': task_id}
+            else:
+                deletes.add(task_id)
+                results[index] = {'op': op, 'id': task_id}
+        else:
+            results[index] = {'op': op, 'status': 400, 'message': 'Unknown operation'}
+
+    # Todo se ejecuta en una única transacción y con una sola revisión
+    revision = bump_task_revision(session, user_id) if creates or updates or deletes else None
+    if creates:
+        created = bulk_create_tasks(session, user_id, [item for _, item in creates], revision)
+        for (index, _), task in zip(creates, created):
+            results[index] = {'op': 'create', 'status': 201, 'task': task}
+    updated = bulk_update_tasks(session, user_id, updates, revision) if updates else {}
+    deleted = bulk_delete_tasks(session, user_id, list(deletes), revision) if deletes else set()
+
+    for result in results:
+        if result.get('status'):
+            continue
+        task_id = result['id']
+        if result['op'] == 'update' and task_id in updated:
+            result.update(status=200, task=updated[task_id])
+        elif result['op'] == 'delete' and task_id in deleted:
+            result['status'] = 200
+        else:
+            result.update(status=404, message='Task not found')
+    for index, result in enumerate(results):
+        result['index'] = index
+    return results
+
+# Orden manual. Mover una tarea es un UPDATE de su fila: la nueva clave queda entre
+# las de sus vecinas, que se leen por el índice (user_id, position).
+def last_task_position(session, user_id):
+    return session.scalar(select(Task.position).where(Task.user_id == user_id)
+                          .order_by(Task.position.desc()).limit(1))
+
+def neighbour_position(session, user_id, task_id, position, after):
+    # Clave inmediatamente posterior (after=True) o anterior a position, sin contar
+    # la tarea que se mueve; position None = desde el principio o el final
+    column = Task.position
+    query = select(column).where(Task.user_id == user_id, Task.id != task_id)
+    if position is not None:
+        query = query.where(column > position if after else column < position)
+    return session.scalar(query.order_by(column if after else column.desc()).limit(1))
+
+def move_one_task(session, user_id, task_id, data):
+    # {"after": id} o {"before": id}; null = al principio o al final. None si la
+    # tarea no existe (quien llama hace rollback)
+    if not isinstance(data, dict) or len({'after', 'before'} & data.keys()) != 1:
+        raise ValueError('Exactly one of after or before is required')
+    after = 'after' in data
+    anchor_id = data['after' if after else 'before']
+    if anchor_id is not None and (not isinstance(anchor_id, int) or isinstance(anchor_id, bool)):
+        raise ValueError('after and before must be a task id or null')
+    if anchor_id == task_id:
+        raise ValueError('A task cannot be moved relative to itself')
+
+    # La revisión se sube antes de leer las vecinas: el UPDATE bloquea la fila del
+    # usuario hasta el commit, así que dos movimientos concurrentes al mismo hueco
+    # no calculan la misma clave
+    revision = bump_task_revision(session, user_id)
+    for attempt in range(2):
+        anchor = None
+        if anchor_id is not None:
+            anchor = session.scalar(select(Task.position).where(Task.user_id == user_id, Task.id == anchor_id))
+            if anchor is None:
+                raise ValueError('Reference task not found')
+        # Otra tarea con la misma clave que la de referencia (escrita sin el bloqueo):
+        # "después de X" quedaría detrás de todas las empatadas
+        tied = anchor is not None and session.scalar(
+            select(Task.id).where(Task.user_id == user_id, Task.position == anchor,
+                                  Task.id.not_in((task_id, anchor_id))).limit(1)) is not None
+        if not tied:
+            # after X: entre X y su siguiente; after null: antes de la primera (y al revés)
+            neighbour = neighbour_position(session, user_id, task_id, anchor, after)
+            position = position_key_between(*((anchor, neighbour) if after else (neighbour, anchor)))
+            if len(position) <= POSITION_KEY_SIZE:
+                break
+        if attempt:
+            raise RuntimeError(f'Could not compute a position key for task {task_id}')
+        # Claves empatadas o una clave que no cabe en la columna: se reparte ya, en
+        # la misma transacción, y se vuelve a calcular
+        rebalance_task_positions(session, user_id)
+        revision = bump_task_revision(session, user_id)
+    if len(position) > app.config['POSITION_MAX_LENGTH']:
+        request_position_rebalance(user_id)
+    return bulk_update_tasks(session, user_id, {task_id: {'position': position}}, revision).get(task_id)
+
+def rebalance_task_positions(session, user_id):
+    # Claves cortas y equidistantes ('a0', 'a1', ...) conservando el orden. Solo se
+    # escriben las que cambian, con una revisión nueva para que /changes y los
+    # streams las envíen; updated_at no cambia.
+    rows = session.execute(select(Task.id, Task.position).where(Task.user_id == user_id)
+                           .order_by(Task.position, Task.id)).all()
+    changed = [{'task_id': row.id, 'key': key}
+               for row, key in zip(rows, position_keys_after(None, len(rows))) if row.position != key]
+    if changed:
+        revision = bump_task_revision(session, user_id)
+        session.execute(update(Task.__table__).where(Task.id == bindparam('task_id')).values(
+            position=bindparam('key'), revision=revision, updated_at=Task.updated_at), changed)
+    return len(changed)
+
+# Usuarios con claves largas pendientes de repartir -> peticiones recibidas (por
+# proceso, ver move_one_task)
+_positions_to_rebalance = {}
+_positions_lock = threading.Lock()
+
+def request_position_rebalance(user_id):
+    if app.config['POSITION_REBALANCE_INTERVAL'] > 0:
+        with _positions_lock:
+            _positions_to_rebalance[user_id] = _positions_to_rebalance.get(user_id, 0) + 1
+
+@background_job('POSITION_REBALANCE_INTERVAL')
+def rebalance_long_positions():
+    with _positions_lock:
+        pending = dict(_positions_to_rebalance)
+    for user_id, requests in pending.items():
+        # Una transacción corta por usuario; si falla sigue en la cola para la
+        # siguiente vuelta y no afecta a los demás
+        try:
+            with Session(engine.execution_options(sqlite_immediate=True)) as session:
+                rebalance_task_positions(session, user_id)
+                session.commit()
+        except Exception:
+            app.logger.exception('Position rebalance failed for user %s', user_id)
+            continue
+        with _positions_lock:
+            # Un movimiento posterior al reparto vuelve a pedirlo
+            if _positions_to_rebalance.get(user_id) == requests:
+                del _positions_to_rebalance[user_id]
+
+@app.cli.command('tasks-rebalance')
+@click.option('--user-id', type=int, default=None, help='Solo este usuario')
+def tasks_rebalance_command(user_id):
+    """Reparte las claves de orden de los usuarios con claves más largas que POSITION_MAX_LENGTH."""
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = db.session.scalars(
+            select(Task.user_id).distinct()
+            .where(func.length(Task.position) > app.config['POSITION_MAX_LENGTH'])).all()
+    rebalanced = 0
+    for uid in user_ids:
+        rebalanced += rebalance_task_positions(db.session, uid)
+        db.session.commit()
+    click.echo(json.dumps({'users': len(user_ids), 'rebalanced': rebalanced}))
+
+class WriteBehindBuffer:
+    """Agrupa en memoria los PUT /api/tasks/<id> de este proceso.
+
+    Cada tarea acumula sus cambios ya validados (gana el último valor de cada
+    campo) junto con la fila leída en el primer PUT, así que los siguientes no
+    tocan la BD. Cada `window` segundos se vuelca todo, cada usuario en su propia
+    transacción: un UPDATE por tarea y una revisión por usuario. Cualquier otra
+    petición autenticada del mismo usuario *en este proceso* vuelca antes sus
+    cambios pendientes (lee lo que escribió); los demás workers no los ven hasta
+    el volcado. Una tarea que no se puede escribir se reintenta en los siguientes
+    volcados y tras `max_attempts` fallos se descarta y se registra en el log.
+    """
+
+    def __init__(self, window, max_attempts=3):
+        self.window = window
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Un volcado a la vez
+        self._pending = {}  # user_id -> {task_id: {'task': dict, 'values': dict, 'attempts': int}}
+        self._flushing = set()
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def has_pending(self, user_id):
+        with self._lock:
+            return user_id in self._pending or user_id in self._flushing
+
+    def update(self, session, user_id, task_id, data):
+        # Devuelve la tarea con los cambios aplicados, o None si no existe. Los
+        # valores se validan aquí: uno inválido no debe llegar al volcado.
+        values = task_values(data)
+        task = None
+        while True:
+            with self._lock:
+                entry = self._pending.get(user_id, {}).get(task_id)
+                if entry is None and task is not None:
+                    entry = self._pending.setdefault(user_id, {})[task_id] = {
+                        'task': task, 'values': {}, 'attempts': 0}
+                if entry is not None:
+                    now = datetime.utcnow()
+                    entry['values'].update(values, updated_at=now)
+                    entry['task'].update(values, updated_at=format_datetime(now))
+                    return dict(entry['task'])
+            # Primer cambio de la tarea en esta ventana: se lee la fila una sola vez
+            row = session.execute(
+                select(*[getattr(Task, f) for f in TASK_FIELDS])
+                .where(Task.id == task_id, Task.user_id == user_id)).first()
+            if row is None:
+                return None
+            task = task_row_to_dict(row, TASK_FIELDS)
+
+    def flush(self, user_id=None):
+        # Vuelca los cambios de un usuario (o de todos); devuelve cuántas tareas
+        # escribió. No lanza: un usuario que falla no bloquea a los demás.
+        with self._flush_lock:
+            with self._lock:
+                if user_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {user_id: self._pending.pop(user_id)} if user_id in self._pending else {}
+                self._flushing.update(batch)
+            written = 0
+            try:
+                for uid, tasks in batch.items():
+                    written += self._flush_user(uid, tasks)
+            finally:
+                with self._lock:
+                    self._flushing.difference_update(batch)
+            return written
+
+    def _flush_user(self, user_id, tasks):
+        try:
+            self._write(user_id, tasks)
+            return len(tasks)
+        except Exception as e:
+            if len(tasks) == 1:
+                errors = {task_id: e for task_id in tasks}
+            else:
+                # Tarea a tarea, para que una que falla no arrastre al resto
+                errors = {}
+                for task_id, entry in tasks.items():
+                    try:
+                        self._write(user_id, {task_id: entry})
+                    except Exception as error:
+                        errors[task_id] = error
+        retry = {}
+        for task_id, error in errors.items():
+            entry = tasks[task_id]
+            entry['attempts'] += 1
+            if entry['attempts'] < self.max_attempts:
+                retry[task_id] = entry
+                continue
+            app.logger.error('Write-behind dropped changes: %s', json.dumps({
+                'user_id': user_id, 'task_id': task_id, 'attempts': entry['attempts'],
+                'values': entry['values'], 'error': f'{type(error).__name__}: {error}'}, default=str))
+        if retry:
+            self._restore({user_id: retry})
+        return len(tasks) - len(errors)
+
+    def _write(self, user_id, tasks):
+        # Sesión propia: no comparte la transacción (de lectura) de la petición
+        with Session(engine.execution_options(sqlite_immediate=True)) as session:
+            changes = {task_id: entry['values'] for task_id, entry in tasks.items()}
+            bulk_update_tasks(session, user_id, changes, bump_task_revision(session, user_id))
+            session.commit()
+
+    def clear(self):
+        # Descarta lo pendiente sin escribirlo (pruebas)
+        with self._lock:
+            self._pending.clear()
+
+    def _restore(self, batch):
+        # Devuelve al buffer lo que no se pudo escribir, sin pisar cambios más nuevos
+        with self._lock:
+            for uid, tasks in batch.items():
+                current = self._pending.setdefault(uid, {})
+                for task_id, entry in tasks.items():
+                    newer = current.get(task_id)
+                    if newer is not None:
+                        entry['values'].update(newer['values'])
+                        entry['task'] = newer['task']
+                    current[task_id] = entry
+
+write_behind = WriteBehindBuffer(app.config['TASK_WRITE_BEHIND_WINDOW'],
+                                 app.config['TASK_WRITE_BEHIND_MAX_ATTEMPTS'])
+
+if write_behind.enabled:
+    app.logger.warning('TASK_WRITE_BEHIND_WINDOW is enabled: buffered PUTs are only visible to other '
+                       'workers after the flush, and are lost if the worker is killed')
+    # El PUT agrupado solo lee; no necesita el bloqueo de escritura de SQLite
+    SQLITE_DEFERRED_ENDPOINTS.add('update_task')
+    # Lo pendiente se escribe al terminar el proceso (gunicorn sale con sys.exit)
+    atexit.register(write_behind.flush)
+
+@background_job('TASK_WRITE_BEHIND_WINDOW')
+def flush_write_behind():
+    write_behind.flush()
+
+# Caché de tokens verificados
+UserPrincipal = namedtuple('UserPrincipal', ['id', 'username'])
+
+class TokenCache:
+    """LRU con TTL: token -> (claims, principal, expira_en).
+
+    Cada entrada vive hasta el `exp` del token o `ttl` segundos, lo que ocurra
+    antes. Es local a cada worker; el TTL acota cuánto tarda un worker en
+    enterarse de un cambio de usuario hecho en otro proceso.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, principal, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return claims, principal
+
+    def put(self, token, claims, principal):
+        if self.maxsize <= 0:
+            return
+        expires_at = min(claims.get('exp', float('inf')), time.time() + self.ttl)
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (claims, principal, expires_at)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, ()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[1].id]
+
+token_cache = TokenCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
+    # Un usuario nuevo puede reutilizar un id (BD recreada o usuario borrado) y
+    # empezar en la misma revisión que las respuestas en caché de aquel
+    response_cache.invalidate([target.id])
+
+# Revocación de access tokens sin consultar la BD en cada petición
+class BloomFilter:
+    """Conjunto aproximado de tamaño fijo: sin falsos negativos, con falsos positivos."""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        # Doble hashing sobre un único blake2b de 128 bits
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+class TokenRevocations:
+    """jti de access tokens revocados, comprobados en memoria con un filtro Bloom.
+
+    La tabla revoked_token es la fuente compartida por todos los workers. Cada
+    proceso carga el filtro en su primera petición, añade cada `sync_interval`
+    segundos las filas recientes y lo reconstruye sin las caducadas cada
+    `rebuild_interval`. Lo revocado en este proceso entra en el filtro al momento.
+    Un negativo es definitivo; un positivo (quizá falso) se confirma en la BD.
+    """
+
+    # Las filas se releen con este margen: cubre transacciones que confirman tarde
+    SYNC_OVERLAP = timedelta(seconds=60)
+
+    def __init__(self, bits, hashes, rebuild_interval):
+        self.bits = bits
+        self.hashes = hashes
+        self.rebuild_interval = rebuild_interval
+        self._filter = BloomFilter(bits, hashes)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_pid = None
+        self._synced_at = None
+        self._built_at = 0.0
+
+    def needs_sync(self):
+        # Este proceso aún no ha cargado el filtro (might_be_revoked consultará la BD)
+        return self._synced_pid != os.getpid()
+
+    def might_be_revoked(self, jti):
+        if jti is None:
+            return False  # Tokens emitidos antes de que existieran los jti
+        if self.needs_sync():
+            try:
+                self.sync()
+            except Exception:
+                app.logger.exception('Token revocation sync failed')
+        return jti in self._filter
+
+    def is_revoked(self, session, jti):
+        return session.execute(
+            select(RevokedToken.id).where(RevokedToken.jti == jti).limit(1)).first() is not None
+
+    def revoke(self, session, entries):
+        # entries: [(jti, caduca_en)]; se confirma con la transacción de la sesión
+        if not entries:
+            return
+        now = datetime.utcnow()
+        session.execute(insert(RevokedToken), [
+            {'jti': jti, 'created_at': now, 'expires_at': expires_at} for jti, expires_at in entries])
+        with self._lock:
+            for jti, _ in entries:
+                self._filter.add(jti)
+
+    def sync(self):
+        with self._sync_lock:
+            now = datetime.utcnow()
+            rebuild = (self._synced_pid != os.getpid()
+                       or time.monotonic() - self._built_at >= self.rebuild_interval)
+            query = select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+            if not rebuild:
+                query = query.where(RevokedToken.created_at >= self._synced_at - self.SYNC_OVERLAP)
+            with engine.connect() as conn:
+                jtis = conn.execute(query).scalars().all()
+            with self._lock:
+                if rebuild:
+                    # Lo revocado aquí durante la consulta vuelve en la próxima sincronización
+                    self._filter = BloomFilter(self.bits, self.hashes)
+                    self._built_at = time.monotonic()
+                for jti in jtis:
+                    self._filter.add(jti)
+                self._synced_pid, self._synced_at = os.getpid(), now
+            return len(jtis)
+
+    def clear(self):
+        with self._lock:
+            self._filter = BloomFilter(self.bits, self.hashes)
+            self._synced_pid = None
+
+revocations = TokenRevocations(app.config['REVOCATION_FILTER_BITS'], app.config['REVOCATION_FILTER_HASHES'],
+                               app.config['ACCESS_TOKEN_TTL'])
+
+@background_job('REVOCATION_SYNC_INTERVAL')
+def sync_token_revocations():
+    revocations.sync()
+
+def issue_tokens(session, user_id, family=None):
+    # Access token corto + refresh token nuevo; al rotar se conserva la familia
+    now = datetime.utcnow()
+    access_jti, refresh_jti = secrets.token_hex(16), secrets.token_hex(16)
+    family = family or refresh_jti
+    access_expires = now + timedelta(seconds=app.config['ACCESS_TOKEN_TTL'])
+    refresh_expires = now + timedelta(seconds=app.config['REFRESH_TOKEN_TTL'])
+    session.add(RefreshToken(jti=refresh_jti, family=family, user_id=user_id, access_jti=access_jti,
+                             created_at=now, expires_at=refresh_expires))
+    secret = app.config['SECRET_KEY']
+    return {
+        'token': jwt.encode({'user_id': user_id, 'jti': access_jti, 'fam': family, 'type': 'access',
+                             'exp': access_expires}, secret, algorithm='HS256'),
+        'refresh_token': jwt.encode({'user_id': user_id, 'jti': refresh_jti, 'fam': family,
+                                     'type': 'refresh', 'exp': refresh_expires}, secret, algorithm='HS256'),
+        'expires_in': app.config['ACCESS_TOKEN_TTL'],
+    }
+
+def revoke_token_family(session, family):
+    # Revoca los refresh tokens de la familia y los access tokens aún vigentes emitidos con ellos
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=app.config['ACCESS_TOKEN_TTL'])
+    rows = session.execute(
+        select(RefreshToken.access_jti, RefreshToken.created_at).where(RefreshToken.family == family)).all()
+    session.execute(update(RefreshToken)
+                    .where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None))
+                    .values(revoked_at=now))
+    revocations.revoke(session, [(row.access_jti, row.created_at + ttl)
+                                 for row in rows if row.created_at + ttl > now])
+
+@background_job('TOKEN_PURGE_INTERVAL')
+def purge_expired_tokens():
+    now = datetime.utcnow()
+    with engine.connect().execution_options(sqlite_immediate=True) as conn, conn.begin():
+        conn.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        conn.execute(delete(RefreshToken).where(RefreshToken.expires_at <= now))
+
+# Hash de contraseñas fuera del hilo de la petición
+class HashingOverloaded(Exception):
+    pass
+
+class PasswordHasher:
+    """Calcula y verifica hashes en un pool de procesos con cola acotada.
+
+    Si ya hay `queue_size` hashes pendientes en este worker se lanza
+    HashingOverloaded en lugar de seguir encolando (0 = sin límite).
+    """
+
+    def __init__(self, method, workers, queue_size):
+        self.method = method
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue_size) if queue_size > 0 else None
+        self._executor = None
+        self._executor_pid = None
+        self._normalized_method = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # Los hashes de Werkzeug empiezan por "metodo:parametros$"
+        if self._normalized_method is None:
+            self._normalized_method = generate_password_hash('', self.method, salt_length=1).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._normalized_method
+
+    def _run(self, func, *args):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise HashingOverloaded()
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return func(*args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                raise
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+            metrics.observe('taskflow_password_hash_seconds', time.perf_counter() - start,
+                            operation=func.__name__)
+
+    def _get_executor(self):
+        # El pool se crea en el primer uso dentro de cada worker (tras el fork)
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self, executor):
+        # Un pool roto no se reutiliza; se cierra para no dejar procesos huérfanos
+        # y el siguiente hash crea otro
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'],
+                                 app.config['PASSWORD_HASH_WORKERS'],
+                                 app.config['PASSWORD_HASH_QUEUE_SIZE'])
+
+def overloaded_response():
+    response = jsonify({'message': 'Server is busy, please retry later'})
+    response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response, 503
+
+# Límite de intentos (token bucket) compartido entre workers
+def parse_rate(value):
+    # "20/60" -> capacidad 20, recarga de 20 fichas cada 60 s
+    try:
+        capacity, period = value.split('/')
+        capacity, period = int(capacity), float(period)
+    except ValueError:
+        raise ValueError(f'Invalid rate {value!r}: expected "<capacity>/<seconds>"') from None
+    if capacity < 1 or period <= 0:
+        raise ValueError(f'Invalid rate {value!r}: capacity and period must be positive')
+    return capacity, capacity / period
+
+class SQLiteBucketStore:
+    """Buckets en una BD SQLite propia, compartida por los workers de la máquina.
+
+    Cada intento es un único UPSERT atómico que recarga el bucket según el tiempo
+    transcurrido, consume una ficha si la hay y devuelve el resultado.
+    """
+
+    TAKE_SQL = """
+        INSERT INTO rate_limit_bucket (key, tokens, updated_at, allowed)
+        VALUES (:key, :capacity - 1, :now, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            tokens = min(:capacity, tokens + max(0, :now - updated_at) * :rate)
+                     - (min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1),
+            allowed = min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1,
+            updated_at = :now
+        RETURNING allowed, tokens
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # Una conexión por hilo y proceso (no se comparten tras un fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_bucket ('
+                         'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated_at REAL NOT NULL, allowed INTEGER NOT NULL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self._connection().execute(
+            self.TAKE_SQL, {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}).fetchone()
+        return bool(allowed), tokens
+
+    def purge(self, older_than):
+        self._connection().execute('DELETE FROM rate_limit_bucket WHERE updated_at < ?', (older_than,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM rate_limit_bucket')
+
+class RedisBucketStore:
+    """Buckets en Redis (o compatible) para limitar entre varias máquinas."""
+
+    TAKE_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = tonumber(state[1]) or capacity
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='taskflow:ratelimit:'):
+        import redis  # Dependencia opcional: pip install redis
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[capacity, rate, now])
+        return bool(allowed), float(tokens)
+
+    def purge(self, older_than):
+        pass  # Las claves caducan solas con EXPIRE
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+class RateLimiter:
+    def __init__(self, store, rules):
+        self.store = store
+        self.rules = rules  # {scope: (capacidad, fichas por segundo)}
+
+    def hit(self, endpoint, scope, value):
+        # Consume una ficha; devuelve los segundos a esperar (0 = permitido)
+        capacity, rate = self.rules[scope]
+        allowed, tokens = self.store.take(f'{endpoint}:{scope}:{value}', capacity, rate, time.time())
+        return 0 if allowed else max(1, math.ceil((1 - tokens) / rate))
+
+    def purge(self):
+        # Un bucket sin uso durante capacidad/rate segundos ya está lleno: se borra
+        idle = max(capacity / rate for capacity, rate in self.rules.values())
+        self.store.purge(time.time() - idle)
+
+def create_rate_limiter():
+    url = app.config['RATELIMIT_STORAGE_URL']
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        store = RedisBucketStore(url)
+    else:
+        store = SQLiteBucketStore(url.replace('sqlite:///', '', 1) if url
+                                  else os.path.join(app.instance_path, 'ratelimit.db'))
+    return RateLimiter(store, {
+        'ip': parse_rate(app.config['RATELIMIT_IP_RATE']),
+        'username': parse_rate(app.config['RATELIMIT_USERNAME_RATE']),
+    })
+
+rate_limiter = create_rate_limiter()
+
+@background_job('RATELIMIT_CLEANUP_INTERVAL')
+def purge_rate_limit_buckets():
+    rate_limiter.purge()
+
+def rate_limited(f):
+    # Se aplica antes de tocar la BD o calcular hashes: solo lee la IP y el username
+    def decorated(*args, **kwargs):
+        if app.config['RATELIMIT_ENABLED']:
+            data = request.get_json(silent=True)
+            username = data.get('username') if isinstance(data, dict) else None
+            checks = [('ip', request.remote_addr or 'unknown')]
+            if isinstance(username, str) and username:
+                checks.append(('username', username.lower()))
+            for scope, value in checks:
+                try:
+                    retry_after = rate_limiter.hit(request.endpoint, scope, value)
+                except Exception:
+                    # Si el almacén falla se deja pasar: no bloquear el login de todos
+                    app.logger.exception('Rate limiter unavailable')
+                    break
+                if retry_after:
+                    metrics.inc('taskflow_rate_limited_total', endpoint=request.endpoint, scope=scope)
+                    response = jsonify({'message': 'Too many requests, please retry later'})
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+        return f(*args, **kwargs)
+    decorated.__name__ = f.__name__
+    return decorated
+
+# Caché de respuestas serializadas compartida entre workers
+class SQLiteResponseStore:
+    """Respuestas en una BD SQLite propia, compartida por los workers de la máquina."""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connection(self):
+        # Una conexión por hilo y proceso (no se comparten tras un fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache ('
+                         'key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, '
+                         'body BLOB NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_response_cache_user ON response_cache (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_response_cache_expires ON response_cache (expires_at)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, now):
+        row = self._connection().execute(
+            'SELECT body FROM response_cache WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, user_id, key, body, expires_at):
+        self._connection().execute('INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)',
+                                   (key, user_id, body, expires_at))
+
+    def invalidate(self, user_ids):
+        placeholders = ','.join('?' * len(user_ids))
+        return self._connection().execute(
+            f'DELETE FROM response_cache WHERE user_id IN ({placeholders})', list(user_ids)).rowcount
+
+    def evict(self, now):
+        # Devuelve (caducadas, desalojadas por capacidad); salen primero las más antiguas
+        conn = self._connection()
+        expired = conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,)).rowcount
+        overflow = conn.execute('SELECT count(*) FROM response_cache').fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute('DELETE FROM response_cache WHERE key IN ('
+                         'SELECT key FROM response_cache ORDER BY expires_at LIMIT ?)', (overflow,))
+        return expired, max(overflow, 0)
+
+    def stats(self):
+        entries, size = self._connection().execute(
+            'SELECT count(*), coalesce(sum(length(body)), 0) FROM response_cache').fetchone()
+        return {'entries': entries, 'bytes': size}
+
+    def clear(self):
+        self._connection().execute('DELETE FROM response_cache')
+
+class RedisResponseStore:
+    """Respuestas en Redis (o compatible), con un conjunto de claves por usuario."""
+
+    def __init__(self, url, prefix='taskflow:cache:'):
+        import redis  # Dependencia opcional: pip install redis
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key, now):
+        return self.client.get(self.prefix + key)
+
+    def put(self, user_id, key, body, expires_at):
+        ttl = max(1, math.ceil(expires_at - time.time()))
+        user_key = f'{self.prefix}user:{user_id}'
+        with self.client.pipeline() as pipe:
+            pipe.set(self.prefix + key, body, ex=ttl)
+            pipe.sadd(user_key, key)
+            pipe.expire(user_key, ttl)
+            pipe.execute()
+
+    def invalidate(self, user_ids):
+        removed = 0
+        for user_id in user_ids:
+            user_key = f'{self.prefix}user:{user_id}'
+            keys = [self.prefix + key.decode() for key in self.client.smembers(user_key)]
+            removed += self.client.delete(*keys, user_key) - 1 if keys else 0
+        return removed
+
+    def evict(self, now):
+        return 0, 0  # Redis caduca (EX) y desaloja (maxmemory-policy) por su cuenta
+
+    def stats(self):
+        info = self.client.info('stats')
+        return {'expired_keys': info.get('expired_keys'), 'evicted_keys': info.get('evicted_keys')}
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+class ResponseCache:
+    """Cuerpos ya serializados de GET /api/tasks, compartidos entre workers.
+
+    La clave es el ETag de la colección (usuario, revisión y parámetros), así que
+    una entrada nunca sirve datos viejos: tras un cambio la revisión es otra. Al
+    confirmar una transacción que sube la revisión de un usuario se borran además
+    sus entradas, para no ocupar sitio con versiones que ya no se pedirán. Si el
+    almacén falla se sirve sin caché.
+    """
+
+    def __init__(self, store, ttl, max_body, namespace):
+        self.store = store
+        self.ttl = ttl
+        self.max_body = max_body
+        self.namespace = namespace  # Distingue BDs que comparten almacén
+        self.counters = Counter()
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def get(self, key):
+        if self.store is None:
+            return None
+        try:
+            body = self.store.get(f'{self.namespace}:{key}', time.time())
+        except Exception:
+            app.logger.exception('Response cache unavailable')
+            return None
+        self._count('miss' if body is None else 'hit')
+        return body
+
+    def put(self, user_id, key, body):
+        if self.store is None or len(body) > self.max_body:
+            return
+        try:
+            self.store.put(user_id, f'{self.namespace}:{key}', body, time.time() + self.ttl)
+        except Exception:
+            app.logger.exception('Response cache unavailable')
+
+    def invalidate(self, user_ids):
+        if self.store is None or not user_ids:
+            return
+        try:
+            self._count('invalidation', self.store.invalidate(user_ids))
+        except Exception:
+            app.logger.exception('Response cache unavailable')
+
+    def evict(self):
+        expired, overflow = self.store.evict(time.time())
+        self._count('eviction', expired + overflow)
+
+    def snapshot(self):
+        stats = {'enabled': self.enabled, **{event: self.counters[event] for event in
+                                             ('hit', 'miss', 'eviction', 'invalidation')}}
+        if self.store is not None:
+            stats['backend'] = type(self.store).__name__
+            stats.update(self.store.stats())
+        return stats
+
+    def clear(self):
+        if self.store is not None:
+            self.store.clear()
+
+    def _count(self, event, amount=1):
+        if amount:
+            self.counters[event] += amount
+            metrics.inc('taskflow_response_cache_events_total', amount, event=event)
+
+def create_response_cache():
+    store = None
+    if app.config['RESPONSE_CACHE_ENABLED']:
+        url = app.config['RESPONSE_CACHE_URL']
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            store = RedisResponseStore(url)
+        else:
+            store = SQLiteResponseStore(url.replace('sqlite:///', '', 1) if url
+                                        else os.path.join(app.instance_path, 'response_cache.db'),
+                                        app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+    namespace = hashlib.sha1(db_uri.encode()).hexdigest()[:8]
+    return ResponseCache(store, app.config['RESPONSE_CACHE_TTL'], app.config['RESPONSE_CACHE_MAX_BODY'], namespace)
+
+response_cache = create_response_cache()
+
+@event.listens_for(Session, 'after_commit')
+def publish_task_changes(session):
+    # {user_id: revisión} confirmados en la transacción
+    changes = session.info.pop('changed_task_users', None)
+    if changes:
+        response_cache.invalidate(changes)
+        change_bus.publish(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_users(session):
+    session.info.pop('changed_task_users', None)
+
+@background_job('RESPONSE_CACHE_EVICT_INTERVAL')
+def evict_cached_responses():
+    if response_cache.enabled:
+        response_cache.evict()
+
+# Avisos de cambios para GET /api/tasks/stream. Tras cada commit se publica
+# {user_id: revisión}; el contenido de los cambios se lee después de la BD con
+# list_task_changes, así que un aviso perdido o repetido no cambia lo que recibe
+# el cliente, solo cuándo.
+class ChangeSubscription:
+    """Una conexión SSE: recuerda solo que hay cambios pendientes, no cuáles.
+
+    Los avisos se fusionan, de modo que un cliente lento nunca acumula una cola en
+    el servidor: al despertar lee de una vez todo lo ocurrido desde lo último que
+    se le envió (control de flujo por conexión).
+    """
+
+    def __init__(self, user_id, wakeup=None):
+        self.user_id = user_id
+        self.revision = 0  # Última revisión notificada
+        self._event = threading.Event()
+        self._wakeup = wakeup  # asgi.py: despierta la tarea async desde cualquier hilo
+
+    def notify(self, revision):
+        self.revision = max(self.revision, revision)
+        self._event.set()
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def wait(self, timeout):
+        # True si llegó un aviso; se rearma antes de que el llamante lea la BD
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+def encode_changes(changes, size=500):
+    # Datagramas/NOTIFY de tamaño acotado (NOTIFY admite menos de 8000 bytes)
+    items = list(changes.items())
+    for i in range(0, len(items), size):
+        yield json.dumps(dict(items[i:i + size])).encode()
+
+def decode_changes(payload):
+    return {int(user_id): revision for user_id, revision in json.loads(payload).items()}
+
+class SocketBusBackend:
+    """Un socket Unix de datagramas por proceso con conexiones abiertas.
+
+    Cada worker que tiene suscriptores enlaza <directorio>/<pid>.sock; publicar es
+    un sendto no bloqueante a cada socket del directorio. Los de procesos muertos
+    se borran al fallar el envío. Si el buffer de un receptor está lleno el aviso
+    se descarta: sus conexiones lo recuperan en el siguiente keep-alive.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pid = None
+        self._path = None
+        self._lock = threading.Lock()
+
+    def start(self, dispatch):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)  # pid reutilizado de un proceso que no limpió
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._pid, self._path = os.getpid(), path
+            atexit.register(self._unlink, path)
+            threading.Thread(target=self._receive, args=(sock, dispatch),
+                             name='change_bus', daemon=True).start()
+
+    def _receive(self, sock, dispatch):
+        while True:
+            payload = sock.recv(65536)
+            try:
+                dispatch(decode_changes(payload))
+            except Exception:
+                app.logger.exception('Invalid change bus message')
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, changes):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return  # Ningún proceso tiene conexiones abiertas
+        own = f'{os.getpid()}.sock'
+        peers = [os.path.join(self.directory, name) for name in names
+                 if name.endswith('.sock') and name != own]
+        if not peers:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for payload in encode_changes(changes):
+                for path in peers:
+                    try:
+                        sock.sendto(payload, path)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        self._unlink(path)
+                    except BlockingIOError:
+                        pass
+
+class PostgresBusBackend:
+    """NOTIFY tras el commit y un hilo por proceso con LISTEN en su propia conexión."""
+
+    channel = 'taskflow_task_changes'
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, dispatch):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._listen, args=(dispatch,),
+                                 name='change_bus', daemon=True).start()
+
+    def _listen(self, dispatch):
+        while True:
+            try:
+                # Conexión fuera del pool: LISTEN vive mientras dure la conexión
+                fairy = self.engine.raw_connection()
+                fairy.detach()
+                conn = fairy.dbapi_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select_module.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        dispatch(decode_changes(conn.notifies.pop(0).payload))
+            except Exception:
+                app.logger.exception('Change bus listener failed; reconnecting')
+                time.sleep(1)
+
+    def publish(self, changes):
+        with self.engine.connect() as conn:
+            for payload in encode_changes(changes):
+                conn.execute(select(func.pg_notify(self.channel, payload.decode())))
+            conn.commit()
+
+class ChangeBus:
+    """Suscripciones por usuario de este proceso más un backend entre procesos."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, wakeup=None):
+        subscription = ChangeSubscription(user_id, wakeup)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        self.backend.start(self.dispatch)
+        metrics.inc('taskflow_stream_connections')
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+        metrics.inc('taskflow_stream_connections', -1)
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, changes):
+        # Las conexiones de este proceso se avisan directamente; nunca falla el commit
+        self.dispatch(changes)
+        try:
+            self.backend.publish(changes)
+        except Exception:
+            app.logger.exception('Change bus unavailable')
+
+    def dispatch(self, changes):
+        with self._lock:
+            targets = [(subscription, revision) for user_id, revision in changes.items()
+                       for subscription in self._subscriptions.get(user_id, ())]
+        for subscription, revision in targets:
+            subscription.notify(revision)
+
+def create_change_bus():
+    backend = app.config['CHANGE_BUS_BACKEND']
+    if backend == 'auto':
+        backend = 'postgres' if engine.dialect.name == 'postgresql' else 'socket'
+    if backend == 'postgres':
+        return ChangeBus(PostgresBusBackend(engine))
+    if backend != 'socket':
+        raise ValueError('CHANGE_BUS_BACKEND must be auto, socket or postgres')
+    namespace = hashlib.sha1(db_uri.encode()).hexdigest()[:8]
+    return ChangeBus(SocketBusBackend(app.config['CHANGE_BUS_DIR'] or
+                                      os.path.join(tempfile.gettempdir(), f'taskflow-bus-{namespace}')))
+
+change_bus = create_change_bus()
+
+# Verificación de tokens JWT, común a token_required y a asgi.py
+class AuthError(Exception):
+    pass
+
+def decode_token(header):
+    # Devuelve (token, claims, principal); principal es None si no estaba en caché
+    if not header:
+        raise AuthError('Token is missing')
+    token = header[7:] if header.startswith('Bearer ') else header
+    cached = token_cache.get(token)
+    if cached is not None and not revocations.might_be_revoked(cached[0].get('jti')):
+        return token, cached[0], cached[1]
+    start = time.perf_counter()
+    try:
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token has expired') from None
+    except jwt.InvalidTokenError:
+        raise AuthError('Token is invalid') from None
+    finally:
+        metrics.observe('taskflow_jwt_decode_seconds', time.perf_counter() - start)
+    if data.get('type', 'access') != 'access':
+        raise AuthError('Token is invalid')  # Un refresh token no sirve como access token
+    return token, data, None
+
+def load_principal(session, token, data):
+    # Solo los positivos del filtro Bloom (revocados o falsos positivos) consultan la BD
+    jti = data.get('jti')
+    if revocations.might_be_revoked(jti) and revocations.is_revoked(session, jti):
+        raise AuthError('Token has been revoked')
+    row = session.execute(
+        select(User.id, User.username).where(User.id == data.get('user_id'))).first()
+    if row is None:
+        raise AuthError('User not found')
+    principal = UserPrincipal(row.id, row.username)
+    token_cache.put(token, data, principal)
+    return principal
+
 # Decorador para verificar token JWT
 def token_required(f):
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        
-        if not token:
-            return jsonify({'message': 'Token is missing'}), 401
-        
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            if not current_user:
-                return jsonify({'message': 'User not found'}), 401
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid'}), 401
-            
+            token, data, current_user = decode_token(request.headers.get('Authorization'))
+            if current_user is None:
+                current_user = load_principal(db.session, token, data)
+        except AuthError as e:
+            return jsonify({'message': str(e)}), 401
+        g.token_claims = data
+
+        # Write-behind: el resto de peticiones del usuario ven sus PUT pendientes
+        if request.endpoint != 'update_task' and write_behind.has_pending(current_user.id):
+            write_behind.flush(current_user.id)
         return f(current_user, *args, **kwargs)
     decorated.__name__ = f.__name__
     return decorated
 
 # Rutas de Autenticación
 @app.route('/api/register', methods=['POST'])
+@rate_limited
 def register():
     try:
         data = request.get_json()
@@ -110,7 +3238,7 @@ def register():
         user = User(
             username=data['username'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password'])
+            password_hash=password_hasher.hash(data['password'])
         )
         
         db.session.add(user)
@@ -121,12 +3249,14 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except HashingOverloaded:
+        return overloaded_response()
     except Exception as e: 
-        db.create_all()
         db.session.rollback()
         return jsonify({'message': f'Error registering user: {str(e)}'}), 500
 
 @app.route('/api/login', methods=['POST'])
+@rate_limited
 def login():
     try:
         data = request.get_json()
@@ -136,60 +3266,273 @@ def login():
         
         user = User.query.filter_by(username=data['username']).first()
         
-        if user and check_password_hash(user.password_hash, data['password']):
-            token = jwt.encode({
-                'user_id': user.id,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, app.config['SECRET_KEY'], algorithm='HS256')
-            
+        if user and password_hasher.verify(user.password_hash, data['password']):
+            # Re-hash transparente si cambió el método o el factor de trabajo
+            old_hash = user.password_hash
+            new_hash = password_hasher.hash(data['password']) if password_hasher.needs_rehash(old_hash) else None
+            user_data = user.to_dict()
+            # Cierra la transacción de lectura antes de escribir: en SQLite el UPDATE y
+            # el INSERT del refresh token abren así su propia transacción y esperan al
+            # bloqueo (ampliar la de lectura falla con "database is locked")
+            db.session.commit()
+            if new_hash:
+                # Solo si otro login concurrente no lo ha cambiado ya
+                db.session.execute(update(User).where(User.id == user_data['id'], User.password_hash == old_hash)
+                                   .values(password_hash=new_hash))
+            tokens = issue_tokens(db.session, user_data['id'])
+            db.session.commit()
+
             return jsonify({
                 'message': 'Login successful',
-                'token': token,
-                'user': user.to_dict()
+                **tokens,
+                'user': user_data
             }), 200
         
         return jsonify({'message': 'Invalid credentials'}), 401
         
+    except HashingOverloaded:
+        return overloaded_response()
     except Exception as e:
-        db.create_all()
+        db.session.rollback()
         return jsonify({'message': f'Error during login: {str(e)}'}), 500
 
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('refresh_token'):
+            return jsonify({'message': 'Refresh token is required'}), 400
+        try:
+            claims = jwt.decode(data['refresh_token'], app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Refresh token has expired'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'message': 'Refresh token is invalid'}), 401
+        if claims.get('type') != 'refresh':
+            return jsonify({'message': 'Refresh token is invalid'}), 401
+
+        # Rotación: solo la primera petición con este refresh token lo consume
+        consumed = db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.jti == claims['jti'], RefreshToken.user_id == claims['user_id'],
+                   RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())).rowcount
+        if not consumed:
+            # Reutilizar un refresh token ya rotado indica robo: se revoca toda la sesión
+            revoke_token_family(db.session, claims['fam'])
+            db.session.commit()
+            return jsonify({'message': 'Refresh token has been revoked'}), 401
+
+        tokens = issue_tokens(db.session, claims['user_id'], claims['fam'])
+        db.session.commit()
+        return jsonify({'message': 'Token refreshed', **tokens}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error refreshing token: {str(e)}'}), 500
+
+@app.route('/api/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    try:
+        # Revoca la sesión entera: refresh tokens de la familia y sus access tokens
+        claims = g.token_claims
+        if claims.get('fam'):
+            revoke_token_family(db.session, claims['fam'])
+        elif claims.get('jti'):
+            revocations.revoke(db.session, [(claims['jti'], datetime.utcfromtimestamp(claims['exp']))])
+        db.session.commit()
+        return jsonify({'message': 'Logged out'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error during logout: {str(e)}'}), 500
+
 # Rutas de Tareas
 @app.route('/api/tasks', methods=['GET'])
 @token_required
 def get_tasks(current_user):
     try:
-        tasks = Task.query.filter_by(user_id=current_user.id).all()
-        return jsonify({
-            'tasks': [task.to_dict() for task in tasks]
-        }), 200
+        revision = current_task_revision(db.session, current_user.id)
+        etag = collection_etag(current_user.id, revision, request.args)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        body = response_cache.get(etag)
+        if body is None:
+            body = serializer.dumps(list_tasks_page(db.session, current_user.id, request.args, revision))
+            response_cache.put(current_user.id, etag, body)
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Error fetching tasks: {str(e)}'}), 500
 
+@app.route('/api/tasks/changes', methods=['GET'])
+@token_required
+def get_task_changes(current_user):
+    try:
+        revision = current_task_revision(db.session, current_user.id)
+        etag = collection_etag(current_user.id, revision, request.args)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        response = json_response(list_task_changes(db.session, current_user.id, request.args, revision))
+        response.set_etag(etag)
+        return response
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except ChangesExpired as e:
+        return jsonify({'message': str(e)}), 410
+    except Exception as e:
+        return jsonify({'message': f'Error fetching task changes: {str(e)}'}), 500
+
+# GET /api/tasks/stream: Server-Sent Events con el mismo contenido que /changes.
+# El id de cada evento es la revisión, así que un EventSource que reconecta envía
+# Last-Event-ID y recibe justo lo que se perdió.
+def parse_last_event_id(value):
+    if value is None or value == '':
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        raise ValueError('Invalid value for Last-Event-ID: expected a revision number') from None
+    if since < 0:
+        raise ValueError('Invalid value for Last-Event-ID: must not be negative')
+    return since
+
+def sse_event(event, payload, event_id=None):
+    head = f'event: {event}\n' + (f'id: {event_id}\n' if event_id is not None else '')
+    # serializer.dumps termina en salto de línea, que en SSE cerraría el campo data
+    return head.encode() + b'data: ' + serializer.dumps(payload).rstrip(b'\n') + b'\n\n'
+
+SSE_KEEPALIVE = b': keepalive\n\n'
+
+def sse_retry():
+    return f"retry: {app.config['STREAM_RETRY']}\n\n".encode()
+
+def read_change_events(session, user_id, since, jti=None):
+    # Devuelve (eventos, revisión enviada, quedan más). Sin since empieza en la
+    # revisión actual con un evento "ready". Lanza ChangesExpired si ya no se puede
+    # reanudar y AuthError si el token se revocó con el stream abierto.
+    if jti and revocations.might_be_revoked(jti) and revocations.is_revoked(session, jti):
+        raise AuthError('Token has been revoked')
+    revision = current_task_revision(session, user_id)
+    if since is None:
+        return [sse_event('ready', {'revision': revision}, revision)], revision, False
+    if since > revision:
+        raise ChangesExpired(f'Revision {since} is newer than the current revision; '
+                             'fetch the full list with since=0')
+    events = []
+    while since < revision and len(events) < app.config['STREAM_MAX_PAGES']:
+        page = list_task_changes(session, user_id, {'since': since}, revision)
+        events.append(sse_event('changes', page, page['revision']))
+        since = page['revision']
+    return events, since, since < revision
+
+def stream_deadline(claims):
+    # El stream se cierra al caducar el access token o tras STREAM_MAX_DURATION
+    remaining = app.config['STREAM_MAX_DURATION']
+    if claims.get('exp'):
+        remaining = min(remaining, claims['exp'] - time.time())
+    return time.monotonic() + remaining
+
+def stream_task_events(user_id, since, jti, deadline):
+    # Suscrito antes de la primera lectura: ningún commit queda entre ambas
+    subscription = change_bus.subscribe(user_id)
+    try:
+        yield sse_retry()
+        while True:
+            try:
+                # Sesión corta por lectura: no se retiene una conexión entre eventos
+                with Session(engine) as session:
+                    events, since, more = read_change_events(session, user_id, since, jti)
+            except ChangesExpired as e:
+                yield sse_event('expired', {'message': str(e)})
+                return
+            except AuthError:
+                return
+            yield from events
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Sin aviso también se vuelve a leer: cubre avisos perdidos entre procesos
+            if not more and not subscription.wait(min(app.config['STREAM_HEARTBEAT'], remaining)):
+                yield SSE_KEEPALIVE
+    finally:
+        change_bus.unsubscribe(subscription)
+
+@app.route('/api/tasks/stream', methods=['GET'])
+@token_required
+def stream_tasks(current_user):
+    try:
+        since = parse_last_event_id(request.headers.get('Last-Event-ID', request.args.get('since')))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if change_bus.connections() >= app.config['STREAM_MAX_CONNECTIONS']:
+        response = jsonify({'message': 'Too many open streams, retry later'})
+        response.headers['Retry-After'] = str(app.config['STREAM_RETRY'] // 1000 or 1)
+        return response, 503
+
+    claims = g.token_claims
+    # La transacción de lectura de la autenticación no debe seguir abierta durante el stream
+    db.session.close()
+    response = app.response_class(
+        stream_with_context(stream_task_events(current_user.id, since, claims.get('jti'),
+                                               stream_deadline(claims))),
+        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: sin buffer de respuesta
+    return response
+
+@app.route('/api/tasks/search', methods=['GET'])
+@token_required
+def search_tasks(current_user):
+    try:
+        revision = current_task_revision(db.session, current_user.id)
+        etag = collection_etag(current_user.id, revision, request.args)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        response = json_response(search_tasks_page(db.session, current_user.id, request.args, revision))
+        response.set_etag(etag)
+        return response
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': f'Error searching tasks: {str(e)}'}), 500
+
+@app.route('/api/tasks/stats', methods=['GET'])
+@token_required
+def get_task_stats(current_user):
+    try:
+        return json_response(task_stats(db.session, current_user.id, request.args))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': f'Error fetching task stats: {str(e)}'}), 500
+
 @app.route('/api/tasks', methods=['POST'])
 @token_required
 def create_task(current_user):
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
-        if not data.get('title'):
+        if not isinstance(data, dict) or not data.get('title'):
             return jsonify({'message': 'Title is required'}), 400
         
-        task = Task(
-            title=data['title'],
-            description=data.get('description', ''),
-            priority=data.get('priority', 'medium'),
-            user_id=current_user.id
-        )
-        
-        db.session.add(task)
+        task = create_one_task(db.session, current_user.id, data)
         db.session.commit()
         
-        return jsonify({
+        return json_response({
             'message': 'Task created successfully',
-            'task': task.to_dict()
-        }), 201
+            'task': task
+        }, 201)
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Error creating task: {str(e)}'}), 500
@@ -198,40 +3541,59 @@ def create_task(current_user):
 @token_required
 def update_task(current_user, task_id):
     try:
-        task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+        data = request.get_json()
+        if write_behind.enabled:
+            task = write_behind.update(db.session, current_user.id, task_id, data)
+        else:
+            task = update_one_task(db.session, current_user.id, task_id, data)
         
         if not task:
+            db.session.rollback()
             return jsonify({'message': 'Task not found'}), 404
         
-        data = request.get_json()
-        
-        task.title = data.get('title', task.title)
-        task.description = data.get('description', task.description)
-        task.completed = data.get('completed', task.completed)
-        task.priority = data.get('priority', task.priority)
-        task.updated_at = datetime.utcnow()
-        
         db.session.commit()
         
-        return jsonify({
+        return json_response({
             'message': 'Task updated successfully',
-            'task': task.to_dict()
-        }), 200
+            'task': task
+        })
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Error updating task: {str(e)}'}), 500
 
+@app.route('/api/tasks/<int:task_id>/move', methods=['POST'])
+@token_required
+def move_task(current_user, task_id):
+    try:
+        task = move_one_task(db.session, current_user.id, task_id, request.get_json())
+        if not task:
+            db.session.rollback()
+            return jsonify({'message': 'Task not found'}), 404
+
+        db.session.commit()
+        return json_response({
+            'message': 'Task moved successfully',
+            'task': task
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error moving task: {str(e)}'}), 500
+
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 @token_required
 def delete_task(current_user, task_id):
     try:
-        task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
-        
-        if not task:
+        if not delete_one_task(db.session, current_user.id, task_id):
+            db.session.rollback()
             return jsonify({'message': 'Task not found'}), 404
         
-        db.session.delete(task)
         db.session.commit()
         
         return jsonify({'message': 'Task deleted successfully'}), 200
@@ -240,16 +3602,188 @@ def delete_task(current_user, task_id):
         db.session.rollback()
         return jsonify({'message': f'Error deleting task: {str(e)}'}), 500
 
+@app.route('/api/tasks/batch', methods=['POST'])
+@token_required
+def batch_tasks(current_user):
+    try:
+        data = request.get_json()
+        operations = data.get('operations') if isinstance(data, dict) else None
+        results = apply_task_batch(db.session, current_user.id, operations)
+        db.session.commit()
+        return json_response({'results': results})
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error processing batch: {str(e)}'}), 500
+
+@app.route('/api/tasks/export', methods=['GET'])
+@token_required
+def export_tasks(current_user):
+    compress = request.args.get('compress') == 'gzip'
+    user_id = current_user.id
+
+    def generate():
+        # yield_per usa un cursor del lado del servidor y entrega las filas por lotes
+        result = db.session.execute(
+            select(*[getattr(Task, f) for f in TASK_FIELDS])
+            .where(Task.user_id == user_id)
+            .order_by(Task.id)
+            .execution_options(yield_per=app.config['EXPORT_BATCH_SIZE']))
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        for rows in result.partitions():
+            chunk = b''.join(serializer.dumps(task_row_to_dict(row, TASK_FIELDS)) for row in rows)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    response = app.response_class(stream_with_context(generate()),
+                                  mimetype='application/gzip' if compress else 'application/x-ndjson')
+    filename = 'tasks.ndjson.gz' if compress else 'tasks.ndjson'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+class ImportTooLarge(Exception):
+    # El cuerpo descomprimido supera IMPORT_MAX_BYTES (413)
+    pass
+
+# Errores de importación que se devuelven; el resto solo se cuentan
+IMPORT_MAX_ERRORS = 100
+
+def ndjson_lines(stream, max_line, max_total):
+    # Lee el cuerpo línea a línea sin tener más de max_line bytes en memoria. Una
+    # línea más larga se descarta por trozos y se entrega como None.
+    total = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        total += len(line)
+        too_long = len(line.rstrip(b'\r\n')) > max_line
+        while too_long and line and not line.endswith(b'\n') and total <= max_total:
+            line = stream.readline(max_line + 1)
+            total += len(line)
+        if total > max_total:
+            raise ImportTooLarge(f'Import exceeds {max_total} bytes')
+        yield None if too_long else line
+
+@app.route('/api/tasks/import', methods=['POST'])
+@token_required
+def import_tasks(current_user):
+    imported = 0
+    failed = 0
+    errors = []
+
+    def reject(line_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({'line': line_number, 'message': message})
+
+    try:
+        stream = request.stream
+        if (request.headers.get('Content-Encoding') == 'gzip'
+                or request.mimetype == 'application/gzip'):
+            stream = gzip.GzipFile(fileobj=stream)
+
+        # La lectura del usuario (token_required) no queda abierta durante la subida
+        user_id = current_user.id
+        db.session.rollback()
+
+        # Se confirma cada bloque de IMPORT_CHUNK_SIZE filas en su propia transacción,
+        # que toma el bloqueo de escritura solo con el bloque ya leído
+        def flush(items):
+            with Session(engine.execution_options(sqlite_immediate=True)) as session:
+                created = bulk_create_tasks(session, user_id, items, bump_task_revision(session, user_id))
+                session.commit()
+            return len(created)
+
+        max_line = app.config['IMPORT_MAX_LINE_BYTES']
+        chunk = []
+        for line_number, line in enumerate(
+                ndjson_lines(stream, max_line, app.config['IMPORT_MAX_BYTES']), start=1):
+            if line is None:
+                reject(line_number, f'Line exceeds {max_line} bytes')
+                continue
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                reject(line_number, 'Invalid JSON')
+                continue
+            if not isinstance(item, dict) or not item.get('title'):
+                reject(line_number, 'Title is required')
+                continue
+            # Se valida cada fila: una sola mala no debe hacer fallar el INSERT del bloque
+            try:
+                chunk.append(task_values(item))
+            except ValueError as e:
+                reject(line_number, str(e))
+                continue
+            if len(chunk) >= app.config['IMPORT_CHUNK_SIZE']:
+                imported += flush(chunk)
+                chunk = []
+        if chunk:
+            imported += flush(chunk)
+
+        return json_response({
+            'imported': imported,
+            'failed': failed,
+            'errors': errors
+        })
+
+    except ImportTooLarge as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'imported': imported}), 413
+    except (OSError, EOFError) as e:
+        db.session.rollback()
+        return jsonify({'message': f'Invalid import stream: {str(e)}', 'imported': imported}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error importing tasks: {str(e)}', 'imported': imported}), 500
+
 # Ruta de salud
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'TaskFlow API is running'}), 200
 
-def create_tables():
-    db.create_all()
+@app.route('/api/health/db', methods=['GET'])
+def db_health_check():
+    # Estado del pool de este worker para dimensionarlo frente a los workers de gunicorn
+    try:
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            conn.exec_driver_sql('SELECT 1')
+        ping_ms = round((time.perf_counter() - start) * 1000, 3)
+        return jsonify({
+            'status': 'healthy',
+            'dialect': engine.dialect.name,
+            'pid': os.getpid(),
+            'ping_ms': ping_ms,
+            'pool': pool_stats.snapshot(engine.pool)
+        }), 200
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'message': str(e),
+                        'pool': pool_stats.snapshot(engine.pool)}), 503
+
+@app.route('/api/health/cache', methods=['GET'])
+def cache_health_check():
+    # Contadores de este worker y tamaño del almacén compartido
+    try:
+        return jsonify({'status': 'healthy', 'pid': os.getpid(), **response_cache.snapshot()}), 200
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'message': str(e)}), 503
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    create_tables()
+    migrate_database()
     app.run(debug=True, port=5000)
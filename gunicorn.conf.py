@@ -0,0 +1,118 @@
+"""
+Production serving profile for gunicorn.
+
+Run with: gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden with an environment variable (GUNICORN_*).
+The master applies pending schema migrations once before forking workers
+(GUNICORN_MIGRATE=false skips it); each worker then only checks the schema
+version and reports its boot time against WORKER_BOOT_BUDGET. The gthread
+worker serves several keep-alive connections per process with a thread pool;
+workers are recycled after max_requests (+ jitter) so slow leaks do not
+accumulate, and the access log is buffered in memory and written in batches
+instead of one write per request (a background thread also flushes it every
+flush interval, so an idle worker does not sit on buffered lines). With METRICS_DIR set the master empties
+that directory on start and each exiting worker folds its counters into the
+shared archive file (see flask_backend.Metrics).
+"""
+
+import logging
+import logging.handlers
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 15))  # segundos
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None  # vacío = sin access log
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+capture_output = True
+
+MIGRATE_ON_START = os.getenv('GUNICORN_MIGRATE', 'true').lower() == 'true'
+
+# Access log con buffer: hasta N líneas o cada X segundos, lo que llegue antes
+ACCESS_LOG_BUFFER = int(os.getenv('GUNICORN_ACCESS_LOG_BUFFER', 256))
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv('GUNICORN_ACCESS_LOG_FLUSH_INTERVAL', 1.0))
+
+
+class BufferedAccessHandler(logging.handlers.MemoryHandler):
+    """MemoryHandler que además vacía el buffer si lleva demasiado tiempo sin escribir."""
+
+    def __init__(self, capacity, interval, target):
+        super().__init__(capacity, flushLevel=logging.ERROR, target=target, flushOnClose=True)
+        self.interval = interval
+        self.last_flush = time.monotonic()
+        self._stopped = threading.Event()
+        if interval > 0:
+            threading.Thread(target=self._flush_periodically, name='access-log-flush', daemon=True).start()
+
+    def _flush_periodically(self):
+        # Un worker sin peticiones no emite nada: el hilo vacía lo que quede pendiente
+        while not self._stopped.wait(self.interval):
+            if self.buffer:
+                self.flush()
+
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record)
+                or time.monotonic() - self.last_flush >= self.interval)
+
+    def flush(self):
+        super().flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self._stopped.set()
+        super().close()
+
+
+def on_starting(server):
+    # Métricas de una ejecución anterior: los contadores vuelven a empezar de cero
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    # En un proceso aparte: el master no importa la app que heredarían los workers
+    if MIGRATE_ON_START:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-upgrade'],
+                       cwd=server.cfg.chdir, check=True)
+
+
+def post_fork(server, worker):
+    worker.boot_started = time.monotonic()
+
+
+def post_worker_init(worker):
+    # Si el esquema no está al día el worker no arranca (y gunicorn se detiene)
+    from flask_backend import finish_worker_boot
+    finish_worker_boot(time.monotonic() - worker.boot_started)
+
+    if ACCESS_LOG_BUFFER <= 1:
+        return
+    access = logging.getLogger('gunicorn.access')
+    access.handlers = [
+        BufferedAccessHandler(ACCESS_LOG_BUFFER, ACCESS_LOG_FLUSH_INTERVAL, handler)
+        for handler in access.handlers
+    ]
+
+
+def worker_exit(server, worker):
+    # Escribe lo pendiente antes de que el worker termine (reciclado o parada)
+    for handler in logging.getLogger('gunicorn.access').handlers:
+        handler.flush()
+    # Sus métricas pasan al archivo de procesos terminados (un worker matado por
+    # timeout no llega aquí; el siguiente scrape archiva su último volcado)
+    from flask_backend import metrics
+    metrics.close()
@@ -0,0 +1,236 @@
+"""
+Query plan regression suite.
+
+Captures the SQL issued by each endpoint through the Flask test client and runs
+`EXPLAIN QUERY PLAN` for it against a seeded SQLite database (1M tasks by
+default). A test fails when any statement falls back to a full table scan.
+
+Run with: python -m unittest query_plan_tests.py
+Seed size: QUERY_PLAN_TASKS (default 1000000) and QUERY_PLAN_USERS (default 1000).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+
+import flask_backend
+from app import app, db
+
+SEED_TASKS = int(os.getenv('QUERY_PLAN_TASKS', 1000000))
+SEED_USERS = int(os.getenv('QUERY_PLAN_USERS', 1000))
+
+# "SCAN task" o "SCAN task USING INDEX ..." recorren la tabla/índice completo
+FULL_SCAN = re.compile(r'^SCAN (task|task_stat|task_daily_stat|user|refresh_token|revoked_token)\b')
+
+
+def seed_database(path):
+    """Crea el esquema con los modelos y lo llena con datos sintéticos."""
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    now = datetime(2024, 1, 1)
+    conn.executemany(
+        'INSERT INTO user (id, username, email, password_hash, created_at, task_revision, purged_revision) '
+        'VALUES (?, ?, ?, ?, ?, ?, 0)',
+        ((i, f'user{i}', f'user{i}@test.com', 'x', now.isoformat(' '), SEED_TASKS // SEED_USERS)
+         for i in range(1, SEED_USERS + 1)))
+    priorities = ('low', 'medium', 'high')
+    positions = flask_backend.position_keys_after(None, SEED_TASKS // SEED_USERS + 1)
+    conn.executemany(
+        'INSERT INTO task (id, title, description, completed, priority, position, created_at, updated_at, '
+        'user_id, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((i, f'Tarea {i}', '', i % 2, priorities[i % 3], positions[i // SEED_USERS],
+          (now + timedelta(seconds=i)).isoformat(' '), (now + timedelta(seconds=i)).isoformat(' '),
+          i % SEED_USERS + 1, i // SEED_USERS) for i in range(1, SEED_TASKS + 1)))
+    # Un 10% adicional de tareas dadas de baja (bajas lógicas pendientes de purga)
+    conn.executemany(
+        'INSERT INTO task (id, title, description, completed, priority, position, created_at, updated_at, '
+        'user_id, revision, deleted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((SEED_TASKS + i, f'Baja {i}', '', 0, 'low', positions[i // SEED_USERS], now.isoformat(' '),
+          now.isoformat(' '), i % SEED_USERS + 1, i // SEED_USERS, (now + timedelta(seconds=i)).isoformat(' '))
+         for i in range(1, SEED_TASKS // 10 + 1)))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+class QueryPlanTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_fd, cls.db_path = tempfile.mkstemp(suffix='.db')
+        seed_database(cls.db_path)
+        cls.plan_conn = sqlite3.connect(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.plan_conn.close()
+        os.close(cls.db_fd)
+        os.unlink(cls.db_path)
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['RATELIMIT_ENABLED'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+        flask_backend.response_cache.clear()
+        self.statements = []
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def request(self, method, path, data=None, token=None):
+        """Ejecuta la petición y devuelve las sentencias SQL que generó."""
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        self.statements = []
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._capture)
+            try:
+                response = self.app.open(path, method=method, headers=headers,
+                                         data=json.dumps(data) if data is not None else None,
+                                         content_type='application/json')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', self._capture)
+        return response, list(self.statements)
+
+    def assertNoFullScans(self, statements):
+        checked = 0
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            plan = self.plan_conn.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+            for row in plan:
+                self.assertIsNone(FULL_SCAN.match(row[-1]),
+                                  f'Full scan in plan {row[-1]!r} for query: {statement}')
+            checked += 1
+        self.assertGreater(checked, 0, 'No queries were captured')
+
+    def login(self):
+        self.app.post('/api/register', data=json.dumps({
+            'username': 'planner', 'email': 'planner@test.com', 'password': 'secret123'}),
+            content_type='application/json')
+        response, statements = self.request('POST', '/api/login',
+                                            {'username': 'planner', 'password': 'secret123'})
+        return json.loads(response.data)['token'], statements
+
+    def test_auth_queries(self):
+        """Test: Registro, login y refresh usan índices de User y RefreshToken"""
+        response, statements = self.request('POST', '/api/register', {
+            'username': 'other', 'email': 'other@test.com', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 201)
+        self.assertNoFullScans(statements)
+
+        _, statements = self.login()
+        self.assertNoFullScans(statements)
+
+        login = json.loads(self.app.post('/api/login', data=json.dumps({
+            'username': 'planner', 'password': 'secret123'}), content_type='application/json').data)
+        response, statements = self.request('POST', '/api/token/refresh', {'refresh_token': login['refresh_token']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(statements)
+        # Reutilización: revoca la familia por su índice
+        response, statements = self.request('POST', '/api/token/refresh', {'refresh_token': login['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+        self.assertNoFullScans(statements)
+
+    def test_list_queries(self):
+        """Test: El listado con cursor y filtros no recorre toda la tabla"""
+        token, _ = self.login()
+        for _ in range(3):
+            self.app.post('/api/tasks', data=json.dumps({'title': 'Tarea'}),
+                          headers={'Authorization': f'Bearer {token}'},
+                          content_type='application/json')
+
+        response, statements = self.request('GET', '/api/tasks?limit=2', token=token)
+        self.assertNoFullScans(statements)
+        cursor = json.loads(response.data)['next_cursor']
+
+        response, statements = self.request('GET', '/api/tasks/changes?since=0&limit=1', token=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(statements)
+
+        response, statements = self.request('GET', '/api/tasks/stats', token=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(statements)
+
+        response, statements = self.request('GET', '/api/tasks/search?q=tarea', token=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(statements)
+
+        response, statements = self.request('GET', '/api/tasks?order=position&limit=2', token=token)
+        self.assertNoFullScans(statements)
+        position_cursor = json.loads(response.data)['next_cursor']
+
+        for query in (f'limit=2&cursor={cursor}',
+                      f'order=position&limit=2&cursor={position_cursor}',
+                      'order=position&completed=false',
+                      'completed=false',
+                      'completed=true&priority=high',
+                      'priority=low,medium',
+                      'updated_after=2024-01-01T00:00:00&fields=id,title'):
+            response, statements = self.request('GET', f'/api/tasks?{query}', token=token)
+            self.assertEqual(response.status_code, 200, query)
+            self.assertNoFullScans(statements)
+
+    def test_mutation_queries(self):
+        """Test: Crear, actualizar, mover y eliminar buscan por clave primaria o índice"""
+        token, _ = self.login()
+        response, statements = self.request('POST', '/api/tasks', {'title': 'Tarea'}, token)
+        self.assertNoFullScans(statements)
+        task_id = json.loads(response.data)['task']['id']
+
+        _, statements = self.request('PUT', f'/api/tasks/{task_id}', {'completed': True}, token)
+        self.assertNoFullScans(statements)
+
+        other = json.loads(self.request('POST', '/api/tasks', {'title': 'Otra'}, token)[0].data)['task']['id']
+        for body in ({'after': other}, {'before': other}, {'after': None}, {'before': None}):
+            response, statements = self.request('POST', f'/api/tasks/{task_id}/move', body, token)
+            self.assertEqual(response.status_code, 200, body)
+            self.assertNoFullScans(statements)
+
+        _, statements = self.request('DELETE', f'/api/tasks/{task_id}', token=token)
+        self.assertNoFullScans(statements)
+
+        response, statements = self.request('POST', '/api/tasks/batch', {'operations': [
+            {'op': 'create', 'title': 'Lote'},
+            {'op': 'update', 'id': task_id + 1, 'completed': True},
+            {'op': 'delete', 'id': task_id + 1},
+        ]}, token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(statements)
+
+    def test_purge_queries(self):
+        """Test: La purga de bajas localiza los lotes con el índice parcial de deleted_at"""
+        token, _ = self.login()
+        response, _ = self.request('POST', '/api/tasks', {'title': 'Tarea'}, token)
+        self.request('DELETE', f"/api/tasks/{json.loads(response.data)['task']['id']}", token=token)
+
+        self.statements = []
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._capture)
+            try:
+                purged = flask_backend.purge_deleted_tasks(datetime.utcnow() + timedelta(days=1), 10)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', self._capture)
+        self.assertEqual(purged, 1)
+        self.assertNoFullScans(self.statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
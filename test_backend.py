@@ -1,7 +1,34 @@
 import unittest
+import asyncio
+import glob
+import gzip
+import io
 import json
+import jwt
+import logging.handlers
 import os
+import pstats
+import runpy
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+from flask import jsonify
+from sqlalchemy import create_engine, event
 from app import app, db, User, Task
+import flask_backend
+from flask_backend import (InstrumentedQueuePool, JsonSerializer, Metrics, PasswordHasher, RateLimiter,
+                           SQLiteBucketStore, TokenRevocations, orjson, pool_stats, response_cache, revocations,
+                           token_cache, write_behind)
+
+try:
+    import asgi
+except ImportError:  # Sin aiosqlite no hay modo ASGI
+    asgi = None
 
 
 class TaskFlowTestCase(unittest.TestCase):
@@ -29,6 +56,11 @@ class TaskFlowTestCase(unittest.TestCase):
             with app.app_context():
                 db.drop_all()
                 db.create_all()
+            token_cache.clear()
+            write_behind.clear()
+            revocations.clear()
+            response_cache.clear()
+            app.config['RATELIMIT_ENABLED'] = False
 
     # Simple HTTP wrappers to unify unit/integration modes
     def _with_headers(self, headers):
@@ -93,6 +125,33 @@ class TaskFlowTestCase(unittest.TestCase):
         """Método auxiliar para obtener headers de autenticación"""
         return {'Authorization': f'Bearer {token}'}
 
+    def get_token(self, username="testuser", email="test@test.com"):
+        """Método auxiliar para registrar un usuario y obtener su token"""
+        self.register_user(username, email)
+        return self._json(self.login_user(username))['token']
+
+    def create_task(self, token, **fields):
+        """Método auxiliar para crear una tarea y devolver su JSON"""
+        fields.setdefault('title', 'Tarea')
+        response = self._post('/api/tasks', data=json.dumps(fields),
+                              headers=self.get_auth_headers(token))
+        return self._json(response)['task']
+
+    def count_queries(self, func, fragment):
+        """Ejecuta func y cuenta las sentencias SQL que contienen el fragmento dado"""
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                func()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+        return sum(1 for statement in statements if fragment in statement)
+
     # Tests de Autenticación
     def test_register_user_success(self):
         """Test: Registro exitoso de usuario"""
@@ -316,5 +375,1368 @@ class TaskFlowTestCase(unittest.TestCase):
         data = self._json(response)
         self.assertEqual(len(data['tasks']), 0)
 
+    # Tests de paginación y filtros
+    def test_get_tasks_cursor_pagination(self):
+        """Test: Paginación por cursor recorre todas las tareas sin repetir"""
+        token = self.get_token()
+        created = [self.create_task(token, title=f'Tarea {i}')['id'] for i in range(5)]
+
+        seen = []
+        path = '/api/tasks?limit=2'
+        while True:
+            data = self._json(self._get(path, headers=self.get_auth_headers(token)))
+            self.assertLessEqual(len(data['tasks']), 2)
+            seen.extend(task['id'] for task in data['tasks'])
+            if not data['next_cursor']:
+                break
+            path = f"/api/tasks?limit=2&cursor={data['next_cursor']}"
+
+        self.assertEqual(seen, created)
+
+    def test_get_tasks_filters_and_fields(self):
+        """Test: Filtros por estado/prioridad y proyección de campos"""
+        token = self.get_token()
+        task = self.create_task(token, title='Alta', priority='high')
+        self.create_task(token, title='Baja', priority='low')
+        self._put(f"/api/tasks/{task['id']}", data=json.dumps({'completed': True}),
+                  headers=self.get_auth_headers(token))
+
+        response = self._get('/api/tasks?completed=true&priority=high&fields=id,title',
+                             headers=self.get_auth_headers(token))
+        data = self._json(response)
+        self.assertEqual(data['tasks'], [{'id': task['id'], 'title': 'Alta'}])
+
+        response = self._get('/api/tasks?created_after=2999-01-01T00:00:00',
+                             headers=self.get_auth_headers(token))
+        self.assertEqual(self._json(response)['tasks'], [])
+
+    def test_get_tasks_invalid_params(self):
+        """Test: Parámetros inválidos devuelven 400"""
+        token = self.get_token()
+        for query in ('fields=secret', 'cursor=not-a-cursor', 'completed=maybe', 'limit=0'):
+            response = self._get(f'/api/tasks?{query}', headers=self.get_auth_headers(token))
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_task_move_and_position_order(self):
+        """Test: Mover tareas cambia su clave de orden y ?order=position las lista en ese orden"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        first, second, third = (self.create_task(token, title=f'Tarea {i}')['id'] for i in range(3))
+
+        def ordered():
+            seen, path = [], '/api/tasks?order=position&limit=2'
+            while path:
+                data = self._json(self._get(path, headers=headers))
+                seen.extend(task['id'] for task in data['tasks'])
+                path = data['next_cursor'] and f"/api/tasks?order=position&limit=2&cursor={data['next_cursor']}"
+            return seen
+
+        self.assertEqual(ordered(), [first, second, third])
+        for task_id, body, expected in ((third, {'after': first}, [first, third, second]),
+                                        (third, {'before': None}, [first, second, third]),
+                                        (third, {'after': None}, [third, first, second]),
+                                        (first, {'before': None}, [third, second, first])):
+            response = self._post(f'/api/tasks/{task_id}/move', data=json.dumps(body), headers=headers)
+            self.assertEqual(response.status_code, 200, body)
+            self.assertEqual(ordered(), expected, body)
+        for body in ({'after': first, 'before': second}, {'after': 'x'}, {'after': third}, {'after': 9999}):
+            self.assertEqual(self._post(f'/api/tasks/{third}/move', data=json.dumps(body),
+                                        headers=headers).status_code, 400, body)
+        self.assertEqual(self._post('/api/tasks/9999/move', data=json.dumps({'after': None}),
+                                    headers=headers).status_code, 404)
+        if self.integration:
+            return
+
+        # Claves repetidas (dos movimientos concurrentes sin bloqueo): mover entre
+        # ellas reparte las claves en la misma transacción en lugar de fallar
+        with app.app_context():
+            db.session.execute(db.text('UPDATE task SET position = :key WHERE id IN (:a, :b)'),
+                               {'key': 'a5', 'a': second, 'b': third})
+            db.session.commit()
+        flask_backend.response_cache.clear()  # El UPDATE directo no sube la revisión
+        order = ordered()
+        anchor = next(task_id for task_id in order if task_id != first)
+        response = self._post(f'/api/tasks/{first}/move', data=json.dumps({'after': anchor}), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        new = ordered()
+        self.assertEqual(new[new.index(anchor) + 1], first)
+        positions = [t['position'] for t in self._json(self._get('/api/tasks?order=position',
+                                                                 headers=headers))['tasks']]
+        self.assertEqual(len(set(positions)), 3)
+
+        # Claves largas: el reparto las acorta sin cambiar el orden ni updated_at
+        with app.app_context():
+            rows = db.session.execute(db.text('SELECT id, user_id FROM task ORDER BY position')).all()
+            for row, key in zip(rows, flask_backend.position_keys_after(None, len(rows))):
+                db.session.execute(db.text('UPDATE task SET position = :key WHERE id = :id'),
+                                   {'key': key + 'V' * 30, 'id': row.id})
+            db.session.commit()
+            user_id = rows[0].user_id
+        flask_backend.response_cache.clear()
+        before = self._json(self._get('/api/tasks?order=position', headers=headers))['tasks']
+        flask_backend.request_position_rebalance(user_id)
+        flask_backend.request_position_rebalance(user_id + 1)
+        # Si el reparto de un usuario falla, sigue pendiente y los demás se procesan
+        real_rebalance = flask_backend.rebalance_task_positions
+
+        def rebalance_task_positions(session, uid):
+            if uid == user_id:
+                raise RuntimeError('boom')
+            return real_rebalance(session, uid)
+
+        with app.app_context(), self.assertLogs(app.logger, 'ERROR'), \
+                mock.patch.object(flask_backend, 'rebalance_task_positions', rebalance_task_positions):
+            flask_backend.rebalance_long_positions()
+        self.assertEqual(list(flask_backend._positions_to_rebalance), [user_id])
+        with app.app_context():
+            flask_backend.rebalance_long_positions()
+        self.assertEqual(flask_backend._positions_to_rebalance, {})
+        after = self._json(self._get('/api/tasks?order=position', headers=headers))['tasks']
+        self.assertEqual([t['id'] for t in after], [t['id'] for t in before])
+        self.assertEqual([t['updated_at'] for t in after], [t['updated_at'] for t in before])
+        self.assertTrue(all(len(t['position']) <= 4 for t in after))
+
+    # Tests de la caché de tokens
+    def test_cached_token_skips_user_lookup(self):
+        """Test: Un token ya verificado no vuelve a consultar el usuario"""
+        if self.integration:
+            self.skipTest('Requiere acceso al motor de la BD')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+
+        # La carga del principal es la única consulta que lee user.username
+        first = self.count_queries(lambda: self._get('/api/tasks', headers=headers), 'user.username')
+        second = self.count_queries(lambda: self._get('/api/tasks', headers=headers), 'user.username')
+        self.assertEqual(first, 1)
+        self.assertEqual(second, 0)
+
+    def test_deleted_user_invalidates_cached_token(self):
+        """Test: Eliminar el usuario invalida su token en caché"""
+        if self.integration:
+            self.skipTest('Requiere acceso a la BD')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        self.assertEqual(self._get('/api/tasks', headers=headers).status_code, 200)
+
+        with app.app_context():
+            db.session.delete(User.query.filter_by(username='testuser').first())
+            db.session.commit()
+
+        response = self._get('/api/tasks', headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_tasks_relationship_excludes_deleted(self):
+        """Test: user.tasks no incluye las bajas lógicas y borrar el usuario arrastra todas sus filas"""
+        if self.integration:
+            self.skipTest('Requiere acceso a la BD')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        keep = self.create_task(token, title='Viva')
+        gone = self.create_task(token, title='Borrada')
+        self.assertEqual(self._delete(f"/api/tasks/{gone['id']}", headers=headers).status_code, 200)
+
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            self.assertEqual([task.id for task in user.tasks], [keep['id']])
+            self.assertEqual(sorted(task.id for task in user.all_tasks), [keep['id'], gone['id']])
+            db.session.delete(user)
+            db.session.commit()
+            self.assertEqual(db.session.execute(db.text('SELECT COUNT(*) FROM task')).scalar(), 0)
+
+    def test_refresh_token_rotation_and_revocation(self):
+        """Test: El refresh token rota, su reutilización revoca la sesión y logout revoca el access token"""
+        self.register_user()
+        login = self._json(self.login_user())
+        self.assertEqual(login['expires_in'], app.config['ACCESS_TOKEN_TTL'])
+        # Un refresh token no sirve como access token
+        self.assertEqual(self._get('/api/tasks', headers=self.get_auth_headers(login['refresh_token'])).status_code, 401)
+
+        response = self._post('/api/token/refresh', data=json.dumps({'refresh_token': login['refresh_token']}))
+        self.assertEqual(response.status_code, 200)
+        rotated = self._json(response)
+        self.assertNotEqual(rotated['refresh_token'], login['refresh_token'])
+        headers = self.get_auth_headers(rotated['token'])
+        self.assertEqual(self._get('/api/tasks', headers=headers).status_code, 200)
+
+        if not self.integration:
+            # Un token válido no consulta la tabla de revocados
+            self.assertEqual(self.count_queries(
+                lambda: self._get('/api/tasks', headers=headers), 'revoked_token'), 0)
+
+        # Reutilizar el refresh token ya rotado revoca toda la familia
+        reused = self._post('/api/token/refresh', data=json.dumps({'refresh_token': login['refresh_token']}))
+        self.assertEqual(reused.status_code, 401)
+        response = self._get('/api/tasks', headers=headers)
+        self.assertEqual((response.status_code, self._json(response)['message']), (401, 'Token has been revoked'))
+        self.assertEqual(self._post('/api/token/refresh', data=json.dumps(
+            {'refresh_token': rotated['refresh_token']})).status_code, 401)
+
+        headers = self.get_auth_headers(self._json(self.login_user())['token'])
+        self.assertEqual(self._post('/api/logout', headers=headers).status_code, 200)
+        self.assertEqual(self._get('/api/tasks', headers=headers).status_code, 401)
+        if self.integration:
+            return
+
+        # Otro worker ve la revocación al sincronizar su filtro con la BD
+        jti = jwt.decode(headers['Authorization'][7:], options={'verify_signature': False})['jti']
+        other = TokenRevocations(1 << 16, 5, 900)
+        with app.app_context():
+            self.assertTrue(other.might_be_revoked(jti))
+        self.assertFalse(other.might_be_revoked(jwt.decode(
+            login['token'], options={'verify_signature': False})['jti'][::-1]))
+
+    # Tests de operaciones en lote
+    def test_batch_operations_partial_failure(self):
+        """Test: El lote aplica las operaciones válidas y reporta cada resultado"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        keep = self.create_task(token, title='Original')
+        remove = self.create_task(token, title='Eliminar')
+
+        response = self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'create', 'title': 'Nueva 1', 'priority': 'high'},
+            {'op': 'create', 'title': 'Nueva 2'},
+            {'op': 'create'},
+            {'op': 'update', 'id': keep['id'], 'title': 'Editada', 'completed': True},
+            {'op': 'update', 'id': 999, 'title': 'No existe'},
+            {'op': 'delete', 'id': remove['id']},
+            {'op': 'archive', 'id': keep['id']},
+        ]}), headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        results = self._json(response)['results']
+        self.assertEqual([r['status'] for r in results], [201, 201, 400, 200, 404, 200, 400])
+        self.assertEqual([r['index'] for r in results], list(range(7)))
+        self.assertEqual(results[0]['task']['priority'], 'high')
+        self.assertEqual(results[3]['task']['title'], 'Editada')
+        self.assertTrue(results[3]['task']['completed'])
+
+        tasks = self._json(self._get('/api/tasks', headers=headers))['tasks']
+        self.assertEqual(sorted(t['title'] for t in tasks), ['Editada', 'Nueva 1', 'Nueva 2'])
+
+    def test_batch_create_ids_with_same_timestamp(self):
+        """Test: Los ids del lote no dependen de updated_at aunque otra tarea comparta el instante"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        existing = self.create_task(token, title='Existente')
+        now = datetime.utcnow()
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return now
+
+        with app.app_context():
+            db.session.execute(db.text('UPDATE task SET updated_at = :now WHERE id = :id'),
+                               {'now': now, 'id': existing['id']})
+            db.session.commit()
+        with mock.patch.object(flask_backend, 'datetime', FrozenDatetime):
+            response = self._post('/api/tasks/batch', data=json.dumps({'operations': [
+                {'op': 'create', 'title': f'Nueva {i}'} for i in range(3)]}), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        created = [r['task'] for r in self._json(response)['results']]
+        self.assertNotIn(existing['id'], [t['id'] for t in created])
+        titles = {t['id']: t['title'] for t in self._json(self._get('/api/tasks', headers=headers))['tasks']}
+        self.assertEqual([titles[t['id']] for t in created], ['Nueva 0', 'Nueva 1', 'Nueva 2'])
+
+    def test_batch_rejects_invalid_values_per_item(self):
+        """Test: Valores de tipo incorrecto fallan con 400 en su operación sin deshacer las válidas"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        task = self.create_task(token, title='Original')
+
+        response = self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'create', 'title': 'ok'},
+            {'op': 'update', 'id': task['id'], 'title': None},
+            {'op': 'create', 'title': 'Mala', 'priority': {'a': 1}},
+            {'op': 'create', 'title': 'Mala', 'completed': 'false'},
+            {'op': 'create', 'title': ['x']},
+            {'op': 'update', 'id': task['id'], 'description': 5},
+            {'op': 'update', 'id': task['id'], 'priority': 'urgent'},
+            {'op': 'update', 'id': task['id'], 'completed': True},
+        ]}), headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        results = self._json(response)['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 400, 400, 400, 400, 400, 200])
+        self.assertEqual(results[1]['message'], 'Title must be a non-empty string')
+        tasks = self._json(self._get('/api/tasks', headers=headers))['tasks']
+        self.assertEqual(sorted((t['title'], t['completed'], t['priority']) for t in tasks),
+                         [('Original', True, 'medium'), ('ok', False, 'medium')])
+
+        # Las rutas de una sola tarea validan igual
+        self.assertEqual(self._put(f"/api/tasks/{task['id']}", data=json.dumps({'title': None}),
+                                   headers=headers).status_code, 400)
+        self.assertEqual(self._post('/api/tasks', data=json.dumps({'title': 'X', 'priority': 'urgent'}),
+                                    headers=headers).status_code, 400)
+
+    def test_batch_cannot_touch_other_users_tasks(self):
+        """Test: El lote no puede modificar tareas de otro usuario"""
+        token1 = self.get_token("user1", "user1@test.com")
+        token2 = self.get_token("user2", "user2@test.com")
+        task = self.create_task(token1, title='De user1')
+
+        response = self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'update', 'id': task['id'], 'title': 'Robada'},
+            {'op': 'delete', 'id': task['id']},
+        ]}), headers=self.get_auth_headers(token2))
+
+        self.assertEqual([r['status'] for r in self._json(response)['results']], [404, 404])
+        tasks = self._json(self._get('/api/tasks', headers=self.get_auth_headers(token1)))['tasks']
+        self.assertEqual(tasks[0]['title'], 'De user1')
+
+    def test_batch_requires_operations(self):
+        """Test: El lote sin operaciones devuelve 400"""
+        token = self.get_token()
+        response = self._post('/api/tasks/batch', data=json.dumps({'operations': []}),
+                              headers=self.get_auth_headers(token))
+        self.assertEqual(response.status_code, 400)
+
+    # Tests del hash de contraseñas
+    def test_login_rehashes_outdated_password_hash(self):
+        """Test: El login re-hashea con el nuevo factor de trabajo"""
+        if self.integration:
+            self.skipTest('Requiere acceso a la BD')
+        self.register_user()
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=0, queue_size=4)
+        with mock.patch.object(flask_backend, 'password_hasher', hasher):
+            response = self.login_user()
+        self.assertEqual(response.status_code, 200)
+
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            self.assertTrue(user.password_hash.startswith('pbkdf2:sha256:1000$'))
+        # La contraseña sigue siendo válida con el hash nuevo
+        self.assertEqual(self.login_user().status_code, 200)
+
+    def test_login_rejected_when_hashing_overloaded(self):
+        """Test: Con la cola de hashing llena se responde 503 con Retry-After"""
+        if self.integration:
+            self.skipTest('Requiere sustituir el pool de hashing')
+        self.register_user()
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=0, queue_size=1)
+        hasher._slots.acquire()  # El único hueco ya está ocupado
+        with mock.patch.object(flask_backend, 'password_hasher', hasher):
+            response = self.login_user()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+        # Con el valor por defecto y tantos logins simultáneos como hilos tiene un
+        # worker de gunicorn, los que no caben en la cola reciben 503 al momento
+        threads = int(os.getenv('GUNICORN_THREADS', 8))
+        queue_size = app.config['PASSWORD_HASH_QUEUE_SIZE']
+        self.assertLess(queue_size, threads)
+        release = threading.Event()
+        statuses = []
+
+        def slow_check(pwhash, password):
+            release.wait(10)
+            return True
+
+        def login():
+            statuses.append(self.app.post('/api/login', data=json.dumps(
+                {'username': 'testuser', 'password': 'testpass123'}), content_type='application/json').status_code)
+
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=0, queue_size=queue_size)
+        with mock.patch.object(flask_backend, 'password_hasher', hasher), \
+                mock.patch.object(flask_backend, 'check_password_hash', slow_check):
+            workers = [threading.Thread(target=login) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            deadline = time.monotonic() + 10
+            while len(statuses) < threads - queue_size and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(sorted(statuses), [200] * queue_size + [503] * (threads - queue_size))
+
+        # queue_size=0 no limita la cola
+        with mock.patch.object(flask_backend, 'password_hasher',
+                               PasswordHasher('pbkdf2:sha256:1000', workers=0, queue_size=0)):
+            self.assertEqual(self.login_user().status_code, 200)
+
+    # Tests de ETag y sincronización delta
+    def test_get_tasks_etag_not_modified(self):
+        """Test: If-None-Match devuelve 304 hasta que cambia la colección"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        self.create_task(token, title='Tarea')
+
+        response = self._get('/api/tasks', headers=headers)
+        etag = response.headers['ETag']
+        cached = self._get('/api/tasks', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(cached.data if not self.integration else cached.content), 0)
+
+        # Otros parámetros producen otra representación
+        other = self._get('/api/tasks?limit=1', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(other.status_code, 200)
+
+        self.create_task(token, title='Otra')
+        changed = self._get('/api/tasks', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_responses_compressed_by_accept_encoding(self):
+        """Test: Las respuestas grandes se comprimen según Accept-Encoding y las pequeñas no"""
+        if self.integration:
+            return
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        for i in range(30):
+            self.create_task(token, title=f'Tarea {i}', description='x' * 50)
+
+        plain = self._get('/api/tasks', headers=headers)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+
+        compressed = self._get('/api/tasks', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.data), len(plain.data))
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        if flask_backend.brotli is not None:
+            response = self._get('/api/tasks', headers=dict(headers, **{'Accept-Encoding': 'gzip, br'}))
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+            self.assertEqual(flask_backend.brotli.decompress(response.data), plain.data)
+
+        # ETag débil al comprimir; sigue validando con If-None-Match
+        etag = compressed.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        cached = self._get('/api/tasks', headers=dict(headers, **{'Accept-Encoding': 'gzip',
+                                                                  'If-None-Match': etag}))
+        self.assertEqual(cached.status_code, 304)
+
+        # Por debajo del umbral se envía sin comprimir
+        small = self._get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', small.headers)
+
+        # La exportación en streaming se comprime por trozos
+        export = self._get('/api/tasks/export', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(export.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(export.data).decode().splitlines()), 30)
+
+    def test_response_cache_hits_and_invalidation(self):
+        """Test: GET /api/tasks se sirve desde la caché hasta que el usuario escribe"""
+        if self.integration:
+            self.skipTest('Requiere acceso a la caché')
+        token, other = self.get_token(), self.get_token('other', 'other@test.com')
+        headers = self.get_auth_headers(token)
+        task = self.create_task(token, title='Original')
+        self.create_task(other, title='Ajena')
+        self._get('/api/tasks', headers=self.get_auth_headers(other))
+        before = dict(response_cache.counters)
+
+        first = self._get('/api/tasks', headers=headers)
+        self.assertEqual(self.count_queries(lambda: self._get('/api/tasks', headers=headers), 'FROM task'), 0)
+        self.assertEqual(self._get('/api/tasks', headers=headers).data, first.data)
+        self.assertEqual(response_cache.counters['miss'] - before.get('miss', 0), 1)
+        self.assertEqual(response_cache.counters['hit'] - before.get('hit', 0), 2)
+
+        # Escribir invalida solo las entradas de ese usuario
+        self._put(f"/api/tasks/{task['id']}", data=json.dumps({'title': 'Cambiada'}), headers=headers)
+        self.assertEqual(response_cache.counters['invalidation'] - before.get('invalidation', 0), 1)
+        self.assertEqual(self._json(self._get('/api/tasks', headers=headers))['tasks'][0]['title'], 'Cambiada')
+        stats = self._json(self._get('/api/health/cache'))
+        self.assertEqual((stats['backend'], stats['entries']), ('SQLiteResponseStore', 2))
+
+        with mock.patch.object(response_cache.store, 'max_entries', 1):
+            response_cache.evict()
+        self.assertEqual(response_cache.counters['eviction'] - before.get('eviction', 0), 1)
+        self.assertEqual(self._json(self._get('/api/health/cache'))['entries'], 1)
+
+    def read_events(self, chunks, until):
+        """Método auxiliar: lee eventos SSE (event, id, data) hasta recibir `until`"""
+        events, buffer = [], b''
+        for chunk in chunks:
+            buffer += chunk
+            while b'\n\n' in buffer:
+                block, buffer = buffer.split(b'\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in block.decode().splitlines()
+                              if not line.startswith(':'))
+                if 'event' in fields:
+                    events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+                    if fields['event'] == until:
+                        return events
+        return events
+
+    def test_task_stream_pushes_changes_and_resumes(self):
+        """Test: /api/tasks/stream reanuda desde Last-Event-ID y empuja los commits nuevos"""
+        if self.integration:
+            self.skipTest('Requiere el cliente de pruebas en streaming')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        first = self.create_task(token, title='Antes')
+        self.assertEqual(self._get('/api/tasks/stream', headers={**headers, 'Last-Event-ID': 'x'}).status_code, 400)
+
+        with mock.patch.dict(app.config, {'STREAM_HEARTBEAT': 0.05, 'STREAM_MAX_DURATION': 10}):
+            response = self.app.get('/api/tasks/stream', headers={**headers, 'Last-Event-ID': '0'}, buffered=False)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            chunks = iter(response.response)
+            self.assertTrue(next(chunks).startswith(b'retry: '))
+            event, event_id, data = self.read_events(chunks, 'changes')[-1]
+            self.assertEqual(([t['id'] for t in data['tasks']], event_id), ([first['id']], str(data['revision'])))
+
+            # Un commit de otra petición despierta el stream sin esperar al keep-alive
+            writer = threading.Timer(0.2, lambda: app.test_client().delete(
+                f"/api/tasks/{first['id']}", headers=headers))
+            writer.start()
+            event, event_id, data = self.read_events(chunks, 'changes')[-1]
+            writer.join()
+            self.assertEqual((data['deleted'], data['tasks']), ([first['id']], []))
+            response.close()
+            self.assertEqual(flask_backend.change_bus.connections(), 0)
+
+            # Reanudar desde una revisión ya purgada pide resincronizar
+            with app.app_context():
+                db.session.execute(db.update(User).values(purged_revision=int(event_id)))
+                db.session.commit()
+            response = self.app.get('/api/tasks/stream?since=1', headers=headers, buffered=False)
+            event, _, data = self.read_events(response.response, 'expired')[-1]
+            self.assertEqual(event, 'expired')
+            response.close()
+
+    def test_change_bus_fans_out_across_processes(self):
+        """Test: Un aviso publicado en otro proceso llega por el socket Unix de este"""
+        with tempfile.TemporaryDirectory() as directory:
+            received, arrived = [], threading.Event()
+            backend = flask_backend.SocketBusBackend(directory)
+            backend.start(lambda changes: (received.append(changes), arrived.set()))
+            subprocess.run([sys.executable, '-c', 'import sys, flask_backend; '
+                            'flask_backend.SocketBusBackend(sys.argv[1]).publish({7: 3})', directory],
+                           check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            self.assertTrue(arrived.wait(5))
+            self.assertEqual(received, [{7: 3}])
+
+    def test_task_changes_since_revision(self):
+        """Test: /api/tasks/changes devuelve solo altas, cambios y bajas posteriores"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        first = self.create_task(token, title='Primera')
+        second = self.create_task(token, title='Segunda')
+
+        data = self._json(self._get('/api/tasks/changes?since=0', headers=headers))
+        self.assertEqual([t['id'] for t in data['tasks']], [first['id'], second['id']])
+        self.assertEqual(data['deleted'], [])
+        since = data['revision']
+
+        self._put(f"/api/tasks/{first['id']}", data=json.dumps({'completed': True}), headers=headers)
+        self._delete(f"/api/tasks/{second['id']}", headers=headers)
+        data = self._json(self._get(f'/api/tasks/changes?since={since}', headers=headers))
+        self.assertEqual([t['id'] for t in data['tasks']], [first['id']])
+        self.assertTrue(data['tasks'][0]['completed'])
+        self.assertEqual(data['deleted'], [second['id']])
+        self.assertFalse(data['has_more'])
+
+        data = self._json(self._get(f"/api/tasks/changes?since={data['revision']}", headers=headers))
+        self.assertEqual((data['tasks'], data['deleted']), ([], []))
+
+    def test_task_changes_pagination_keeps_batches_together(self):
+        """Test: Los cambios se paginan sin partir una revisión"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        self.create_task(token, title='Sola')
+        self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'create', 'title': f'Lote {i}'} for i in range(3)]}), headers=headers)
+
+        data = self._json(self._get('/api/tasks/changes?since=0&limit=2', headers=headers))
+        self.assertFalse(data['has_more'])
+        self.assertEqual(len(data['tasks']), 4)
+
+        data = self._json(self._get('/api/tasks/changes?since=0&limit=1', headers=headers))
+        self.assertTrue(data['has_more'])
+        self.assertEqual([t['title'] for t in data['tasks']], ['Sola'])
+
+        data = self._json(self._get(f"/api/tasks/changes?since={data['revision']}&limit=1",
+                                    headers=headers))
+        self.assertFalse(data['has_more'])
+        self.assertEqual(len(data['tasks']), 3)
+
+    def test_soft_deleted_tasks_hidden_then_purged(self):
+        """Test: Las bajas quedan como tombstones ocultos hasta que la purga las elimina"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        kept = self.create_task(token, title='Comprar pan')
+        gone = self.create_task(token, title='Comprar leche')
+        since = self._json(self._get('/api/tasks/changes?since=0', headers=headers))['revision']
+        self._delete(f"/api/tasks/{gone['id']}", headers=headers)
+
+        self.assertEqual([t['id'] for t in self._json(self._get('/api/tasks', headers=headers))['tasks']],
+                         [kept['id']])
+        self.assertEqual([t['id'] for t in self._json(
+            self._get('/api/tasks/search?q=comprar', headers=headers))['tasks']], [kept['id']])
+        self.assertEqual(self._json(self._get('/api/tasks/stats', headers=headers))['total'], 1)
+        self.assertEqual(self._put(f"/api/tasks/{gone['id']}", data=json.dumps({'title': 'X'}),
+                                   headers=headers).status_code, 404)
+        self.assertEqual(self._delete(f"/api/tasks/{gone['id']}", headers=headers).status_code, 404)
+        self.assertEqual(self._json(self._get(f'/api/tasks/changes?since={since}',
+                                              headers=headers))['deleted'], [gone['id']])
+        if self.integration:
+            return
+
+        with app.app_context():
+            self.assertIsNone(db.session.get(Task, gone['id']))
+            tombstone = db.session.get(Task, gone['id'], execution_options={'include_deleted': True})
+            self.assertIsNotNone(tombstone.deleted_at)
+            db.session.close()
+            # La retención aún no ha vencido
+            self.assertEqual(flask_backend.purge_deleted_tasks(datetime.utcnow() - timedelta(days=1), 1), 0)
+            self.assertEqual(flask_backend.purge_deleted_tasks(datetime.utcnow() + timedelta(seconds=1), 1), 1)
+            self.assertEqual(Task.query.execution_options(include_deleted=True).count(), 1)
+            db.session.execute(db.text("INSERT INTO task_fts (task_fts) VALUES ('integrity-check')"))
+            db.session.commit()
+            self.assertIn('free_pages', flask_backend.compact_database())
+
+        # Un cliente que no vio la baja purgada debe resincronizar desde cero
+        self.assertEqual(self._get(f'/api/tasks/changes?since={since}', headers=headers).status_code, 410)
+        self.assertEqual(self._get('/api/tasks/changes?since=0', headers=headers).status_code, 200)
+
+    def test_write_behind_coalesces_updates(self):
+        """Test: Con write-behind los PUT seguidos se agrupan en un UPDATE y se leen al momento"""
+        if self.integration:
+            self.skipTest('Buffer en memoria del proceso')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        task = self.create_task(token, title='Original')
+        revision = self._json(self._get('/api/tasks', headers=headers))['revision']
+
+        buffer = flask_backend.WriteBehindBuffer(60)
+        with mock.patch.object(flask_backend, 'write_behind', buffer):
+            def toggle():
+                for i in range(5):
+                    response = self._put(f"/api/tasks/{task['id']}", headers=headers,
+                                         data=json.dumps({'completed': i % 2 == 0, 'title': f'Título {i}'}))
+                    self.assertEqual(response.status_code, 200)
+                self.assertEqual(self._json(response)['task']['title'], 'Título 4')
+
+            # Solo el primer PUT lee la fila; ninguno escribe
+            self.assertEqual(self.count_queries(toggle, 'UPDATE task '), 0)
+            self.assertEqual(self.count_queries(toggle, 'FROM task'), 0)
+            self.assertEqual(self._put('/api/tasks/9999', data=json.dumps({'title': 'X'}),
+                                       headers=headers).status_code, 404)
+
+            # Otra petición del mismo usuario vuelca antes lo pendiente
+            data = self._json(self._get('/api/tasks', headers=headers))
+            self.assertEqual((data['tasks'][0]['title'], data['tasks'][0]['completed']), ('Título 4', True))
+            self.assertEqual(data['revision'], revision + 1)
+            self.assertEqual(self._json(self._get('/api/tasks/stats', headers=headers))['completed'], 1)
+            self.assertEqual(buffer.flush(), 0)
+
+    def test_write_behind_validates_and_drops_failing_writes(self):
+        """Test: Write-behind rechaza valores inválidos y una escritura que falla no bloquea al usuario"""
+        if self.integration:
+            self.skipTest('Buffer en memoria del proceso')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        failing, kept = self.create_task(token, title='Falla'), self.create_task(token, title='Sigue')
+
+        buffer = flask_backend.WriteBehindBuffer(60, max_attempts=2)
+        real_update = flask_backend.bulk_update_tasks
+
+        def bulk_update_tasks(session, user_id, changes, revision):
+            if failing['id'] in changes:
+                raise RuntimeError('boom')
+            return real_update(session, user_id, changes, revision)
+
+        with mock.patch.object(flask_backend, 'write_behind', buffer), \
+                mock.patch.object(flask_backend, 'bulk_update_tasks', bulk_update_tasks):
+            for body in ({'title': None}, {'completed': 'false'}, {'priority': {'a': 1}}):
+                self.assertEqual(self._put(f"/api/tasks/{kept['id']}", data=json.dumps(body),
+                                           headers=headers).status_code, 400, body)
+            self.assertEqual(buffer.flush(), 0)
+
+            for task in (failing, kept):
+                self._put(f"/api/tasks/{task['id']}", data=json.dumps({'completed': True}), headers=headers)
+            # El primer fallo se reintenta; el resto del usuario se escribe
+            response = self._get('/api/tasks', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({t['id']: t['completed'] for t in self._json(response)['tasks']},
+                             {failing['id']: False, kept['id']: True})
+            # Al agotar los intentos se descarta y se registra como JSON
+            with self.assertLogs(app.logger, 'ERROR') as logs:
+                self.assertEqual(self._get('/api/tasks', headers=headers).status_code, 200)
+            dropped = json.loads(logs.records[0].getMessage().split(': ', 1)[1])
+            self.assertEqual((dropped['task_id'], dropped['attempts'], dropped['error']),
+                             (failing['id'], 2, 'RuntimeError: boom'))
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(self._get('/api/tasks', headers=headers).status_code, 200)
+
+    # Tests de serialización
+    def test_serializer_output_matches_jsonify(self):
+        """Test: El serializador genera los mismos bytes que jsonify con ambos backends"""
+        if self.integration:
+            self.skipTest('Compara con jsonify en proceso')
+        token = self.get_token()
+        self.create_task(token, title='Título ñ \x7f 😀', description='línea\nnueva')
+        backends = ['stdlib'] + (['orjson'] if orjson is not None else [])
+
+        for backend in backends:
+            with mock.patch.object(flask_backend, 'serializer', JsonSerializer(backend)):
+                response = self._get('/api/tasks', headers=self.get_auth_headers(token))
+            with app.test_request_context():
+                expected = jsonify(json.loads(response.data)).data
+            self.assertEqual(response.data, expected, backend)
+
+    # Tests de exportación e importación
+    def _body(self, response):
+        return response.content if self.integration else response.data
+
+    def test_export_tasks_ndjson(self):
+        """Test: La exportación devuelve una tarea por línea, opcionalmente en gzip"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        titles = [self.create_task(token, title=f'Tarea {i}')['title'] for i in range(3)]
+
+        response = self._get('/api/tasks/export', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        lines = self._body(response).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], titles)
+
+        response = self._get('/api/tasks/export?compress=gzip', headers=headers)
+        body = self._body(response)
+        if not self.integration:
+            body = gzip.decompress(body)
+        self.assertEqual(body.decode().splitlines(), lines)
+
+    def test_import_tasks_ndjson(self):
+        """Test: La importación crea las tareas válidas por bloques y reporta errores"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        lines = [json.dumps({'title': f'Importada {i}', 'completed': i == 0}) for i in range(5)]
+        lines.insert(2, '{no es json')
+        lines.insert(4, json.dumps({'description': 'Sin título'}))
+        body = gzip.compress('\n'.join(lines).encode())
+
+        with mock.patch.dict(app.config, {'IMPORT_CHUNK_SIZE': 2}):
+            response = self._post('/api/tasks/import', data=body,
+                                  headers=dict(headers, **{'Content-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 200)
+        data = self._json(response)
+        self.assertEqual((data['imported'], data['failed']), (5, 2))
+        self.assertEqual([e['line'] for e in data['errors']], [3, 5])
+
+        tasks = self._json(self._get('/api/tasks', headers=headers))['tasks']
+        self.assertEqual(len(tasks), 5)
+        self.assertTrue(tasks[0]['completed'])
+
+    def test_import_does_not_hold_write_lock_while_reading(self):
+        """Test: Mientras se lee el cuerpo de la importación otra conexión puede escribir"""
+        if self.integration or flask_backend.engine.dialect.name != 'sqlite':
+            self.skipTest('Solo aplica a SQLite en proceso')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        body = '\n'.join(json.dumps({'title': f'Importada {i}'}) for i in range(4)).encode()
+        path = flask_backend.engine.url.database
+        lock_free = []
+
+        class SlowUpload(io.BytesIO):
+            # Al empezar cada línea comprueba si el bloqueo de escritura está libre
+            def readinto(self, buffer):
+                position = self.tell()
+                if position < len(body) and (position == 0 or body[position - 1:position] == b'\n'):
+                    conn = sqlite3.connect(path, timeout=0, isolation_level=None)
+                    try:
+                        conn.execute('BEGIN IMMEDIATE')
+                        conn.execute('ROLLBACK')
+                        lock_free.append(True)
+                    except sqlite3.OperationalError:
+                        lock_free.append(False)
+                    finally:
+                        conn.close()
+                return super().readinto(buffer)
+
+        with mock.patch.dict(app.config, {'IMPORT_CHUNK_SIZE': 2}):
+            response = self.app.post('/api/tasks/import', input_stream=SlowUpload(body),
+                                     headers=dict(headers, **{'Content-Length': str(len(body))}),
+                                     content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._json(response)['imported'], 4)
+        self.assertTrue(lock_free)
+        self.assertTrue(all(lock_free), lock_free)
+
+    def test_import_rejects_invalid_rows_and_oversized_input(self):
+        """Test: Filas con tipos incorrectos o demasiado largas se reportan y el cuerpo tiene tope"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        lines = [json.dumps({'title': 'Buena'}),
+                 json.dumps({'title': 'Texto', 'completed': 'false'}),
+                 json.dumps({'title': 'Dict', 'priority': {'a': 1}}),
+                 json.dumps({'title': 'Lista', 'description': ['x']}),
+                 json.dumps({'title': 'x' * 500})]
+        lines += ['{no es json'] * 150
+
+        with mock.patch.dict(app.config, {'IMPORT_MAX_LINE_BYTES': 100}):
+            response = self._post('/api/tasks/import', data='\n'.join(lines), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        data = self._json(response)
+        self.assertEqual((data['imported'], data['failed']), (1, 154))
+        self.assertEqual(len(data['errors']), 100)
+        self.assertEqual([e['line'] for e in data['errors'][:4]], [2, 3, 4, 5])
+        self.assertEqual(data['errors'][3]['message'], 'Line exceeds 100 bytes')
+        tasks = self._json(self._get('/api/tasks', headers=headers))['tasks']
+        self.assertEqual([(t['title'], t['completed']) for t in tasks], [('Buena', False)])
+
+        # Un gzip que se descomprime por encima del tope se corta con 413
+        body = gzip.compress(b'\n'.join([json.dumps({'title': 'T'}).encode()] * 1000))
+        with mock.patch.dict(app.config, {'IMPORT_MAX_BYTES': 4096}):
+            response = self._post('/api/tasks/import', data=body,
+                                  headers=dict(headers, **{'Content-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 413)
+
+    # Tests del perfil de SQLite
+    def test_sqlite_connection_profile(self):
+        """Test: Las conexiones SQLite usan WAL y busy_timeout"""
+        if self.integration or flask_backend.engine.dialect.name != 'sqlite':
+            self.skipTest('Solo aplica a SQLite en proceso')
+        with app.app_context():
+            with db.engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+                self.assertEqual(conn.exec_driver_sql('PRAGMA busy_timeout').scalar(),
+                                 app.config['SQLITE_BUSY_TIMEOUT'])
+                self.assertEqual(conn.exec_driver_sql('PRAGMA synchronous').scalar(), 1)  # NORMAL
+
+    def test_migrations_upgrade_legacy_database(self):
+        """Test: Las migraciones llevan una BD antigua a la versión actual una sola vez"""
+        if self.integration:
+            self.skipTest('Solo aplica a SQLite en proceso')
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        # Esquema de la primera versión, creado entonces con create_all
+        with sqlite3.connect(path) as conn:
+            conn.executescript("""
+                CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE,
+                    email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(120) NOT NULL, created_at DATETIME);
+                CREATE TABLE task (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT,
+                    completed BOOLEAN NOT NULL, priority VARCHAR(20) NOT NULL, created_at DATETIME,
+                    updated_at DATETIME, user_id INTEGER NOT NULL REFERENCES user (id));
+                INSERT INTO user VALUES (1, 'old', 'old@test.com', 'x', '2024-01-01 00:00:00');
+                INSERT INTO task VALUES (1, 'Tarea antigua', 'importante', 1, 'high',
+                    '2024-01-01 00:00:00', '2024-01-02 00:00:00', 1);
+            """)
+        legacy = create_engine(f'sqlite:///{path}')
+        flask_backend.configure_sqlite_engine(legacy)
+        try:
+            with self.assertRaises(flask_backend.SchemaOutdated):
+                flask_backend.check_schema_version(legacy)
+            self.assertEqual(flask_backend.migrate_database(legacy), [1, 2, 3, 4, 5])
+            self.assertEqual(flask_backend.migrate_database(legacy), [])
+            self.assertEqual(flask_backend.check_schema_version(legacy), flask_backend.SCHEMA_VERSION)
+            with legacy.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql(
+                    'SELECT revision, completed_at, deleted_at, position FROM task').one(),
+                    (0, '2024-01-02 00:00:00', None, 'a0'))
+                self.assertEqual(conn.exec_driver_sql('SELECT count FROM task_stat').scalar(), 1)
+                self.assertEqual(conn.exec_driver_sql(
+                    "SELECT rowid FROM task_fts WHERE task_fts MATCH 'importante'").scalar(), 1)
+                self.assertIn('deleted_at IS NULL', conn.exec_driver_sql(
+                    "SELECT sql FROM sqlite_master WHERE name = 'ix_task_user_updated'").scalar())
+                # Cada tabla de los modelos la crea alguna migración
+                tables = {row[0] for row in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'")}
+                self.assertLessEqual(set(db.metadata.tables), tables)
+        finally:
+            legacy.dispose()
+            os.unlink(path)
+
+    def test_cold_worker_boot_within_budget(self):
+        """Test: Importar la app y comprobar el esquema cabe en WORKER_BOOT_BUDGET sin ejecutar DDL"""
+        if self.integration:
+            self.skipTest('Solo en proceso')
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'boot.db')}")
+            script = ('import time; start = time.perf_counter(); import flask_backend; '
+                      'flask_backend.check_schema_version(); print(time.perf_counter() - start)')
+            result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True)
+            self.assertNotEqual(result.returncode, 0)  # BD sin migrar: el arranque falla
+            self.assertIn('SchemaOutdated', result.stderr)
+
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-upgrade'],
+                           env=env, check=True, capture_output=True)
+            result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True,
+                                    text=True, check=True)
+            self.assertLess(float(result.stdout), app.config['WORKER_BOOT_BUDGET'])
+
+    def test_access_log_buffer_flushed_when_idle(self):
+        """Test: El access log con buffer se escribe aunque el worker no reciba más peticiones"""
+        config = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'))
+        target = logging.handlers.BufferingHandler(100)
+        handler = config['BufferedAccessHandler'](100, 0.05, target)
+        try:
+            handler.handle(logging.makeLogRecord({'msg': 'GET /api/tasks 200', 'levelno': logging.INFO}))
+            self.assertEqual(target.buffer, [])  # Aún dentro del intervalo
+            deadline = time.monotonic() + 2
+            while not target.buffer and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual([r.getMessage() for r in target.buffer], ['GET /api/tasks 200'])
+        finally:
+            handler.close()
+
+    def test_concurrent_writes_do_not_lock(self):
+        """Test: Escrituras concurrentes esperan el bloqueo en lugar de fallar"""
+        if self.integration:
+            self.skipTest('Usa varios clientes de prueba en hilos')
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        task = self.create_task(token)
+        statuses = []
+
+        def worker():
+            client = app.test_client()
+            for i in range(5):
+                response = client.put(f"/api/tasks/{task['id']}", data=json.dumps({'title': f'T{i}'}),
+                                      headers=headers, content_type='application/json')
+                statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [200] * 30)
+
+    # Tests del pool de conexiones
+    def test_db_health_reports_pool_metrics(self):
+        """Test: /api/health/db expone el estado del pool"""
+        response = self._get('/api/health/db')
+        self.assertEqual(response.status_code, 200)
+        pool = self._json(response)['pool']
+        for key in ('checkouts', 'checked_out', 'wait_seconds_total', 'overflow_events', 'timeouts'):
+            self.assertIn(key, pool)
+        self.assertGreaterEqual(pool['checkouts'], 1)
+
+    def test_instrumented_pool_counts_overflow(self):
+        """Test: El pool instrumentado cuenta desbordes y timeouts"""
+        if self.integration:
+            self.skipTest('Usa un motor propio')
+        fd, path = tempfile.mkstemp(suffix='.db')
+        test_engine = create_engine(f'sqlite:///{path}', poolclass=InstrumentedQueuePool,
+                                    pool_size=1, max_overflow=1, pool_timeout=0.1)
+        pool_stats.reset()
+        try:
+            first = test_engine.connect()
+            second = test_engine.connect()
+            with self.assertRaises(Exception):
+                test_engine.connect()
+            second.close()
+            first.close()
+            stats = pool_stats.snapshot(test_engine.pool)
+            self.assertEqual((stats['checkouts'], stats['overflow_events'], stats['timeouts']), (2, 1, 1))
+        finally:
+            test_engine.dispose()
+            os.close(fd)
+            os.unlink(path)
+
+    # Tests de métricas
+    def test_metrics_endpoint_reports_routes_and_queries(self):
+        """Test: /api/metrics expone latencias por ruta y consultas SQL"""
+        token = self.get_token()
+        self._get('/api/tasks', headers=self.get_auth_headers(token))
+
+        response = self._get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = self._body(response).decode()
+        self.assertIn('taskflow_http_requests_total{method="GET",route="/api/tasks",status="200"}', body)
+        self.assertIn('taskflow_http_request_duration_seconds_bucket{method="GET",route="/api/tasks",le="+Inf"}', body)
+        self.assertIn('taskflow_db_queries_total{route="/api/tasks"}', body)
+        self.assertIn('taskflow_password_hash_seconds_count{operation="check_password_hash"}', body)
+        self.assertIn('taskflow_jwt_decode_seconds_count', body)
+
+    def test_metrics_aggregate_across_processes(self):
+        """Test: Las métricas de varios procesos se suman y los procesos terminados se archivan"""
+        if self.integration:
+            self.skipTest('Usa un registro propio')
+        total = 'taskflow_http_requests_total{method="GET",route="/api/tasks",status="200"}'
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Metrics(directory, flush_interval=0)
+            registry.inc('taskflow_http_requests_total', method='GET', route='/api/tasks', status='200')
+            registry.inc('taskflow_http_requests_in_flight')
+            labels = [['method', 'GET'], ['route', '/api/tasks'], ['status', '200']]
+            # Otro proceso vivo, uno inexistente y uno anterior que tuvo nuestro mismo pid
+            for pid in (os.getppid(), 2 ** 22 + 1, os.getpid()):
+                with open(os.path.join(directory, f'metrics-{pid}-1.json'), 'w') as f:
+                    json.dump([['taskflow_http_requests_total', labels, 2],
+                               ['taskflow_http_requests_in_flight', [], 1]], f)
+
+            body = registry.render()
+            self.assertIn(f'{total} 7', body)
+            self.assertIn('taskflow_http_requests_in_flight 2', body)
+            self.assertEqual(sorted(os.path.basename(p) for p in glob.glob(os.path.join(directory, '*.json'))),
+                             sorted(['metrics-archive.json', f'metrics-{os.getppid()}-1.json',
+                                     registry._filename]))
+
+            # Al salir, lo contado tras el último volcado pasa al archivo y los totales no bajan
+            registry.inc('taskflow_http_requests_total', method='GET', route='/api/tasks', status='200')
+            registry.close()
+            body = Metrics(directory, flush_interval=0).render()
+            self.assertIn(f'{total} 8', body)
+            self.assertIn('taskflow_http_requests_in_flight 1', body)
+
+    # Tests de estadísticas
+    def test_request_profiles_written_per_route(self):
+        """Test: Las peticiones muestreadas o lentas dejan un perfil en el directorio de su ruta"""
+        if self.integration:
+            self.skipTest('Requiere acceso al directorio de perfiles')
+        token = self.get_token()
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(app.config, {'PROFILE_DIR': directory, 'PROFILE_SAMPLE_RATE': 1.0}):
+                self._get('/api/tasks', headers=self.get_auth_headers(token))
+            [name] = os.listdir(os.path.join(directory, 'GET_api_tasks'))
+            stats = pstats.Stats(os.path.join(directory, 'GET_api_tasks', name))
+            self.assertTrue(any(func[2] == 'get_tasks' for func in stats.stats))
+
+            # Solo las que superan el umbral; el login espera al hash de la contraseña
+            with mock.patch.dict(app.config, {'PROFILE_DIR': directory, 'PROFILE_SLOW_THRESHOLD': 0.05,
+                                              'PROFILE_SAMPLE_INTERVAL': 0.001}):
+                self._get('/api/health')
+                self.login_user()
+            self.assertEqual(sorted(os.listdir(directory)), ['GET_api_tasks', 'POST_api_login'])
+            [name] = os.listdir(os.path.join(directory, 'POST_api_login'))
+            with open(os.path.join(directory, 'POST_api_login', name)) as f:
+                self.assertIn('login (flask_backend.py:', f.read())
+
+    def test_slow_queries_and_repeated_statements_reported(self):
+        """Test: Se registran las consultas lentas y las repetidas por una carga perezosa en bucle"""
+        if self.integration:
+            self.skipTest('Requiere acceso a los logs de la app')
+        for i in range(3):
+            self.create_task(self.get_token(f'user{i}', f'user{i}@test.com'), title='Tarea')
+
+        with mock.patch.dict(app.config, {'SLOW_QUERY_THRESHOLD': 1e-9}), \
+                self.assertLogs('taskflow.slow_queries') as slow:
+            self._get('/api/tasks', headers=self.get_auth_headers(self._json(self.login_user('user0'))['token']))
+        record = json.loads(slow.records[-1].getMessage())
+        self.assertEqual(record['route'], 'GET /api/tasks')
+        self.assertGreater(record['duration_ms'], 0)
+        self.assertTrue(all(isinstance(kind, str) for kind in record['parameters']))
+
+        with mock.patch.dict(app.config, {'N_PLUS_ONE_THRESHOLD': 3}), \
+                app.test_request_context('/api/tasks'), self.assertLogs(app.logger, 'WARNING') as logs:
+            app.preprocess_request()
+            titles = [task.title for user in User.query.all() for task in user.tasks]
+            app.do_teardown_request()
+        self.assertEqual(titles, ['Tarea'] * 3)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('3 similar statements', logs.output[0])
+        self.assertIn('FROM task', logs.output[0])
+
+    def test_task_stats_maintained_incrementally(self):
+        """Test: /api/tasks/stats refleja cada mutación y coincide con una reconstrucción completa"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        low = self.create_task(token, title='A', priority='low')
+        high = self.create_task(token, title='B', priority='high')
+        self.create_task(token, title='C', priority='high')
+        self._put(f"/api/tasks/{low['id']}", data=json.dumps({'completed': True}), headers=headers)
+        self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'update', 'id': high['id'], 'completed': True, 'priority': 'low'},
+            {'op': 'create', 'title': 'D', 'completed': True},
+            {'op': 'update', 'id': low['id'], 'title': 'A2'},
+        ]}), headers=headers)
+        self._delete(f"/api/tasks/{low['id']}", headers=headers)
+
+        stats = self._json(self._get('/api/tasks/stats?days=7', headers=headers))
+        self.assertEqual((stats['total'], stats['completed'], stats['pending']), (3, 2, 1))
+        self.assertEqual(stats['completion_rate'], 0.6667)
+        self.assertEqual(stats['by_priority'], {
+            'high': {'completed': 0, 'pending': 1, 'total': 1},
+            'low': {'completed': 1, 'pending': 0, 'total': 1},
+            'medium': {'completed': 1, 'pending': 0, 'total': 1}})
+        self.assertEqual(len(stats['daily']), 7)
+        # La serie diaria cuenta eventos: la tarea eliminada sigue creada y completada
+        self.assertEqual(stats['daily'][-1]['created'], 4)
+        self.assertEqual(stats['daily'][-1]['completed'], 3)
+        self.assertEqual(self._get('/api/tasks/stats?days=0', headers=headers).status_code, 400)
+
+        if not self.integration:
+            # No se recorre la tabla task y la reconstrucción produce lo mismo
+            queries = self.count_queries(lambda: self._get('/api/tasks/stats', headers=headers), 'FROM task ')
+            self.assertEqual(queries, 0)
+            with app.app_context():
+                flask_backend.rebuild_task_stats(db.session)
+                db.session.commit()
+            self.assertEqual(self._json(self._get('/api/tasks/stats?days=7', headers=headers)), stats)
+
+    # Tests de búsqueda de texto completo
+    def test_search_tasks_ranked_and_highlighted(self):
+        """Test: La búsqueda ordena por relevancia, resalta coincidencias y solo ve tareas del usuario"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+        in_description = self.create_task(token, title='Llamar', description='Comprar <b>leche</b> hoy')
+        in_title = self.create_task(token, title='Comprar leche', description='En el mercado')
+        self.create_task(token, title='Informe', description='Trimestral')
+        other = self.get_token('other', 'other@test.com')
+        self.create_task(other, title='Leche ajena')
+
+        data = self._json(self._get('/api/tasks/search?q=leche', headers=headers))
+        self.assertEqual([t['id'] for t in data['tasks']], [in_title['id'], in_description['id']])
+        self.assertEqual(data['tasks'][0]['highlight']['title'], 'Comprar <mark>leche</mark>')
+        self.assertEqual(data['tasks'][1]['highlight']['description'],
+                         'Comprar &lt;b&gt;<mark>leche</mark>&lt;/b&gt; hoy')
+
+        page = self._json(self._get('/api/tasks/search?q=compr*&limit=1', headers=headers))
+        self.assertEqual((len(page['tasks']), page['next_offset']), (1, 1))
+        page = self._json(self._get('/api/tasks/search?q=compr*&limit=1&offset=1', headers=headers))
+        self.assertIsNone(page['next_offset'])
+
+        # Actualizaciones y eliminaciones (también en lote) mantienen el índice
+        self._put(f"/api/tasks/{in_title['id']}", data=json.dumps({'title': 'Comprar pan'}), headers=headers)
+        self._post('/api/tasks/batch', data=json.dumps({'operations': [
+            {'op': 'delete', 'id': in_description['id']}]}), headers=headers)
+        self.assertEqual(self._json(self._get('/api/tasks/search?q=leche', headers=headers))['tasks'], [])
+        self.assertEqual(len(self._json(self._get('/api/tasks/search?q=pan', headers=headers))['tasks']), 1)
+
+        self.assertEqual(self._get('/api/tasks/search?q=%20*', headers=headers).status_code, 400)
+
+        # Fuera de la ventana de relevancia las coincidencias siguen apareciendo, detrás
+        notes = [self.create_task(token, title=f'Nota {i}')['id'] for i in range(5)]
+        seen, offset = [], 0
+        with mock.patch.dict(app.config, {'SEARCH_RANK_WINDOW': 2}):
+            while offset is not None:
+                page = self._json(self._get(f'/api/tasks/search?q=nota&limit=2&offset={offset}',
+                                            headers=headers))
+                seen.extend(t['id'] for t in page['tasks'])
+                offset = page['next_offset']
+        self.assertEqual(sorted(seen[:2]), notes[3:])
+        self.assertEqual(seen[2:], notes[2::-1])
+
+    # Tests del límite de intentos
+    def test_login_rate_limited_before_db_and_hash(self):
+        """Test: Superado el límite por username, login responde 429 sin consultar la BD ni calcular hashes"""
+        if self.integration:
+            self.skipTest('Configura el limitador del proceso de pruebas')
+        self.register_user()
+        with tempfile.TemporaryDirectory() as directory:
+            limiter = RateLimiter(SQLiteBucketStore(os.path.join(directory, 'ratelimit.db')),
+                                  {'ip': (100, 1.0), 'username': (2, 2 / 60)})
+            app.config['RATELIMIT_ENABLED'] = True
+            with mock.patch.object(flask_backend, 'rate_limiter', limiter):
+                self.assertEqual(self.login_user().status_code, 200)
+                self.assertEqual(self.login_user('TestUser', 'wrong').status_code, 401)
+                responses = []
+                with mock.patch.object(flask_backend.password_hasher, 'verify') as verify:
+                    queries = self.count_queries(lambda: responses.append(self.login_user()), 'FROM user')
+                    verify.assert_not_called()
+                self.assertEqual(queries, 0)
+                self.assertEqual(responses[0].status_code, 429)
+                self.assertEqual(responses[0].headers['Retry-After'], '30')
+
+                # Otro username desde la misma IP sigue pudiendo entrar
+                self.assertEqual(self.login_user('otheruser').status_code, 401)
+
+    def test_rate_limit_buckets_shared_and_refilled(self):
+        """Test: Los buckets SQLite se comparten entre conexiones y se recargan con el tiempo"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratelimit.db')
+            first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+            self.assertEqual(first.take('k', 2, 1.0, 100.0), (True, 1.0))
+            self.assertEqual(second.take('k', 2, 1.0, 100.0), (True, 0.0))
+            self.assertEqual(first.take('k', 2, 1.0, 100.5), (False, 0.5))
+            self.assertEqual(second.take('k', 2, 1.0, 101.0), (True, 0.0))
+            # Nunca supera la capacidad por mucho tiempo que pase
+            self.assertEqual(first.take('k', 2, 1.0, 1000.0), (True, 1.0))
+            limiter = RateLimiter(first, {'ip': (1, 0.1)})
+            self.assertEqual(limiter.hit('login', 'ip', '1.2.3.4'), 0)
+            self.assertEqual(limiter.hit('login', 'ip', '1.2.3.4'), 10)
+
+    # Tests del modo ASGI
+    async def asgi_request(self, method, path, data=None, headers=None):
+        """Método auxiliar: llama a asgi.app y devuelve (status, headers, body)"""
+        path, _, query = path.partition('?')
+        headers = dict(headers or {}, **({'Content-Type': 'application/json'} if data is not None else {}))
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'root_path': '',
+            'query_string': query.encode(), 'http_version': '1.1', 'scheme': 'http',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        body = json.dumps(data).encode() if data is not None else b''
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi.app(scope, receive, send)
+        start = messages[0]
+        return (start['status'], {k.decode(): v.decode() for k, v in start['headers']},
+                b''.join(m.get('body', b'') for m in messages[1:]))
+
+    def run_asgi(self, scenario):
+        """Método auxiliar: ejecuta el escenario async y cierra el pool del motor async"""
+        if asgi is None or self.integration:
+            self.skipTest('Requiere aiosqlite y acceso directo a la app')
+
+        async def run():
+            try:
+                await scenario()
+            finally:
+                await asgi.async_engine.dispose()
+        asyncio.run(run())
+
+    def test_asgi_task_endpoints_match_flask(self):
+        """Test: Los handlers async devuelven el mismo JSON y ETag que Flask"""
+        async def scenario():
+            status, _, _ = await self.asgi_request('POST', '/api/register', {
+                'username': 'testuser', 'email': 'test@test.com', 'password': 'testpass123'})
+            self.assertEqual(status, 201)
+            status, _, body = await self.asgi_request('POST', '/api/login', {
+                'username': 'testuser', 'password': 'testpass123'})
+            headers = self.get_auth_headers(json.loads(body)['token'])
+
+            status, _, body = await self.asgi_request('POST', '/api/tasks', {'title': 'Async'}, headers)
+            self.assertEqual(status, 201)
+            task = json.loads(body)['task']
+            status, _, body = await self.asgi_request(
+                'PUT', f"/api/tasks/{task['id']}", {'completed': True}, headers)
+            self.assertEqual(status, 200)
+            self.assertTrue(json.loads(body)['task']['completed'])
+            status, _, _ = await self.asgi_request('PUT', '/api/tasks/9999', {'title': 'X'}, headers)
+            self.assertEqual(status, 404)
+            status, _, body = await self.asgi_request('GET', '/api/tasks/search?q=async', headers=headers)
+            self.assertEqual(body, self.app.get('/api/tasks/search?q=async', headers=headers).data)
+            self.assertEqual(len(json.loads(body)['tasks']), 1)
+            status, _, body = await self.asgi_request('GET', '/api/tasks/stats', headers=headers)
+            self.assertEqual(body, self.app.get('/api/tasks/stats', headers=headers).data)
+
+            status, response_headers, body = await self.asgi_request('GET', '/api/tasks?limit=5', headers=headers)
+            expected = self.app.get('/api/tasks?limit=5', headers=headers)
+            self.assertEqual(status, 200)
+            self.assertEqual(body, expected.data)
+            self.assertEqual(response_headers['etag'], expected.headers['ETag'])
+            status, _, body = await self.asgi_request(
+                'GET', '/api/tasks?limit=5', headers=dict(headers, **{'If-None-Match': expected.headers['ETag']}))
+            self.assertEqual((status, body), (304, b''))
+            with mock.patch.dict(app.config, COMPRESSION_MIN_SIZE=0):
+                status, response_headers, body = await self.asgi_request(
+                    'GET', '/api/tasks?limit=5', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+            self.assertEqual(response_headers['content-encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(body), expected.data)
+            self.assertEqual(response_headers['etag'], 'W/' + expected.headers['ETag'])
+
+            status, _, _ = await self.asgi_request('DELETE', f"/api/tasks/{task['id']}", headers=headers)
+            self.assertEqual(status, 200)
+            status, _, body = await self.asgi_request('GET', '/api/tasks/changes?since=0', headers=headers)
+            self.assertEqual(body, self.app.get('/api/tasks/changes?since=0', headers=headers).data)
+            self.assertEqual(json.loads(body)['deleted'], [task['id']])
+
+            status, _, body = await self.asgi_request('GET', '/api/tasks', headers={'Authorization': 'Bearer x'})
+            self.assertEqual((status, json.loads(body)['message']), (401, 'Token is invalid'))
+
+            # Un cuerpo que no es un objeto da 400 en los dos modos
+            status, _, body = await self.asgi_request('POST', '/api/tasks', [1], headers)
+            self.assertEqual((status, json.loads(body)['message']), (400, 'Title is required'))
+            for raw in ('null', '[1]'):
+                response = self.app.post('/api/tasks', data=raw, headers=headers, content_type='application/json')
+                self.assertEqual((response.status_code, self._json(response)['message']),
+                                 (400, 'Title is required'), raw)
+        self.run_asgi(scenario)
+
+    def test_asgi_revocation_sync_off_event_loop(self):
+        """Test: La carga del filtro de revocaciones no consulta la BD desde el event loop"""
+        headers = self.get_auth_headers(self.get_token())
+        sync = revocations.sync
+        threads = []
+
+        def record_sync():
+            threads.append(threading.get_ident())
+            return sync()
+
+        async def scenario():
+            revocations.clear()
+            with mock.patch.object(revocations, 'sync', record_sync):
+                status, _, _ = await self.asgi_request('GET', '/api/tasks', headers=headers)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(threads), 1)
+            self.assertNotEqual(threads[0], threading.get_ident())
+        self.run_asgi(scenario)
+
+    def test_asgi_concurrent_writes_and_bridged_routes(self):
+        """Test: Escrituras async concurrentes y rutas Flask servidas por el puente WSGI"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+
+        async def scenario():
+            results = await asyncio.gather(*[
+                self.asgi_request('POST', '/api/tasks', {'title': f'Tarea {i}'}, headers) for i in range(20)])
+            self.assertEqual([status for status, _, _ in results], [201] * 20)
+            status, _, body = await self.asgi_request('POST', '/api/tasks/batch', {'operations': [
+                {'op': 'create', 'title': 'Lote'}, {'op': 'delete', 'id': 9999}]}, headers)
+            self.assertEqual([r['status'] for r in json.loads(body)['results']], [201, 404])
+
+            status, response_headers, body = await self.asgi_request('GET', '/api/tasks/export', headers=headers)
+            self.assertEqual(status, 200)
+            self.assertEqual(response_headers['content-type'], 'application/x-ndjson')
+            self.assertEqual(len(body.decode().splitlines()), 21)
+            status, _, _ = await self.asgi_request('GET', '/api/health')
+            self.assertEqual(status, 200)
+        self.run_asgi(scenario)
+        self.assertEqual(len(self._json(self._get('/api/tasks', headers=headers))['tasks']), 21)
+
+    def test_asgi_task_stream_until_disconnect(self):
+        """Test: El stream async recibe los commits y termina cuando el cliente se desconecta"""
+        token = self.get_token()
+        headers = self.get_auth_headers(token)
+
+        async def scenario():
+            disconnect = asyncio.Event()
+            messages = []
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': '/api/tasks/stream', 'root_path': '',
+                'query_string': b'', 'http_version': '1.1', 'scheme': 'http',
+                'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+                'headers': [(b'authorization', headers['Authorization'].encode())],
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if b'event: changes' in message.get('body', b''):
+                    disconnect.set()
+
+            stream = asyncio.ensure_future(asgi.app(scope, receive, send))
+            while flask_backend.change_bus.connections() == 0:
+                await asyncio.sleep(0.01)
+            status, _, _ = await self.asgi_request('POST', '/api/tasks', {'title': 'Empujada'}, headers)
+            self.assertEqual(status, 201)
+            await asyncio.wait_for(stream, 5)
+
+            self.assertEqual(messages[0]['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream'), messages[0]['headers'])
+            events = self.read_events([m.get('body', b'') for m in messages[1:]], 'changes')
+            self.assertEqual([e[0] for e in events], ['ready', 'changes'])
+            self.assertEqual(events[1][2]['tasks'][0]['title'], 'Empujada')
+            self.assertEqual(flask_backend.change_bus.connections(), 0)
+        self.run_asgi(scenario)
+
+    # Harness de benchmark
+    def test_benchmark_harness_inprocess(self):
+        """Test: benchmark.py siembra datos, ejecuta una mezcla en proceso y reporta percentiles"""
+        if self.integration:
+            self.skipTest('in-process only')
+        import benchmark
+        # La app ya usa la BD de las pruebas: sin force no se borra
+        with self.assertRaises(SystemExit):
+            benchmark.seed(2, 5)
+        self.assertEqual(benchmark.seed(2, 5, force=True), {'users': 2, 'tasks_per_user': 5})
+        with app.app_context():
+            self.assertEqual(Task.query.count(), 10)
+        report = benchmark.run(benchmark.InProcessTarget(), users=2, concurrency=2, requests=40,
+                               mix='list=2,stats=1,create=1,update=1,delete=1')
+        self.assertEqual(report['overall']['requests'], 40)
+        self.assertEqual(report['overall']['errors'] + report['overall']['client_errors'], 0)
+        self.assertLessEqual(report['overall']['latency_ms']['p50'], report['overall']['latency_ms']['p99'])
+        self.assertLessEqual(set(report['operations']), {'list', 'stats', 'create', 'update', 'delete'})
+        self.assertIn('overall', benchmark.compare(report, report))
+
 if __name__ == '__main__':
     unittest.main()